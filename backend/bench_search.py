@@ -0,0 +1,134 @@
+import os
+import sys
+import time
+import random
+import tempfile
+import argparse
+
+# Synthetic data only: always benchmark against a throwaway SQLite file
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import insert
+
+from database import engine, Base, SessionLocal
+from models.database_models import AadhaarProfile, GSTCompany
+from models.schemas import AadhaarResponse, CompanyResponse
+from services.serialization import projection
+from services.id_allocator import render_aadhaar, render_pan, gstin_check_char, AADHAAR_SPACE, PAN_SPACE
+from services.search_index import registry_search, RegistrySearch
+from migrate_db import run_migrations
+
+FIRST_NAMES = [
+    "Aarav", "Aditi", "Akash", "Amit", "Ananya", "Anil", "Anjali", "Arjun", "Deepak", "Divya", "Gaurav", "Harish",
+    "Isha", "Kavita", "Kiran", "Lakshmi", "Manoj", "Meera", "Neha", "Nikhil", "Pooja", "Pradeep", "Priya", "Rahul",
+    "Rajesh", "Ramesh", "Ravi", "Rohit", "Sandeep", "Sanjay", "Shreya", "Sneha", "Sunil", "Suresh", "Tanvi", "Vikram",
+]
+MIDDLE_NAMES = ["", "Kumar", "Devi", "Prasad", "Lal", "Chandra", "Nath", "Rani", "Mohan", "Bai"]
+LAST_NAMES = [
+    "Agarwal", "Bhat", "Chopra", "Das", "Desai", "Gupta", "Iyer", "Jain", "Joshi", "Kapoor", "Khan", "Kulkarni",
+    "Menon", "Mishra", "Nair", "Patel", "Pillai", "Rao", "Reddy", "Saxena", "Shah", "Sharma", "Singh", "Verma",
+]
+COMPANY_WORDS = ["Shree", "Om", "Sai", "Ganesh", "Bharat", "Sunrise", "Lotus", "Metro", "Royal", "Global", "Apex", "Vijay"]
+COMPANY_KINDS = ["Traders", "Textiles", "Enterprises", "Logistics", "Pharma", "Steels", "Foods", "Motors", "Infotech"]
+COMPANY_SUFFIXES = ["Pvt Ltd", "LLP", "Ltd", "& Co", "Industries"]
+
+def person_name(rng):
+    return " ".join(part for part in (rng.choice(FIRST_NAMES), rng.choice(MIDDLE_NAMES), rng.choice(LAST_NAMES)) if part)
+
+def company_name(rng):
+    return f"{rng.choice(COMPANY_WORDS)} {rng.choice(LAST_NAMES)} {rng.choice(COMPANY_KINDS)} {rng.choice(COMPANY_SUFFIXES)}"
+
+def seed(rows, companies, chunk=50000):
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(7)
+    aadhaar_stride = AADHAAR_SPACE // rows
+    pan_stride = PAN_SPACE // companies
+    with engine.begin() as conn:
+        for start in range(0, rows, chunk):
+            conn.execute(insert(AadhaarProfile), [
+                {
+                    "id": f"a{i:08d}", "name": person_name(rng), "aadhaar_number": render_aadhaar(i * aadhaar_stride),
+                    "phone": f"9{i:09d}", "kyc_status": "VERIFIED", "blacklist_flag": False,
+                }
+                for i in range(start, min(start + chunk, rows))
+            ])
+        for start in range(0, companies, chunk):
+            batch = []
+            for i in range(start, min(start + chunk, companies)):
+                first14 = f"{27 + i % 10}{render_pan(i * pan_stride)}1Z"
+                batch.append({
+                    "id": f"c{i:08d}", "gst_number": first14 + gstin_check_char(first14), "type": "PVT_LTD",
+                    "company_name": company_name(rng), "state_code": str(27 + i % 10),
+                })
+            conn.execute(insert(GSTCompany), batch)
+
+def measure(run, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = run()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000, result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the admin registry search before/after the trigram/FTS5 index")
+    parser.add_argument("--rows", type=int, default=2000000, help="Aadhaar profiles to seed")
+    parser.add_argument("--companies", type=int, default=500000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    seed(args.rows, args.companies)
+    print(f"Seeded {args.rows} Aadhaar profiles and {args.companies} companies in {time.perf_counter() - started:.1f}s")
+
+    # Built after seeding, so this also times the backfill of an existing registry
+    started = time.perf_counter()
+    run_migrations(engine)
+    registry_search.detect()
+    print(f"Search index ({registry_search.backend}) built in {time.perf_counter() - started:.1f}s")
+    assert registry_search.backend == "fts5", "this SQLite build has no FTS5 trigram tokenizer"
+
+    # Ranking looks at SEARCH_CANDIDATE_LIMIT matches; the unbounded variant checks the full match set
+    unbounded = RegistrySearch(candidate_limit=0)
+    unbounded.detect()
+
+    db = SessionLocal()
+    aadhaar_columns = projection(AadhaarProfile, AadhaarResponse)
+    company_columns = projection(GSTCompany, CompanyResponse)
+    sample_aadhaar = render_aadhaar(1234 * (AADHAAR_SPACE // args.rows))
+    sample_gstin = db.query(GSTCompany.gst_number).filter(GSTCompany.id == "c00000042").scalar()
+
+    # (label, old ILIKE scan, new search); the old endpoints had no number search at all
+    cases = [
+        ("aadhaar name 'sharma'", AadhaarProfile.name, "sharma", registry_search.aadhaar, aadhaar_columns),
+        ("aadhaar name 'esh prasad pi' (3 words)", AadhaarProfile.name, "esh Prasad Pi", registry_search.aadhaar, aadhaar_columns),
+        ("aadhaar name 'zzq' (no match)", AadhaarProfile.name, "zzq", registry_search.aadhaar, aadhaar_columns),
+        ("company name 'lotus iyer'", GSTCompany.company_name, "Lotus Iyer Pharma", registry_search.companies, company_columns),
+        ("company name 'xyzzy' (no match)", GSTCompany.company_name, "xyzzy", registry_search.companies, company_columns),
+    ]
+
+    print(f"Median of {args.repeat} runs, LIMIT 20 as served by /identity/search/aadhaar and /business/search/company")
+    print(f"{'query':<40}{'ILIKE scan ms':>16}{'indexed ms':>14}")
+    for label, name_column, text, search, columns in cases:
+        scan_ms, _ = measure(lambda: db.query(*columns).filter(name_column.ilike(f"%{text}%")).limit(20).all(), args.repeat)
+        indexed_ms, _ = measure(lambda: search(db, text, columns).page(limit=20), args.repeat)
+        # Unbounded and unlimited, the index must return exactly what the scan does
+        expected = {row.id for row in db.query(*columns).filter(name_column.ilike(f"%{text}%"))}
+        assert {row.id for row in getattr(unbounded, search.__name__)(db, text, columns).all()} == expected, f"{label} returned different rows"
+        print(f"{label:<40}{scan_ms:>16.1f}{indexed_ms:>14.1f}")
+
+    for label, text, search, columns, number_column in [
+        ("aadhaar number prefix (8 digits)", sample_aadhaar[:8], registry_search.aadhaar, aadhaar_columns, AadhaarProfile.aadhaar_number),
+        ("gstin prefix (7 chars)", sample_gstin[:7], registry_search.companies, company_columns, GSTCompany.gst_number),
+    ]:
+        indexed_ms, (rows, _) = measure(lambda: search(db, text, columns).page(limit=20), args.repeat)
+        assert rows and all(row[number_column.key].startswith(text) for row in rows)
+        print(f"{label:<40}{'-':>16}{indexed_ms:>14.1f}")
+
+    # New registrations reach the index through the insert trigger
+    db.add(AadhaarProfile(id="a-new", name="Zyanya Quetzal", aadhaar_number=render_aadhaar(AADHAAR_SPACE - 1), phone="8000000000"))
+    db.commit()
+    assert [row.id for row in registry_search.aadhaar(db, "quetz", aadhaar_columns).all()] == ["a-new"]
+    db.close()
@@ -0,0 +1,88 @@
+import os
+import sys
+import time
+import tempfile
+import argparse
+from datetime import datetime, timedelta
+from typing import List
+
+# Synthetic data only: always benchmark against a throwaway SQLite file
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi import FastAPI, Depends
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from database import engine, Base, get_db
+from models.database_models import GSTCompany, Invoice
+from models.schemas import InvoiceResponse
+from services.serialization import FastJSONResponse, projection, projected_response
+from services.compression import CompressionMiddleware
+
+def seed(rows):
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(GSTCompany), [{"id": "c1", "gst_number": "27AAAAA0000A1Z5", "company_name": "Bench Traders", "type": "PVT_LTD", "state_code": "27"}])
+        start = datetime(2025, 1, 1)
+        conn.execute(insert(Invoice), [
+            {
+                "id": f"inv-{i:06d}", "company_id": "c1", "invoice_number": f"INV{i:06d}", "buyer_gstin": "29BBBBB1111B1Z5",
+                "date": start + timedelta(hours=i), "total_taxable": 1000 + i * 0.25, "total_tax": 180 + i * 0.045,
+                "grand_total": 1180 + i * 0.295, "status": ("PAID", "UNPAID", "DEFAULTED")[i % 3], "delay_days": i % 45,
+                "created_at": start + timedelta(hours=i),
+            }
+            for i in range(rows)
+        ])
+
+def build_apps():
+    # The invoice list as it was (ORM rows re-validated through response_model, stdlib json) ...
+    baseline = FastAPI()
+
+    @baseline.get("/invoices", response_model=List[InvoiceResponse])
+    def baseline_invoices(db: Session = Depends(get_db)):
+        return db.query(Invoice).order_by(Invoice.created_at.desc()).all()
+
+    # ... and as it is now (column projection, orjson, negotiated compression)
+    fast = FastAPI(default_response_class=FastJSONResponse)
+    fast.add_middleware(CompressionMiddleware)
+
+    @fast.get("/invoices", response_model=List[InvoiceResponse])
+    def fast_invoices(db: Session = Depends(get_db)):
+        return projected_response(db.query(*projection(Invoice, InvoiceResponse)).order_by(Invoice.created_at.desc()))
+
+    return TestClient(baseline), TestClient(fast)
+
+def measure(client, encoding, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get("/invoices", headers={"Accept-Encoding": encoding})
+        timings.append(time.perf_counter() - started)
+        assert response.status_code == 200
+    timings.sort()
+    # httpx decodes the body transparently; Content-Length is what was actually sent
+    return timings[len(timings) // 2] * 1000, int(response.headers["content-length"]), response
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the invoice list response path before/after orjson + projection + compression")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    seed(args.rows)
+    baseline, fast = build_apps()
+    reference = baseline.get("/invoices").json()
+
+    print(f"GET /invoices with {args.rows} rows, median of {args.repeat} runs (TestClient, in-process)")
+    print(f"{'variant':<42}{'ms':>10}{'bytes on wire':>16}")
+    for label, client, encoding in [
+        ("default JSONResponse + response_model", baseline, "identity"),
+        ("projection + orjson", fast, "identity"),
+        ("projection + orjson + gzip", fast, "gzip"),
+        ("projection + orjson + br", fast, "br"),
+    ]:
+        ms, size, response = measure(client, encoding, args.repeat)
+        assert response.json() == reference, f"{label} returned a different body"
+        print(f"{label:<42}{ms:>10.1f}{size:>16}")
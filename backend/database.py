@@ -1,6 +1,9 @@
 import os
 from sqlalchemy import create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.engine import make_url
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import declarative_base, sessionmaker, Session
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -13,6 +16,12 @@ if not SQLALCHEMY_DATABASE_URL:
     # Use SQLite as a fallback for local testing if the URL is not found
     SQLALCHEMY_DATABASE_URL = "sqlite:///./dummy_verification.db"
     
+# Each worker has a sync and an async pool; together they stay within one worker's connection budget
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "6"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "12"))
+DB_ASYNC_POOL_SIZE = int(os.getenv("DB_ASYNC_POOL_SIZE", "4"))
+DB_ASYNC_MAX_OVERFLOW = int(os.getenv("DB_ASYNC_MAX_OVERFLOW", "8"))
+
 # Check if it's sqlite, in which case we need check_same_thread=False
 # SQLAlchemy needs postgresql or postgresql+psycopg2/asyncpg
 if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
@@ -28,12 +37,39 @@ else:
         SQLALCHEMY_DATABASE_URL,
         pool_pre_ping=True,
         pool_recycle=300,
-        pool_size=10,
-        max_overflow=20
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW
     )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def asyncpg_url(url):
+    """
+    The asyncpg form of a libpq URL, and its connect_args. asyncpg rejects libpq's
+    sslmode query parameter; it takes the same modes (require, verify-full, ...) as ssl.
+    """
+    query = dict(url.query)
+    sslmode = query.pop("sslmode", None)
+    return url.set(drivername="postgresql+asyncpg", query=query), ({"ssl": sslmode} if sslmode else {})
+
+# Async engine over the same database, for the non-blocking request paths
+# (aiosqlite for the SQLite fallback, asyncpg for Postgres)
+_url = make_url(SQLALCHEMY_DATABASE_URL)
+if _url.get_backend_name() == "sqlite":
+    async_engine = create_async_engine(_url.set(drivername="sqlite+aiosqlite"))
+else:
+    _async_url, _async_connect_args = asyncpg_url(_url)
+    async_engine = create_async_engine(
+        _async_url,
+        connect_args=_async_connect_args,
+        pool_pre_ping=True,
+        pool_recycle=300,
+        pool_size=DB_ASYNC_POOL_SIZE,
+        max_overflow=DB_ASYNC_MAX_OVERFLOW
+    )
+
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 def get_db():
@@ -42,3 +78,14 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def dialect_insert(db):
+    """Returns the dialect-specific insert() so callers can use on_conflict_* upserts (db: Session, Engine or Connection)"""
+    bind = db.bind if isinstance(db, Session) else db
+    if bind.dialect.name == "postgresql":
+        return postgresql.insert
+    return sqlite.insert
@@ -0,0 +1,36 @@
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import engine, Base
+from services.invoice_import import InvoiceImporter, INVOICE_IMPORT_CHUNK_SIZE
+
+def import_invoices(path, fmt=None, chunk_size=INVOICE_IMPORT_CHUNK_SIZE, report_path=None):
+    Base.metadata.create_all(bind=engine)
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "ndjson")
+    report_path = report_path or f"{path}.report.ndjson"
+    importer = InvoiceImporter(chunk_size=chunk_size)
+
+    started = time.perf_counter()
+    with open(path, "rb") as stream, open(report_path, "w") as report:
+        summary = importer.run(stream, fmt, actor="ADMIN", report=report)
+    elapsed = time.perf_counter() - started
+
+    print(f"Import {summary['import_id']}: {summary['rows']} rows in {summary['batches']} batches, {elapsed:.1f}s "
+          f"({summary['rows'] / max(elapsed, 1e-9):.0f} rows/s)")
+    print(f"Created {summary['created']} invoices; {summary['duplicates']} duplicates skipped, {summary['failed']} rows failed")
+    print(f"Per-row report written to {report_path}")
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-ingest invoices (e.g. GSTR-1 outward supplies) from CSV or NDJSON")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "ndjson"], default=None, help="Default: from the file extension")
+    parser.add_argument("--chunk-size", type=int, default=INVOICE_IMPORT_CHUNK_SIZE)
+    parser.add_argument("--report", default=None, help="Per-row NDJSON report (default: <path>.report.ndjson)")
+    args = parser.parse_args()
+    summary = import_invoices(args.path, args.format, args.chunk_size, args.report)
+    sys.exit(1 if summary["failed"] else 0)
@@ -3,8 +3,19 @@ from fastapi.middleware.cors import CORSMiddleware
 from routers import identity, business, verification, auth, external, documents, admin, bank
 import os
 from dotenv import load_dotenv
-from database import engine, Base
-from models.database_models import AadhaarProfile, PANProfile, GSTCompany, CompanyOwner, Invoice, GSTReturn, OTPLog, VerificationLog, AuditLog, ExternalConsumer, EscrowAccount
+from database import engine, async_engine, Base
+from services.log_sink import log_sink
+from services.profiling import profile_request, install_query_counter
+from services.serialization import FastJSONResponse
+from services.compression import CompressionMiddleware
+from services.consumer_cache import consumer_cache
+from services.usage_meter import usage_meter
+from services.webhooks import webhook_dispatcher
+from services.evaluation_jobs import job_runner
+from services.search_index import registry_search
+from services.otp_store import otp_store
+from services.otp_delivery import otp_dispatcher
+from models.database_models import AadhaarProfile, PANProfile, GSTCompany, CompanyOwner, Invoice, GSTReturn, OTPLog, OTPHistory, OTPDelivery, VerificationLog, AuditLog, ExternalConsumer, EscrowAccount
 
 load_dotenv()
 
@@ -14,7 +25,8 @@ Base.metadata.create_all(bind=engine)
 app = FastAPI(
     title="Government Identity & Credit Verification API",
     description="Simulation Platform for Identity, GST Compliance, and Credit Scoring",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
 app.add_middleware(
@@ -28,8 +40,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets the admin UI read the keyset cursor of the search endpoints
+    expose_headers=["X-Next-Cursor", "X-Results-Truncated"],
 )
 
+# gzip/brotli for large JSON and NDJSON bodies, negotiated from Accept-Encoding
+app.add_middleware(CompressionMiddleware)
+
+# Per-stage timing for the credit pipeline (see services/profiling.py)
+app.middleware("http")(profile_request)
+install_query_counter(engine)
+install_query_counter(async_engine.sync_engine)
+
 app.include_router(auth.router, prefix="/auth", tags=["Authentication"])
 app.include_router(admin.router, prefix="/admin", tags=["Admin Infrastructure"])
 app.include_router(identity.router, prefix="/identity", tags=["Identity (Aadhaar/PAN)"])
@@ -39,6 +61,33 @@ app.include_router(external.router, prefix="/external", tags=["External API Cons
 app.include_router(documents.router, prefix="/documents", tags=["Document Generation"])
 app.include_router(bank.router, prefix="/bank", tags=["Bank & Escrow"])
 
+@app.on_event("startup")
+def start_background_services():
+    # Finds the trigram / FTS5 name index built by migrate_db.py; creates nothing
+    registry_search.detect()
+    # Replays any log entries spilled by a previous crash, then starts the write-behind flusher
+    log_sink.start()
+    # Loads every active API consumer so gateway auth needs no queries
+    consumer_cache.start()
+    usage_meter.start()
+    webhook_dispatcher.start()
+    # Picks up evaluation jobs left unfinished by the previous process
+    job_runner.start()
+    # Purges expired OTP codes in batches
+    otp_store.start()
+    # Sends OTP messages from a bounded queue with provider failover
+    otp_dispatcher.start()
+
+@app.on_event("shutdown")
+def stop_background_services():
+    otp_dispatcher.stop()
+    otp_store.stop()
+    job_runner.stop()
+    webhook_dispatcher.stop()
+    usage_meter.stop()
+    consumer_cache.stop()
+    log_sink.stop()
+
 @app.get("/")
 def read_root():
     return {"message": "Government Identity & Credit Verification API Running", "status": "VERIFIED"}
@@ -4,6 +4,102 @@ import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from database import engine
+from services.search_index import NAME_INDEXES
+
+def _fts_name_index(base, name, fts):
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(id UNINDEXED, {name}, tokenize='trigram');",
+        # Names are never renamed or deleted through the API; only the insert trigger is on a hot path
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {base} BEGIN INSERT INTO {fts} (id, {name}) VALUES (new.id, new.{name}); END;",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {name} ON {base} BEGIN UPDATE {fts} SET {name} = new.{name} WHERE id = old.id; END;",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {base} BEGIN DELETE FROM {fts} WHERE id = old.id; END;",
+        # Rebuilt on every run: backfills a new index, and repairs one that missed rows written before its triggers existed
+        f"DELETE FROM {fts};",
+        f"INSERT INTO {fts} (id, {name}) SELECT id, {name} FROM {base};",
+    ]
+
+def _drop_invalid(index_names):
+    # A CREATE INDEX CONCURRENTLY that was interrupted leaves an INVALID index behind, which IF NOT EXISTS would keep
+    names = ", ".join(f"'{name}'" for name in index_names)
+    return (
+        "DO $$ DECLARE r record; BEGIN "
+        "FOR r IN SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        f"WHERE NOT i.indisvalid AND c.relname IN ({names}) LOOP EXECUTE 'DROP INDEX ' || quote_ident(r.relname); END LOOP; "
+        "END $$;"
+    )
+
+# (name, dialect or None for any, statements) applied after the original column fixes
+MIGRATIONS = [
+    # Credit scoring aggregates (create_all() does not add indexes to existing tables)
+    ("Credit scoring indexes", None, [
+        "CREATE INDEX IF NOT EXISTS ix_invoice_company_status ON invoice (company_id, status);",
+        "CREATE INDEX IF NOT EXISTS ix_gst_return_company_id ON gst_return (company_id);",
+    ]),
+    # Keyset pagination of the invoice listing and bulk-ingestion de-duplication (cascade to every partition)
+    ("Invoice listing and ingestion indexes", None, [
+        "CREATE INDEX IF NOT EXISTS ix_invoice_date_id ON invoice (date, id);",
+        "CREATE INDEX IF NOT EXISTS ix_invoice_company_date_id ON invoice (company_id, date, id);",
+        "CREATE INDEX IF NOT EXISTS ix_invoice_buyer_date_id ON invoice (buyer_gstin, date, id);",
+        "CREATE INDEX IF NOT EXISTS ix_invoice_company_number ON invoice (company_id, invoice_number);",
+    ]),
+    # Date-range scans for the log exports
+    ("Log export indexes", None, [
+        "CREATE INDEX IF NOT EXISTS ix_audit_logs_timestamp ON audit_logs (timestamp);",
+        "CREATE INDEX IF NOT EXISTS ix_verification_logs_created_at ON verification_logs (created_at);",
+    ]),
+    # OTP code lookups and the expiry sweeper
+    ("OTP indexes", None, [
+        "CREATE INDEX IF NOT EXISTS ix_otp_logs_identity_expiry ON otp_logs (identity_type, identity_value, expiry_time);",
+        "CREATE INDEX IF NOT EXISTS ix_otp_logs_expiry_time ON otp_logs (expiry_time);",
+    ]),
+    # API key revocation, rate limits and webhooks for the HMAC gateway
+    ("ExternalConsumer columns", "postgresql", [
+        "ALTER TABLE external_consumers ADD COLUMN IF NOT EXISTS is_active BOOLEAN NOT NULL DEFAULT TRUE;",
+        "ALTER TABLE external_consumers ADD COLUMN IF NOT EXISTS rate_limit_per_second DOUBLE PRECISION;",
+        "ALTER TABLE external_consumers ADD COLUMN IF NOT EXISTS rate_limit_burst INTEGER;",
+        "ALTER TABLE external_consumers ADD COLUMN IF NOT EXISTS webhook_url VARCHAR;",
+        "ALTER TABLE external_consumers ADD COLUMN IF NOT EXISTS webhook_events VARCHAR;",
+    ]),
+    # Claiming evaluation jobs across processes
+    ("EvaluationJob lease columns", "postgresql", [
+        "ALTER TABLE evaluation_jobs ADD COLUMN IF NOT EXISTS owner VARCHAR;",
+        "ALTER TABLE evaluation_jobs ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMPTZ;",
+    ]),
+    # Admin registry search (services/search_index.py detects which of these are present at startup).
+    # Plain CREATE INDEX rather than CONCURRENTLY: an interrupted run rolls back instead of leaving an
+    # INVALID index, at the cost of holding writes to the table while the index builds
+    ("Search trigram indexes", "postgresql", [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm;",
+        _drop_invalid(["ix_aadhaar_profiles_name_trgm", "ix_gst_companies_company_name_trgm"]),
+        "CREATE INDEX IF NOT EXISTS ix_aadhaar_profiles_name_trgm ON aadhaar_profiles USING gin (name gin_trgm_ops);",
+        "CREATE INDEX IF NOT EXISTS ix_gst_companies_company_name_trgm ON gst_companies USING gin (company_name gin_trgm_ops);",
+    ]),
+    ("Search number prefix indexes", "postgresql", [
+        _drop_invalid(["ix_aadhaar_profiles_number_prefix", "ix_pan_profiles_number_prefix", "ix_gst_companies_number_prefix"]),
+        # The unique indexes use the database collation, which LIKE 'prefix%' cannot use outside the C locale
+        "CREATE INDEX IF NOT EXISTS ix_aadhaar_profiles_number_prefix ON aadhaar_profiles (aadhaar_number varchar_pattern_ops);",
+        "CREATE INDEX IF NOT EXISTS ix_pan_profiles_number_prefix ON pan_profiles (pan_number varchar_pattern_ops);",
+        "CREATE INDEX IF NOT EXISTS ix_gst_companies_number_prefix ON gst_companies (gst_number varchar_pattern_ops);",
+    ]),
+    ("Search FTS5 name indexes", "sqlite", [
+        statement for base, name, fts in NAME_INDEXES for statement in _fts_name_index(base, name, fts)
+    ]),
+]
+
+def run_migrations(bind=engine):
+    """Applies MIGRATIONS for the dialect of bind, each block in its own transaction"""
+    # On Postgres a failed statement aborts the rest of its transaction, so one block
+    # failing must not silently skip the blocks after it
+    for name, dialect, statements in MIGRATIONS:
+        if dialect not in (None, bind.dialect.name):
+            continue
+        try:
+            with bind.begin() as conn:
+                for statement in statements:
+                    conn.exec_driver_sql(statement)
+            print(f"{name} added")
+        except Exception as e:
+            print(f"{name} err: {str(e)}")
 
 def apply_migrations():
     print("Applying missing columns to Supabase PostgreSQL...")
@@ -39,7 +135,11 @@ def apply_migrations():
             print("VerificationLog columns added")
         except Exception as e:
             print(f"VerificationLogs err: {str(e)}")
-            
+
+    # Not in the transaction above: the aadhaar/pan/company blocks predate the current
+    # table names and fail, which on Postgres aborts everything after them
+    run_migrations()
+
     print("Migration complete!")
 
 if __name__ == "__main__":
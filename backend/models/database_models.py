@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Boolean, Float, ForeignKey, DateTime
+from sqlalchemy import Column, String, Integer, BigInteger, Boolean, Float, ForeignKey, DateTime, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -42,6 +42,14 @@ class PANProfile(Base):
     
     aadhaar = relationship("AadhaarProfile")
 
+class IdSequence(Base):
+    __tablename__ = "id_sequences"
+    
+    # Block reservations for generated identity numbers (see services/id_allocator.py)
+    name = Column(String, primary_key=True) # aadhaar, pan
+    next_value = Column(BigInteger, nullable=False) # first ordinal not yet handed to any worker
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
 class GSTCompany(Base):
     __tablename__ = "gst_companies"
     
@@ -70,6 +78,14 @@ class CompanyOwner(Base):
 class Invoice(Base):
     __tablename__ = "invoice"
     __table_args__ = (
+        # Created on the partitioned parent, so Postgres cascades it to every partition
+        Index("ix_invoice_company_status", "company_id", "status"),
+        # Keyset pages of the invoice listing, newest first: unfiltered, by seller, by buyer
+        Index("ix_invoice_date_id", "date", "id"),
+        Index("ix_invoice_company_date_id", "company_id", "date", "id"),
+        Index("ix_invoice_buyer_date_id", "buyer_gstin", "date", "id"),
+        # Duplicate checks of bulk ingestion; not unique, as a unique index would have to include date
+        Index("ix_invoice_company_number", "company_id", "invoice_number"),
         {"postgresql_partition_by": "RANGE (date)"},
     )
     
@@ -89,22 +105,84 @@ class GSTReturn(Base):
     __tablename__ = "gst_return"
     
     id = Column(String, primary_key=True, default=generate_uuid)
-    company_id = Column(String, ForeignKey("gst_companies.id"), nullable=False)
+    company_id = Column(String, ForeignKey("gst_companies.id"), index=True, nullable=False)
     filed_date = Column(DateTime(timezone=True), server_default=func.now())
     compliance_score = Column(Integer, default=0) # 0-100
 
+class CompanyCreditStats(Base):
+    __tablename__ = "company_credit_stats"
+    
+    # Running totals kept in step with invoice/return writes (see services/credit_stats.py)
+    company_id = Column(String, ForeignKey("gst_companies.id"), primary_key=True)
+    invoice_count = Column(Integer, nullable=False, default=0)
+    paid_count = Column(Integer, nullable=False, default=0)
+    unpaid_count = Column(Integer, nullable=False, default=0)
+    defaulted_count = Column(Integer, nullable=False, default=0)
+    delay_days_sum = Column(Integer, nullable=False, default=0)
+    return_count = Column(Integer, nullable=False, default=0)
+    compliance_sum = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class CreditScoreSnapshot(Base):
+    __tablename__ = "credit_score_snapshots"
+    
+    # Latest offline score per (company, owner), written by rescore_portfolio.py
+    company_id = Column(String, ForeignKey("gst_companies.id"), primary_key=True)
+    aadhaar_id = Column(String, ForeignKey("aadhaar_profiles.id"), primary_key=True)
+    pan_id = Column(String, ForeignKey("pan_profiles.id"), nullable=True)
+    owner_score = Column(Integer, nullable=False)
+    company_score = Column(Integer, nullable=False)
+    transaction_score = Column(Integer, nullable=False)
+    credit_score = Column(Integer, nullable=False)
+    risk_category = Column(String, nullable=False)
+    recommendation = Column(String, nullable=False)
+    run_id = Column(String, nullable=False)
+    computed_at = Column(DateTime(timezone=True), server_default=func.now())
+
 class OTPLog(Base):
     __tablename__ = "otp_logs"
+    __table_args__ = (
+        # Latest live code for an identity: equality on both keys, newest expiry first
+        Index("ix_otp_logs_identity_expiry", "identity_type", "identity_value", "expiry_time"),
+    )
     
+    # Active codes for the DATABASE OTP store; expired rows are purged by the sweeper (see services/otp_store.py)
     id = Column(String, primary_key=True, default=generate_uuid)
     identity_type = Column(String, nullable=False) # AADHAAR, PHONE
     identity_value = Column(String, nullable=False)
     otp = Column(String, nullable=False)
-    expiry_time = Column(DateTime(timezone=True), nullable=False)
+    expiry_time = Column(DateTime(timezone=True), nullable=False, index=True)
     attempt_count = Column(Integer, default=0)
     verified = Column(Boolean, default=False)
     is_used = Column(Boolean, default=False)
 
+class OTPHistory(Base):
+    __tablename__ = "otp_history"
+    __table_args__ = (
+        Index("ix_otp_history_identity_event", "identity_type", "identity_value", "event"),
+    )
+    
+    # Append-only record of OTP events; outlives the codes themselves
+    id = Column(String, primary_key=True, default=generate_uuid)
+    identity_type = Column(String, nullable=False) # AADHAAR, PHONE
+    identity_value = Column(String, nullable=False)
+    event = Column(String, nullable=False) # ISSUED, VERIFIED, FAILED, CONSUMED
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class OTPDelivery(Base):
+    __tablename__ = "otp_deliveries"
+    
+    # Final outcome of each queued OTP message, recorded in batches by services/otp_delivery.py
+    id = Column(String, primary_key=True, default=generate_uuid)
+    identity_value = Column(String, index=True, nullable=False)
+    status = Column(String, nullable=False) # SENT, FAILED, EXPIRED
+    provider = Column(String, nullable=True) # provider that accepted the message, or the last one tried
+    provider_message_id = Column(String, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(String, nullable=True)
+    queued_at = Column(DateTime(timezone=True), nullable=False)
+    completed_at = Column(DateTime(timezone=True), nullable=False)
+
 class AuditLog(Base):
     __tablename__ = "audit_logs"
     
@@ -113,7 +191,7 @@ class AuditLog(Base):
     action = Column(String, nullable=False) # e.g., 'CREATE_AADHAAR'
     entity = Column(String, nullable=False) # e.g., 'AadhaarProfile'
     entity_id = Column(String, nullable=False) # ID of the created entity
-    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    timestamp = Column(DateTime(timezone=True), server_default=func.now(), index=True)
 
 class ExternalConsumer(Base):
     __tablename__ = "external_consumers"
@@ -122,7 +200,68 @@ class ExternalConsumer(Base):
     api_key = Column(String, unique=True, index=True, nullable=False)
     webhook_secret = Column(String, nullable=False)
     name = Column(String, nullable=False)
+    is_active = Column(Boolean, default=True, nullable=False)
+    # Token bucket settings for the gateway; NULL falls back to RATE_LIMIT_DEFAULT_*
+    rate_limit_per_second = Column(Float, nullable=True)
+    rate_limit_burst = Column(Integer, nullable=True)
+    # Outbound webhooks; webhook_events is a comma-separated subscription list (NULL = every event)
+    webhook_url = Column(String, nullable=True)
+    webhook_events = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class ExternalConsumerUsage(Base):
+    __tablename__ = "external_consumer_usage"
+
+    # Request counters per consumer, endpoint and hour, flushed in batches by services/usage_meter.py
+    consumer_id = Column(String, ForeignKey("external_consumers.id"), primary_key=True)
+    endpoint = Column(String, primary_key=True)
+    window_start = Column(DateTime(timezone=True), primary_key=True)
+    request_count = Column(Integer, default=0, nullable=False)
+    rejected_count = Column(Integer, default=0, nullable=False)
+
+class WebhookDeadLetter(Base):
+    __tablename__ = "webhook_dead_letters"
+
+    # Webhook batches that exhausted their retries (or were still queued at shutdown)
+    id = Column(String, primary_key=True, default=generate_uuid)
+    consumer_id = Column(String, ForeignKey("external_consumers.id"), index=True, nullable=False)
+    webhook_url = Column(String, nullable=False)
+    payload = Column(String, nullable=False) # JSON {"events": [...]} exactly as it was sent
+    event_count = Column(Integer, nullable=False)
+    attempts = Column(Integer, nullable=False)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class EvaluationJob(Base):
+    __tablename__ = "evaluation_jobs"
+
+    # Bulk credit evaluation submitted through /external/v1/jobs
+    id = Column(String, primary_key=True, default=generate_uuid)
+    consumer_id = Column(String, ForeignKey("external_consumers.id"), index=True, nullable=False)
+    status = Column(String, default="QUEUED", nullable=False) # QUEUED, RUNNING, COMPLETED, FAILED, CANCELLED
+    total_items = Column(Integer, default=0, nullable=False)
+    processed_items = Column(Integer, default=0, nullable=False)
+    succeeded_items = Column(Integer, default=0, nullable=False)
+    failed_items = Column(Integer, default=0, nullable=False)
+    error = Column(String, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+    # The runner evaluating the job; another process may take it over once the lease has expired
+    owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+
+class EvaluationJobItem(Base):
+    __tablename__ = "evaluation_job_items"
+
+    job_id = Column(String, ForeignKey("evaluation_jobs.id"), primary_key=True)
+    seq = Column(Integer, primary_key=True) # position in the submitted file
+    gst_number = Column(String, nullable=True)
+    aadhaar_number = Column(String, nullable=True)
+    pan_number = Column(String, nullable=True)
+    status = Column(String, default="PENDING", nullable=False) # PENDING, DONE
+    result = Column(String, nullable=True) # JSON, same shape as /external/v1/credit-evaluate
+    error = Column(String, nullable=True) # JSON {"status_code", "detail"}
 
 class VerificationLog(Base):
     __tablename__ = "verification_logs"
@@ -137,4 +276,4 @@ class VerificationLog(Base):
     credit_score = Column(Integer, nullable=True)
     risk_category = Column(String, nullable=True)
     recommendation = Column(String, nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
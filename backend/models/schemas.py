@@ -19,6 +19,10 @@ class InvoiceStatus(str, Enum):
     UNPAID = "UNPAID"
     DEFAULTED = "DEFAULTED"
 
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
 class OTPRequest(BaseModel):
     identity_value: str
     identity_type: str = "AADHAAR"
@@ -85,6 +89,20 @@ class PANResponse(BaseModel):
     class Config:
         from_attributes = True
 
+# --- Bulk Identity Import ---
+class IdentityImportRow(BaseModel):
+    """One line of an identity import file (CSV columns or NDJSON keys)"""
+    name: str = Field(..., min_length=1)
+    phone: str = Field(..., min_length=1)
+    email: Optional[EmailStr] = None
+    address: Optional[str] = None
+    photo_url: Optional[str] = None
+    # Migrated registries keep their numbers; blank ones are allocated
+    aadhaar_number: Optional[str] = Field(None, pattern=r"^[2-9][0-9]{11}$")
+    issue_pan: bool = False
+    pan_number: Optional[str] = Field(None, pattern=r"^[A-Z]{5}[0-9]{4}[A-Z]$")
+    pan_photo_url: Optional[str] = None
+
 # --- Verification Schemas ---
 class VerificationCheckRequest(BaseModel):
     gst_number: str
@@ -92,6 +110,12 @@ class VerificationCheckRequest(BaseModel):
     pan_number: str
     invoice_id: Optional[str] = None
 
+# Upper bound keeps every IN (...) list of a batch well under driver bind-parameter limits
+VERIFICATION_BATCH_MAX_ITEMS = 1000
+
+class VerificationBatchRequest(BaseModel):
+    items: List[VerificationCheckRequest] = Field(..., min_length=1, max_length=VERIFICATION_BATCH_MAX_ITEMS)
+
 # --- Business / GST Schemas ---
 class CompanyCreate(BaseModel):
     company_name: str
@@ -101,6 +125,12 @@ class CompanyCreate(BaseModel):
     state_code: str
     aadhaar_numbers: List[str]
 
+# Each batch is one transaction; the bound also keeps the owner IN (...) list within driver limits
+COMPANY_BATCH_MAX_ITEMS = 500
+
+class CompanyBatchCreate(BaseModel):
+    items: List[CompanyCreate] = Field(..., min_length=1, max_length=COMPANY_BATCH_MAX_ITEMS)
+
 class CompanyResponse(BaseModel):
     id: str
     gst_number: str
@@ -139,6 +169,19 @@ class InvoiceResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class InvoiceImportRow(BaseModel):
+    """One line of an invoice feed (CSV columns or NDJSON keys); the seller is given by GSTIN or company id"""
+    seller_gstin: Optional[str] = None
+    company_id: Optional[str] = None
+    invoice_number: str = Field(..., min_length=1)
+    buyer_gstin: str = Field(..., min_length=1)
+    date: datetime
+    total_taxable: float
+    total_tax: float
+    grand_total: float
+    status: InvoiceStatus = InvoiceStatus.UNPAID
+    delay_days: int = 0
+
 class ReturnCreate(BaseModel):
     company_id: str
     compliance_score: int
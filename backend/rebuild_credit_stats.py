@@ -0,0 +1,22 @@
+from database import SessionLocal, engine, Base
+from models.database_models import CompanyCreditStats
+from services.credit_stats import rebuild_company_stats
+
+# Ensure the stats table exists
+Base.metadata.create_all(bind=engine)
+
+def rebuild_credit_stats():
+    db = SessionLocal()
+    try:
+        print("Rebuilding company_credit_stats from invoice and gst_return...")
+        count = rebuild_company_stats(db)
+        db.commit()
+        print(f"Rebuilt credit stats for {count} companies.")
+    except Exception as e:
+        db.rollback()
+        print(f"Error rebuilding credit stats: {e}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    rebuild_credit_stats()
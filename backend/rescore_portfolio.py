@@ -0,0 +1,275 @@
+import os
+import sys
+import json
+import uuid
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import select, func, tuple_
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import SessionLocal, engine, Base, dialect_insert
+from models.database_models import GSTCompany, CompanyOwner, AadhaarProfile, PANProfile, CompanyCreditStats, CreditScoreSnapshot
+from services.credit_engine import (
+    calculate_owner_score_batch, calculate_company_score_batch, calculate_transaction_score_batch,
+    calculate_final_credit_score_batch, get_risk_category_batch,
+)
+from services.credit_stats import get_companies_stats
+
+DEFAULT_CHECKPOINT = "rescore_checkpoint.json"
+
+# One row per (company, owner); stats are outer-joined so companies without a stats row
+# still come through and are filled in from a live aggregate
+ROW_QUERY = (
+    select(
+        GSTCompany.id,
+        GSTCompany.created_at,
+        GSTCompany.is_suspended,
+        CompanyOwner.aadhaar_id,
+        AadhaarProfile.kyc_status,
+        AadhaarProfile.blacklist_flag,
+        PANProfile.id,
+        PANProfile.is_linked,
+        PANProfile.aadhaar_id,
+        CompanyCreditStats.company_id,
+        CompanyCreditStats.invoice_count,
+        CompanyCreditStats.paid_count,
+        CompanyCreditStats.defaulted_count,
+        CompanyCreditStats.delay_days_sum,
+        CompanyCreditStats.return_count,
+        CompanyCreditStats.compliance_sum,
+    )
+    .join(CompanyOwner, CompanyOwner.company_id == GSTCompany.id)
+    .join(AadhaarProfile, AadhaarProfile.id == CompanyOwner.aadhaar_id)
+    .outerjoin(PANProfile, PANProfile.id == CompanyOwner.pan_id)
+    .outerjoin(CompanyCreditStats, CompanyCreditStats.company_id == GSTCompany.id)
+)
+
+def load_checkpoint(path):
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return None
+
+def save_checkpoint(path, checkpoint):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+def score_chunk(columns):
+    """Runs in a worker process: scores a chunk of column arrays with the vectorized engine"""
+    total = columns["invoice_count"]
+    safe_total = np.maximum(total, 1)
+    safe_returns = np.maximum(columns["return_count"], 1)
+
+    owner_score = calculate_owner_score_batch(
+        columns["kyc_verified"], columns["pan_linked"], columns["blacklist_flag"],
+        np.zeros_like(total), columns["mismatch"]
+    )
+    compliance_avg = np.where(columns["return_count"] > 0, columns["compliance_sum"] / safe_returns, 0)
+    company_score = calculate_company_score_batch(True, compliance_avg, columns["age_years"], columns["is_suspended"])
+    transaction_score = calculate_transaction_score_batch(
+        total,
+        np.where(total > 0, columns["paid_count"] / safe_total, 0),
+        np.where(total > 0, columns["defaulted_count"] / safe_total, 0),
+        np.where(total > 0, columns["delay_days_sum"] / safe_total, 0),
+    )
+    credit_score = calculate_final_credit_score_batch(owner_score, company_score, transaction_score)
+
+    risk_category = get_risk_category_batch(credit_score)
+    # Same decision rules as the online verification: blacklisting, suspension or a low score reject
+    rejected = (
+        np.isin(risk_category, ["HIGH_RISK", "MEDIUM_RISK"])
+        | columns["blacklist_flag"] | columns["is_suspended"] | (credit_score < 350)
+    )
+    recommendation = np.where(rejected, "REJECT", "APPROVE")
+
+    return {
+        "owner_score": owner_score,
+        "company_score": company_score,
+        "transaction_score": transaction_score,
+        "credit_score": credit_score,
+        "risk_category": risk_category,
+        "recommendation": recommendation,
+    }
+
+def build_columns(rows, fallback_stats):
+    """Turns the streamed rows of one chunk into the column arrays score_chunk() expects"""
+    current_year = datetime.now().year
+    columns = {name: [] for name in (
+        "age_years", "is_suspended", "kyc_verified", "blacklist_flag", "pan_linked", "mismatch",
+        "invoice_count", "paid_count", "defaulted_count", "delay_days_sum", "return_count", "compliance_sum",
+    )}
+    for (company_id, created_at, is_suspended, aadhaar_id, kyc_status, blacklist_flag,
+         pan_id, pan_is_linked, pan_aadhaar_id, stats_company_id, *stats) in rows:
+        if stats_company_id is None:
+            fallback = fallback_stats[company_id]
+            stats = (fallback.invoice_count, fallback.paid_count, fallback.defaulted_count,
+                     fallback.delay_days_sum, fallback.return_count, fallback.compliance_sum)
+        invoice_count, paid_count, defaulted_count, delay_days_sum, return_count, compliance_sum = stats
+
+        columns["age_years"].append(current_year - created_at.year if created_at else 0)
+        columns["is_suspended"].append(bool(is_suspended))
+        columns["kyc_verified"].append(kyc_status == "VERIFIED")
+        columns["blacklist_flag"].append(bool(blacklist_flag))
+        columns["pan_linked"].append(bool(pan_is_linked) if pan_id else False)
+        columns["mismatch"].append(pan_id is not None and pan_aadhaar_id != aadhaar_id)
+        columns["invoice_count"].append(invoice_count)
+        columns["paid_count"].append(paid_count)
+        columns["defaulted_count"].append(defaulted_count)
+        columns["delay_days_sum"].append(delay_days_sum)
+        columns["return_count"].append(return_count)
+        columns["compliance_sum"].append(compliance_sum)
+    return {name: np.array(values) for name, values in columns.items()}
+
+def upsert_snapshots(db, rows, scores, run_id):
+    """
+    Writes one snapshot per (company, owner). company_owners does not enforce that pair
+    to be unique: a duplicated owner would make Postgres reject the multi-row upsert
+    ("cannot affect row a second time"), so the last row per pair wins. Owners without
+    an Aadhaar id have no snapshot key and are skipped.
+    """
+    insert = dialect_insert(db)
+    records = {
+        (row[0], row[3]): {
+            "company_id": row[0],
+            "aadhaar_id": row[3],
+            "pan_id": row[6],
+            "owner_score": owner,
+            "company_score": company,
+            "transaction_score": transaction,
+            "credit_score": credit,
+            "risk_category": risk,
+            "recommendation": recommendation,
+            "run_id": run_id,
+        }
+        for row, owner, company, transaction, credit, risk, recommendation in zip(
+            rows, scores["owner_score"].tolist(), scores["company_score"].tolist(),
+            scores["transaction_score"].tolist(), scores["credit_score"].tolist(),
+            scores["risk_category"].tolist(), scores["recommendation"].tolist()
+        )
+        if row[3] is not None
+    }
+    if not records:
+        return
+    stmt = insert(CreditScoreSnapshot)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["company_id", "aadhaar_id"],
+        set_={
+            "pan_id": stmt.excluded.pan_id,
+            "owner_score": stmt.excluded.owner_score,
+            "company_score": stmt.excluded.company_score,
+            "transaction_score": stmt.excluded.transaction_score,
+            "credit_score": stmt.excluded.credit_score,
+            "risk_category": stmt.excluded.risk_category,
+            "recommendation": stmt.excluded.recommendation,
+            "run_id": stmt.excluded.run_id,
+            "computed_at": func.now(),
+        }
+    )
+    db.execute(stmt, list(records.values()))
+    db.commit()
+
+def read_partitions(query, chunk_size):
+    """
+    Yields the rows of query (ordered by company id, owner aadhaar id) in lists of up
+    to chunk_size. Postgres streams them through a server-side cursor on a separate
+    connection. SQLite would hold that read open as a shared lock and fail the
+    snapshot commits with "database is locked", so there each page is a short keyset
+    read that finishes before anything is written.
+    """
+    if engine.dialect.name != "sqlite":
+        with engine.connect() as read_conn:
+            result = read_conn.execution_options(stream_results=True, yield_per=chunk_size).execute(query)
+            yield from result.partitions(chunk_size)
+        return
+    after = None
+    while True:
+        page_query = query if after is None else query.where(tuple_(GSTCompany.id, CompanyOwner.aadhaar_id) > after)
+        with engine.connect() as read_conn:
+            rows = read_conn.execute(page_query.limit(chunk_size)).all()
+        if rows:
+            yield rows
+        if len(rows) < chunk_size:
+            return
+        after = (rows[-1][0], rows[-1][3])
+
+def iter_company_chunks(partitions):
+    """
+    Groups the read partitions into chunks that never split a company's owners,
+    so the last company id of a chunk is always safe to checkpoint.
+    """
+    pending = []
+    for partition in partitions:
+        pending.extend(partition)
+        last_company_id = pending[-1][0]
+        split = len(pending)
+        while split > 0 and pending[split - 1][0] == last_company_id:
+            split -= 1
+        if split:
+            yield pending[:split]
+            pending = pending[split:]
+    if pending:
+        yield pending
+
+def rescore_portfolio(chunk_size=5000, workers=None, checkpoint_path=DEFAULT_CHECKPOINT, restart=False):
+    Base.metadata.create_all(bind=engine)
+
+    checkpoint = None if restart else load_checkpoint(checkpoint_path)
+    if checkpoint:
+        print(f"Resuming run {checkpoint['run_id']} after company {checkpoint['last_company_id']} ({checkpoint['processed']} rows done)")
+    else:
+        checkpoint = {"run_id": str(uuid.uuid4()), "last_company_id": None, "processed": 0}
+        print(f"Starting rescoring run {checkpoint['run_id']}")
+
+    query = ROW_QUERY.order_by(GSTCompany.id, CompanyOwner.aadhaar_id)
+    if checkpoint["last_company_id"] is not None:
+        query = query.where(GSTCompany.id > checkpoint["last_company_id"])
+
+    workers = workers or os.cpu_count() or 1
+    db = SessionLocal()
+    in_flight = deque()
+
+    def drain(limit):
+        # Write results strictly in submission order so the checkpoint only ever moves forward
+        while len(in_flight) > limit:
+            rows, future = in_flight.popleft()
+            upsert_snapshots(db, rows, future.result(), checkpoint["run_id"])
+            checkpoint["last_company_id"] = rows[-1][0]
+            checkpoint["processed"] += len(rows)
+            save_checkpoint(checkpoint_path, checkpoint)
+            print(f"Scored {checkpoint['processed']} company/owner rows (up to company {checkpoint['last_company_id']})")
+
+    try:
+        # Read in chunks so the registry is never materialised
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for rows in iter_company_chunks(read_partitions(query, chunk_size)):
+                missing = {row[0] for row in rows if row[9] is None}
+                fallback_stats = get_companies_stats(db, missing) if missing else {}
+                in_flight.append((rows, pool.submit(score_chunk, build_columns(rows, fallback_stats))))
+                drain(workers * 2)
+            drain(0)
+    except Exception as e:
+        db.rollback()
+        print(f"Rescoring stopped: {e}. Re-run to resume from the last checkpoint.")
+        raise
+    finally:
+        db.close()
+
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    print(f"Rescoring run {checkpoint['run_id']} complete: {checkpoint['processed']} rows.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute credit score snapshots for every GST company and its owners")
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT)
+    parser.add_argument("--restart", action="store_true", help="Ignore any existing checkpoint")
+    args = parser.parse_args()
+    rescore_portfolio(args.chunk_size, args.workers, args.checkpoint, args.restart)
@@ -1,10 +1,27 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List
-from database import get_db
-from models.database_models import AadhaarProfile, PANProfile, GSTCompany, Invoice, AuditLog, User
+from sqlalchemy import func, select
+from typing import List, Optional
+from datetime import datetime
+import csv
+import io
+import json
+import zlib
+from database import get_db, SessionLocal
+from models.database_models import AadhaarProfile, PANProfile, GSTCompany, Invoice, AuditLog, VerificationLog, User
+from models.schemas import ExportFormat
 from routers.auth import get_current_admin
+from services.credit_cache import credit_cache
+from services.consumer_cache import consumer_cache
+from services.idempotency import idempotency_store
+from services.rate_limit import rate_limiter
+from services.webhooks import webhook_dispatcher
+from services.id_allocator import aadhaar_numbers, pan_numbers
+from services.profiling import registry as profiling_registry
+from services.search_index import registry_search
+from services.otp_store import otp_store
+from services.otp_delivery import otp_dispatcher
 
 router = APIRouter()
 
@@ -36,3 +53,143 @@ def get_audit_logs(db: Session = Depends(get_db), current_admin: User = Depends(
             "code": log.action[:10].upper()
         })
     return formatted_logs
+
+@router.get("/cache/stats")
+def get_cache_stats(current_admin: User = Depends(get_current_admin)):
+    return {
+        "credit_evaluation": credit_cache.stats(),
+        "external_consumers": consumer_cache.stats(),
+        "idempotency": idempotency_store.stats(),
+        "rate_limit": rate_limiter.stats(),
+        "webhooks": webhook_dispatcher.stats(),
+        "id_allocation": {"aadhaar": aadhaar_numbers.stats(), "pan": pan_numbers.stats()},
+        "search": registry_search.stats(),
+        "otp": otp_store.stats(),
+        "otp_delivery": otp_dispatcher.stats(),
+    }
+
+@router.get("/metrics/credit-pipeline")
+def get_credit_pipeline_metrics(current_admin: User = Depends(get_current_admin)):
+    # Histograms are per worker process; each worker reports only the requests it served
+    return profiling_registry.snapshot()
+
+# Rows fetched per round trip from the server-side cursor; memory stays bounded by this
+EXPORT_CHUNK_ROWS = 5000
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+def _stream_export(stmt, columns, fmt: ExportFormat, compress: bool):
+    """
+    Yields the export in chunks. Uses its own session because the request-scoped one is
+    closed before a StreamingResponse body is consumed.
+    """
+    db = SessionLocal()
+    try:
+        result = db.execute(stmt.execution_options(stream_results=True, yield_per=EXPORT_CHUNK_ROWS))
+        compressor = zlib.compressobj(wbits=31) if compress else None # wbits=31 -> gzip container
+
+        def encode(text):
+            data = text.encode()
+            return compressor.compress(data) if compressor else data
+
+        if fmt == ExportFormat.CSV:
+            buf = io.StringIO()
+            csv.writer(buf).writerow(columns)
+            yield encode(buf.getvalue())
+
+        for rows in result.partitions():
+            buf = io.StringIO()
+            if fmt == ExportFormat.CSV:
+                writer = csv.writer(buf)
+                writer.writerows(
+                    [value.isoformat() if isinstance(value, datetime) else value for value in row]
+                    for row in rows
+                )
+            else:
+                for row in rows:
+                    buf.write(json.dumps(dict(zip(columns, row)), default=_json_default))
+                    buf.write("\n")
+            chunk = encode(buf.getvalue())
+            if chunk:
+                yield chunk
+
+        if compressor:
+            yield compressor.flush()
+    finally:
+        db.close()
+
+def _export_response(stmt, columns, name: str, fmt: ExportFormat, compress: bool):
+    filename = f"{name}_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.{fmt.value}"
+    media_type = "text/csv" if fmt == ExportFormat.CSV else "application/x-ndjson"
+    if compress:
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        _stream_export(stmt, columns, fmt, compress),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.get("/export/audit-logs")
+def export_audit_logs(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    actor: Optional[str] = None,
+    action: Optional[str] = None,
+    entity: Optional[str] = None,
+    entity_id: Optional[str] = None,
+    format: ExportFormat = ExportFormat.NDJSON,
+    gzip: bool = False,
+    current_admin: User = Depends(get_current_admin)
+):
+    table = AuditLog.__table__
+    stmt = select(*table.c)
+    if start:
+        stmt = stmt.where(AuditLog.timestamp >= start)
+    if end:
+        stmt = stmt.where(AuditLog.timestamp < end)
+    if actor:
+        stmt = stmt.where(AuditLog.actor == actor)
+    if action:
+        stmt = stmt.where(AuditLog.action == action)
+    if entity:
+        stmt = stmt.where(AuditLog.entity == entity)
+    if entity_id:
+        stmt = stmt.where(AuditLog.entity_id == entity_id)
+    stmt = stmt.order_by(AuditLog.timestamp, AuditLog.id)
+    return _export_response(stmt, [c.name for c in table.c], "audit_logs", format, gzip)
+
+@router.get("/export/verification-logs")
+def export_verification_logs(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    gst_number: Optional[str] = None,
+    aadhaar_number: Optional[str] = None,
+    pan_number: Optional[str] = None,
+    risk_category: Optional[str] = None,
+    recommendation: Optional[str] = None,
+    format: ExportFormat = ExportFormat.NDJSON,
+    gzip: bool = False,
+    current_admin: User = Depends(get_current_admin)
+):
+    table = VerificationLog.__table__
+    stmt = select(*table.c)
+    if start:
+        stmt = stmt.where(VerificationLog.created_at >= start)
+    if end:
+        stmt = stmt.where(VerificationLog.created_at < end)
+    if gst_number:
+        stmt = stmt.where(VerificationLog.gst_number == gst_number)
+    if aadhaar_number:
+        stmt = stmt.where(VerificationLog.aadhaar_number == aadhaar_number)
+    if pan_number:
+        stmt = stmt.where(VerificationLog.pan_number == pan_number)
+    if risk_category:
+        stmt = stmt.where(VerificationLog.risk_category == risk_category)
+    if recommendation:
+        stmt = stmt.where(VerificationLog.recommendation == recommendation)
+    stmt = stmt.order_by(VerificationLog.created_at, VerificationLog.id)
+    return _export_response(stmt, [c.name for c in table.c], "verification_logs", format, gzip)
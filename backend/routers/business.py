@@ -1,16 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List
-import random
-import string
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from starlette.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from datetime import datetime
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from database import get_db
-from models.database_models import GSTCompany, Invoice, GSTReturn, User, AadhaarProfile, PANProfile, CompanyOwner, AuditLog
-from models.schemas import CompanyCreate, CompanyResponse, InvoiceCreate, ReturnCreate, InvoiceResponse, InvoiceStatus, ReturnResponse
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import IntegrityError
+from database import get_db, SessionLocal
+from models.database_models import GSTCompany, Invoice, GSTReturn, User, AadhaarProfile, PANProfile, CompanyOwner, generate_uuid
+from models.schemas import CompanyCreate, CompanyBatchCreate, CompanyResponse, InvoiceCreate, ReturnCreate, InvoiceResponse, InvoiceStatus, ReturnResponse
 from routers.auth import get_current_admin
+from services.credit_stats import init_company_stats, init_companies_stats, record_invoice, record_invoice_update, record_return
+from services.credit_cache import credit_cache
+from services.log_sink import log_sink
+from services.serialization import projection, projected_response, dumps
+from services.id_allocator import allocate_gstin, allocate_gstins
+from services.search_index import registry_search, paged_response, RankedQuery, decode_cursor
+from services.webhooks import webhook_dispatcher, INVOICE_STATUS_CHANGED, COMPANY_SUSPENDED
+from services.invoice_import import invoice_importer
+from services.bulk_upload import spool_upload
 
 router = APIRouter()
 
+# Registrations racing for the same PAN and state each get a GSTIN allocated before either commits
+GSTIN_ALLOCATION_ATTEMPTS = 5
+
 @router.get("/company/{gst_number}", response_model=CompanyResponse)
 def get_company_by_gstin(gst_number: str, db: Session = Depends(get_db)):
     db_company = db.query(GSTCompany).filter(GSTCompany.gst_number == gst_number).first()
@@ -19,13 +33,29 @@ def get_company_by_gstin(gst_number: str, db: Session = Depends(get_db)):
     return db_company
 
 @router.get("/search/company", response_model=List[CompanyResponse])
-def search_company(query: str, db: Session = Depends(get_db), current_admin: User = Depends(get_current_admin)):
-    return db.query(GSTCompany).filter(GSTCompany.company_name.ilike(f"%{query}%")).limit(20).all()
+def search_company(
+    query: str,
+    after: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_admin: User = Depends(get_current_admin)
+):
+    # Ranked name match, or a GSTIN prefix when the query contains digits
+    return paged_response(registry_search.companies(db, query, projection(GSTCompany, CompanyResponse)), after, limit)
 
-@router.post("/register", response_model=CompanyResponse)
-def register_company(company: CompanyCreate, db: Session = Depends(get_db), current_admin: User = Depends(get_current_admin)):
-    
-    # 1. Verification of owners
+def _resolve_owners(db: Session, aadhaar_numbers) -> dict:
+    """Aadhaar number -> (aadhaar_id, pan_id, pan_number) from one joined IN query; the PAN fields are None when no PAN is linked"""
+    return {
+        aadhaar_number: (aadhaar_id, pan_id, pan_number)
+        for aadhaar_number, aadhaar_id, pan_id, pan_number in db.query(
+            AadhaarProfile.aadhaar_number, AadhaarProfile.id, PANProfile.id, PANProfile.pan_number
+        ).outerjoin(PANProfile, PANProfile.aadhaar_id == AadhaarProfile.id).filter(
+            AadhaarProfile.aadhaar_number.in_(set(aadhaar_numbers))
+        )
+    }
+
+def _check_owners(company: CompanyCreate, resolved: dict):
+    """The owner mappings and primary PAN for a registration; raises on the first invalid owner"""
     if not company.aadhaar_numbers:
         raise HTTPException(status_code=400, detail="At least one Aadhaar number is required")
         
@@ -37,66 +67,158 @@ def register_company(company: CompanyCreate, db: Session = Depends(get_db), curr
     
     for aadhaar_num in company.aadhaar_numbers:
         # Check Aadhaar exists & OTP (skipping strict OTP here for brevity, assume admin verified)
-        db_aadhaar = db.query(AadhaarProfile).filter(AadhaarProfile.aadhaar_number == aadhaar_num).first()
-        if not db_aadhaar:
+        if aadhaar_num not in resolved:
             raise HTTPException(status_code=404, detail=f"Aadhaar {aadhaar_num} not found")
             
-        db_pan = db.query(PANProfile).filter(PANProfile.aadhaar_id == db_aadhaar.id).first()
-        if not db_pan:
+        aadhaar_id, pan_id, pan_number = resolved[aadhaar_num]
+        if not pan_id:
             raise HTTPException(status_code=400, detail=f"PAN not linked to Aadhaar {aadhaar_num}")
             
-        valid_owners.append({"aadhaar_id": db_aadhaar.id, "pan_id": db_pan.id})
+        valid_owners.append({"aadhaar_id": aadhaar_id, "pan_id": pan_id})
         if not primary_pan:
-            primary_pan = db_pan.pan_number
+            primary_pan = pan_number
+    return valid_owners, primary_pan
 
-    # 2. Generate GSTIN (StateCode + PAN + EntityNumber + Z + Checksum)
-    entity_code = str(random.randint(1, 9))
-    checksum = random.choice(string.ascii_uppercase + string.digits)
-    gstin = f"{company.state_code}{primary_pan}{entity_code}Z{checksum}"
+@router.post("/register", response_model=CompanyResponse)
+def register_company(company: CompanyCreate, db: Session = Depends(get_db), current_admin: User = Depends(get_current_admin)):
     
-    db_company = db.query(GSTCompany).filter(GSTCompany.gst_number == gstin).first()
-    if db_company:
-        raise HTTPException(status_code=400, detail="Generated GSTIN conflict. Try again.")
+    # 1. Verification of owners (one query for all of them)
+    resolved = _resolve_owners(db, company.aadhaar_numbers) if company.aadhaar_numbers else {}
+    valid_owners, primary_pan = _check_owners(company, resolved)
 
-    try:
-        # 3. Save Company
-        new_company = GSTCompany(
-            gst_number=gstin,
-            company_name=company.company_name,
-            type=company.type.value,
-            state_code=company.state_code,
-            registered_address=company.registered_address,
-            address_proof_url=company.address_proof_url,
-        )
-        db.add(new_company)
-        db.flush()
-        
-        # 4. Save Owners mapping
-        for owner in valid_owners:
-            mapping = CompanyOwner(
-                company_id=new_company.id,
-                aadhaar_id=owner["aadhaar_id"],
-                pan_id=owner["pan_id"]
+    for _ in range(GSTIN_ALLOCATION_ATTEMPTS):
+        # 2. Generate GSTIN (StateCode + PAN + EntityNumber + Z + Checksum)
+        gstin = allocate_gstin(db, company.state_code, primary_pan)
+        if not gstin:
+            raise HTTPException(status_code=400, detail=f"PAN {primary_pan} already has the maximum 35 registrations in state {company.state_code}")
+
+        try:
+            # 3. Save Company
+            new_company = GSTCompany(
+                gst_number=gstin,
+                company_name=company.company_name,
+                type=company.type.value,
+                state_code=company.state_code,
+                registered_address=company.registered_address,
+                address_proof_url=company.address_proof_url,
             )
-            db.add(mapping)
-            
-        audit_entry = AuditLog(
-            actor="ADMIN",
-            action="CREATE_COMPANY",
-            entity="GSTCompany",
-            entity_id=new_company.id
-        )
-        db.add(audit_entry)
-            
-        db.commit()
+            db.add(new_company)
+            db.flush()
+
+            # 4. Save Owners mapping in one bulk insert
+            db.execute(insert(CompanyOwner), [{"company_id": new_company.id, **owner} for owner in valid_owners])
+
+            init_company_stats(db, new_company.id)
+
+            # Must commit atomically with the entity it records, so it bypasses the write-behind buffer
+            log_sink.audit(
+                db,
+                strict=True,
+                actor="ADMIN",
+                action="CREATE_COMPANY",
+                entity="GSTCompany",
+                entity_id=new_company.id
+            )
+
+            db.commit()
+        except IntegrityError as e:
+            db.rollback()
+            # A concurrent registration for the same PAN and state took this GSTIN; allocate the next one
+            if db.query(GSTCompany.id).filter(GSTCompany.gst_number == gstin).first() is not None:
+                continue
+            raise HTTPException(status_code=500, detail=f"Atomic transaction failed: {str(e)}")
+        except Exception as e:
+            db.rollback()
+            raise HTTPException(status_code=500, detail=f"Atomic transaction failed: {str(e)}")
+
         db.refresh(new_company)
+        credit_cache.invalidate_company(new_company.gst_number)
         return new_company
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Atomic transaction failed: {str(e)}")
+
+    raise HTTPException(status_code=409, detail=f"GSTIN for PAN {primary_pan} in state {company.state_code} kept conflicting with concurrent registrations, please retry")
+
+@router.post("/register/batch")
+def register_companies_batch(batch: CompanyBatchCreate, db: Session = Depends(get_db), current_admin: User = Depends(get_current_admin)):
+    """
+    Registers many companies in one transaction. Owners for the whole batch are resolved
+    with one joined IN query and GSTINs with one prefix query; companies, owner mappings,
+    stats rows and audit entries are written with one bulk insert per table. Each item
+    carries its company or its error; invalid items do not stop the others.
+    """
+    items = batch.items
+    resolved = _resolve_owners(db, {number for item in items for number in item.aadhaar_numbers})
+
+    results = []
+    accepted = []
+    for index, item in enumerate(items):
+        entry = {"index": index, "company_name": item.company_name, "company": None, "error": None}
+        results.append(entry)
+        try:
+            valid_owners, primary_pan = _check_owners(item, resolved)
+        except HTTPException as e:
+            entry["error"] = {"status_code": e.status_code, "detail": e.detail}
+            continue
+        accepted.append((entry, item, valid_owners, primary_pan))
+
+    company_rows = []
+    owner_rows = []
+    created = []
+    gstins = allocate_gstins(db, [(item.state_code, primary_pan) for _, item, _, primary_pan in accepted])
+    for (entry, item, valid_owners, primary_pan), gstin in zip(accepted, gstins):
+        if not gstin:
+            entry["error"] = {"status_code": 400, "detail": f"PAN {primary_pan} already has the maximum 35 registrations in state {item.state_code}"}
+            continue
+        company_id = generate_uuid()
+        company_rows.append({
+            "id": company_id,
+            "gst_number": gstin,
+            "company_name": item.company_name,
+            "type": item.type.value,
+            "state_code": item.state_code,
+            "registered_address": item.registered_address,
+            "address_proof_url": item.address_proof_url,
+        })
+        owner_rows.extend({"company_id": company_id, **owner} for owner in valid_owners)
+        created.append((entry, company_id))
+
+    if created:
+        company_ids = [company_id for _, company_id in created]
+        try:
+            db.execute(insert(GSTCompany), company_rows)
+            db.execute(insert(CompanyOwner), owner_rows)
+            init_companies_stats(db, company_ids)
+            log_sink.audit_many(db, [
+                {"actor": "ADMIN", "action": "CREATE_COMPANY", "entity": "GSTCompany", "entity_id": company_id}
+                for company_id in company_ids
+            ], strict=True)
+            db.commit()
+        except Exception as e:
+            # e.g. a GSTIN taken by a concurrent registration; the whole batch is rolled back
+            db.rollback()
+            for entry, _ in created:
+                entry["error"] = {"status_code": 500, "detail": f"Atomic transaction failed: {str(e)}"}
+            created = []
+
+    if created:
+        companies = {
+            row.id: row._asdict() for row in
+            db.query(*projection(GSTCompany, CompanyResponse)).filter(GSTCompany.id.in_(company_ids))
+        }
+        for entry, company_id in created:
+            entry["company"] = companies[company_id]
+            credit_cache.invalidate_company(entry["company"]["gst_number"])
+
+    return {
+        "total": len(results),
+        "succeeded": len(created),
+        "failed": len(results) - len(created),
+        "results": results
+    }
 
 @router.post("/add-return")
 def add_return(ret: ReturnCreate, db: Session = Depends(get_db), current_admin: User = Depends(get_current_admin)):
+    record_return(db, ret.company_id, ret.compliance_score)
+    
     new_return = GSTReturn(
         company_id=ret.company_id,
         compliance_score=ret.compliance_score
@@ -104,6 +226,11 @@ def add_return(ret: ReturnCreate, db: Session = Depends(get_db), current_admin:
     db.add(new_return)
     db.commit()
     db.refresh(new_return)
+    
+    # Versions are bumped only after the commit, so no evaluation can cache the old data under the new version
+    gst_number = db.query(GSTCompany.gst_number).filter(GSTCompany.id == ret.company_id).scalar()
+    if gst_number:
+        credit_cache.invalidate_company(gst_number)
     return {"message": "Return added successfully", "return_id": new_return.id}
 
 @router.post("/add-invoice")
@@ -116,6 +243,9 @@ def add_invoice(inv: InvoiceCreate, db: Session = Depends(get_db), current_admin
     if db_company.gst_number == inv.buyer_gstin:
         raise HTTPException(status_code=400, detail="Seller and Buyer GSTINs cannot be the same")
 
+    # Same transaction as the invoice insert, so the credit aggregates never drift
+    record_invoice(db, inv.company_id, inv.status.value, inv.delay_days)
+
     new_invoice = Invoice(
         company_id=inv.company_id,
         invoice_number=inv.invoice_number,
@@ -130,11 +260,99 @@ def add_invoice(inv: InvoiceCreate, db: Session = Depends(get_db), current_admin
     db.add(new_invoice)
     db.commit()
     db.refresh(new_invoice)
+    credit_cache.invalidate_company(db_company.gst_number)
     return {"message": "Invoice added successfully", "invoice_id": new_invoice.id}
 
+@router.post("/invoices/import")
+async def import_invoices(request: Request, current_admin: User = Depends(get_current_admin)):
+    """
+    Bulk-ingests invoices (e.g. a monthly GSTR-1 feed) as NDJSON, CSV with a header
+    row, or a multipart upload of either in a "file" field. Each row names its seller
+    by seller_gstin or company_id; invoice numbers a seller has already recorded are
+    reported as duplicates. For very large files use import_invoices.py instead.
+    """
+    stream, fmt = await spool_upload(request)
+    try:
+        summary = await run_in_threadpool(invoice_importer.run, stream, fmt)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Import file must be UTF-8")
+    finally:
+        stream.close()
+    if not summary["rows"]:
+        raise HTTPException(status_code=400, detail="Import file contains no rows")
+    return summary
+
+# Rows per keyset page while streaming the invoice export
+INVOICE_STREAM_PAGE_SIZE = 5000
+
+def _invoice_listing(db: Session, company_id=None, gst_number=None, buyer_gstin=None, status=None, start=None, end=None) -> RankedQuery:
+    """
+    Invoices newest first, keyset-ordered on (date, id). The date range is a plain
+    range on the partition key, so Postgres only scans the partitions it covers.
+    """
+    query = db.query(*projection(Invoice, InvoiceResponse))
+    if company_id:
+        query = query.filter(Invoice.company_id == company_id)
+    if gst_number:
+        query = query.filter(Invoice.company_id == select(GSTCompany.id).where(GSTCompany.gst_number == gst_number).scalar_subquery())
+    if buyer_gstin:
+        query = query.filter(Invoice.buyer_gstin == buyer_gstin)
+    if status:
+        query = query.filter(Invoice.status == status.value)
+    if start:
+        query = query.filter(Invoice.date >= start)
+    if end:
+        query = query.filter(Invoice.date < end)
+    return RankedQuery(query, [Invoice.date, Invoice.id], descending=True)
+
 @router.get("/invoices", response_model=List[InvoiceResponse])
-def get_invoices(db: Session = Depends(get_db), current_admin: User = Depends(get_current_admin)):
-    return db.query(Invoice).order_by(Invoice.created_at.desc()).all()
+def get_invoices(
+    company_id: Optional[str] = None,
+    gst_number: Optional[str] = Query(None, description="Seller GSTIN"),
+    buyer_gstin: Optional[str] = None,
+    status: Optional[InvoiceStatus] = None,
+    start: Optional[datetime] = Query(None, description="Invoice date from (inclusive)"),
+    end: Optional[datetime] = Query(None, description="Invoice date to (exclusive)"),
+    after: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db),
+    current_admin: User = Depends(get_current_admin)
+):
+    listing = _invoice_listing(db, company_id, gst_number, buyer_gstin, status, start, end)
+    return paged_response(listing, after, limit)
+
+def _stream_invoices(filters: dict, after: Optional[str]):
+    """NDJSON lines for every matching invoice, read in keyset pages with a short-lived session each"""
+    while True:
+        db = SessionLocal()
+        try:
+            items, after = _invoice_listing(db, **filters).page(after, INVOICE_STREAM_PAGE_SIZE)
+        finally:
+            db.close()
+        if items:
+            yield b"".join(dumps(item) + b"\n" for item in items)
+        if after is None:
+            return
+
+@router.get("/invoices/stream")
+def stream_invoices(
+    company_id: Optional[str] = None,
+    gst_number: Optional[str] = Query(None, description="Seller GSTIN"),
+    buyer_gstin: Optional[str] = None,
+    status: Optional[InvoiceStatus] = None,
+    start: Optional[datetime] = Query(None, description="Invoice date from (inclusive)"),
+    end: Optional[datetime] = Query(None, description="Invoice date to (exclusive)"),
+    after: Optional[str] = Query(None, description="Resume after this cursor (X-Next-Cursor of a page)"),
+    current_admin: User = Depends(get_current_admin)
+):
+    """Streams every matching invoice as NDJSON, in the listing's order, without holding more than one page"""
+    if after is not None:
+        try:
+            decode_cursor(after)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    filters = {"company_id": company_id, "gst_number": gst_number, "buyer_gstin": buyer_gstin, "status": status, "start": start, "end": end}
+    return StreamingResponse(_stream_invoices(filters, after), media_type="application/x-ndjson")
 
 @router.patch("/invoices/{invoice_id}/status")
 def update_invoice_status(invoice_id: str, status: InvoiceStatus, delay_days: int = 0, db: Session = Depends(get_db), current_admin: User = Depends(get_current_admin)):
@@ -148,20 +366,57 @@ def update_invoice_status(invoice_id: str, status: InvoiceStatus, delay_days: in
     if not db_invoice:
         raise HTTPException(status_code=404, detail="Invoice Not Found in Registry")
     
+    old_status = db_invoice.status
+    record_invoice_update(db, db_invoice.company_id, db_invoice.status, db_invoice.delay_days, status.value, delay_days)
+    
     db_invoice.status = status.value
     db_invoice.delay_days = delay_days
     
-    audit_entry = AuditLog(
+    log_sink.audit(
+        db,
         actor="ADMIN",
         action=f"UPDATE_INVOICE_{status.value}",
         entity="Invoice",
         entity_id=db_invoice.id
     )
-    db.add(audit_entry)
     
     db.commit()
+    
+    gst_number = db.query(GSTCompany.gst_number).filter(GSTCompany.id == db_invoice.company_id).scalar()
+    if gst_number:
+        credit_cache.invalidate_company(gst_number)
+    webhook_dispatcher.publish(INVOICE_STATUS_CHANGED, {
+        "invoice_id": db_invoice.id,
+        "invoice_number": db_invoice.invoice_number,
+        "gst_number": gst_number,
+        "old_status": old_status,
+        "new_status": status.value,
+        "delay_days": delay_days,
+    })
     return {"message": "Invoice status updated", "new_status": status.value}
 
+@router.patch("/company/{gst_number}/suspension", response_model=CompanyResponse)
+def update_company_suspension(gst_number: str, suspended: bool, db: Session = Depends(get_db), current_admin: User = Depends(get_current_admin)):
+    db_company = db.query(GSTCompany).filter(GSTCompany.gst_number == gst_number).first()
+    if not db_company:
+        raise HTTPException(status_code=404, detail="Company not found")
+        
+    db_company.is_suspended = suspended
+    
+    log_sink.audit(
+        db,
+        actor="ADMIN",
+        action="UPDATE_COMPANY_SUSPENDED" if suspended else "UPDATE_COMPANY_REINSTATED",
+        entity="GSTCompany",
+        entity_id=db_company.id
+    )
+    
+    db.commit()
+    db.refresh(db_company)
+    credit_cache.invalidate_company(gst_number)
+    webhook_dispatcher.publish(COMPANY_SUSPENDED, {"gst_number": gst_number, "suspended": suspended})
+    return db_company
+
 @router.get("/{gst_number}/summary")
 def get_summary(gst_number: str, db: Session = Depends(get_db)):
     db_company = db.query(GSTCompany).filter(GSTCompany.gst_number == gst_number).first()
@@ -184,10 +439,10 @@ def get_unpaid_invoices_by_gst(gst_number: str, db: Session = Depends(get_db), c
     if not db_company:
         raise HTTPException(status_code=404, detail="Company not found")
         
-    return db.query(Invoice).filter(
+    return projected_response(db.query(*projection(Invoice, InvoiceResponse)).filter(
         Invoice.company_id == db_company.id,
         Invoice.status == "UNPAID"
-    ).all()
+    ))
 
 @router.get("/company/{gst_number}/returns", response_model=List[ReturnResponse])
 def get_returns_by_gst(gst_number: str, db: Session = Depends(get_db), current_admin: User = Depends(get_current_admin)):
@@ -195,4 +450,6 @@ def get_returns_by_gst(gst_number: str, db: Session = Depends(get_db), current_a
     if not db_company:
         raise HTTPException(status_code=404, detail="Company not found")
         
-    return db.query(GSTReturn).filter(GSTReturn.company_id == db_company.id).order_by(GSTReturn.filed_date.desc()).all()
+    return projected_response(
+        db.query(*projection(GSTReturn, ReturnResponse)).filter(GSTReturn.company_id == db_company.id).order_by(GSTReturn.filed_date.desc())
+    )
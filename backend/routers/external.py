@@ -1,14 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, Header, Request
-from fastapi.responses import JSONResponse
-import hmac
-import hashlib
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 import time
 import json
+from typing import Optional
+from datetime import datetime, timezone
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
-from database import get_db
-from models.database_models import ExternalConsumer
-from models.schemas import VerificationCheckRequest
-from routers.verification import verify_full_check
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from database import get_db, get_async_db, SessionLocal
+from models.database_models import ExternalConsumer, ExternalConsumerUsage, WebhookDeadLetter, EvaluationJob, EvaluationJobItem, User
+from models.schemas import VerificationCheckRequest, VerificationBatchRequest
+from routers.verification import verify_full_check_async, verify_batch_check, record_verification_async
+from routers.auth import get_current_admin
+from services.credit_cache import credit_cache
+from services.consumer_cache import consumer_cache, MISSING
+from services.idempotency import idempotency_store
+from services.rate_limit import rate_limiter
+from services.usage_meter import usage_meter
+from services.hmac_signing import signature_matches
+from services.webhooks import webhook_dispatcher, EVALUATION_COMPLETED, JOB_COMPLETED, EVENT_TYPES
+from services.evaluation_jobs import job_runner, parse_job_items, create_job, job_progress, EVALUATION_JOB_MAX_ITEMS, ACTIVE_STATUSES
 import secrets
 
 router = APIRouter()
@@ -27,12 +39,163 @@ def generate_api_keys(name: str, db: Session = Depends(get_db)):
     db.add(consumer)
     db.commit()
     db.refresh(consumer)
+    consumer_cache.upsert(consumer)
     
     return {
         "api_key": api_key,
         "webhook_secret": secret
     }
 
+@router.post("/consumers/{consumer_id}/rotate-keys")
+def rotate_api_keys(consumer_id: str, db: Session = Depends(get_db), current_admin: User = Depends(get_current_admin)):
+    consumer = db.query(ExternalConsumer).filter(ExternalConsumer.id == consumer_id, ExternalConsumer.is_active == True).first()
+    if not consumer:
+        raise HTTPException(status_code=404, detail="Active consumer not found")
+
+    old_api_key = consumer.api_key
+    consumer.api_key = f"api_{secrets.token_hex(16)}"
+    consumer.webhook_secret = f"sec_{secrets.token_hex(24)}"
+    db.commit()
+    db.refresh(consumer)
+
+    # The old key stops working in this worker immediately, elsewhere on the next cache reload
+    consumer_cache.revoke(old_api_key)
+    consumer_cache.upsert(consumer)
+
+    return {
+        "api_key": consumer.api_key,
+        "webhook_secret": consumer.webhook_secret
+    }
+
+@router.post("/consumers/{consumer_id}/revoke")
+def revoke_api_keys(consumer_id: str, db: Session = Depends(get_db), current_admin: User = Depends(get_current_admin)):
+    consumer = db.query(ExternalConsumer).filter(ExternalConsumer.id == consumer_id).first()
+    if not consumer:
+        raise HTTPException(status_code=404, detail="Consumer not found")
+
+    consumer.is_active = False
+    db.commit()
+    consumer_cache.revoke(consumer.api_key)
+
+    return {"message": "Consumer keys revoked", "consumer_id": consumer.id}
+
+@router.patch("/consumers/{consumer_id}/rate-limit")
+def update_rate_limit(
+    consumer_id: str,
+    requests_per_second: Optional[float] = Query(None, gt=0),
+    burst: Optional[int] = Query(None, ge=1),
+    db: Session = Depends(get_db),
+    current_admin: User = Depends(get_current_admin)
+):
+    # Omitted values reset to the gateway defaults
+    consumer = db.query(ExternalConsumer).filter(ExternalConsumer.id == consumer_id).first()
+    if not consumer:
+        raise HTTPException(status_code=404, detail="Consumer not found")
+
+    consumer.rate_limit_per_second = requests_per_second
+    consumer.rate_limit_burst = burst
+    db.commit()
+    db.refresh(consumer)
+    if consumer.is_active:
+        consumer_cache.upsert(consumer)
+
+    return {
+        "consumer_id": consumer.id,
+        "rate_limit_per_second": consumer.rate_limit_per_second,
+        "rate_limit_burst": consumer.rate_limit_burst
+    }
+
+@router.get("/consumers/{consumer_id}/usage")
+def get_consumer_usage(
+    consumer_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+    current_admin: User = Depends(get_current_admin)
+):
+    # Hourly counters; the current hour lags by up to USAGE_FLUSH_INTERVAL_SECONDS
+    query = db.query(ExternalConsumerUsage).filter(ExternalConsumerUsage.consumer_id == consumer_id)
+    if start:
+        query = query.filter(ExternalConsumerUsage.window_start >= start)
+    if end:
+        query = query.filter(ExternalConsumerUsage.window_start < end)
+    return [
+        {
+            "endpoint": row.endpoint,
+            "window_start": row.window_start,
+            "request_count": row.request_count,
+            "rejected_count": row.rejected_count
+        }
+        for row in query.order_by(ExternalConsumerUsage.window_start, ExternalConsumerUsage.endpoint)
+    ]
+
+@router.put("/consumers/{consumer_id}/webhook")
+def update_webhook(
+    consumer_id: str,
+    url: Optional[str] = None,
+    events: Optional[str] = Query(None, description="Comma-separated event types; omit for all"),
+    db: Session = Depends(get_db),
+    current_admin: User = Depends(get_current_admin)
+):
+    # No url disables webhooks for the consumer
+    consumer = db.query(ExternalConsumer).filter(ExternalConsumer.id == consumer_id).first()
+    if not consumer:
+        raise HTTPException(status_code=404, detail="Consumer not found")
+    if url and not url.startswith(("http://", "https://")):
+        raise HTTPException(status_code=400, detail="Webhook URL must be http(s)")
+    if events:
+        unknown = set(events.split(",")) - set(EVENT_TYPES)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown event types: {', '.join(sorted(unknown))}")
+
+    consumer.webhook_url = url
+    consumer.webhook_events = events
+    db.commit()
+    db.refresh(consumer)
+    if consumer.is_active:
+        consumer_cache.upsert(consumer)
+
+    return {"consumer_id": consumer.id, "webhook_url": consumer.webhook_url, "webhook_events": consumer.webhook_events}
+
+@router.get("/webhooks/dead-letters")
+def list_webhook_dead_letters(
+    consumer_id: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    current_admin: User = Depends(get_current_admin)
+):
+    query = db.query(WebhookDeadLetter)
+    if consumer_id:
+        query = query.filter(WebhookDeadLetter.consumer_id == consumer_id)
+    return [
+        {
+            "id": row.id,
+            "consumer_id": row.consumer_id,
+            "webhook_url": row.webhook_url,
+            "event_count": row.event_count,
+            "attempts": row.attempts,
+            "last_error": row.last_error,
+            "created_at": row.created_at
+        }
+        for row in query.order_by(WebhookDeadLetter.created_at.desc()).limit(limit)
+    ]
+
+@router.post("/webhooks/dead-letters/{dead_letter_id}/replay")
+def replay_webhook_dead_letter(dead_letter_id: str, db: Session = Depends(get_db), current_admin: User = Depends(get_current_admin)):
+    dead_letter = db.query(WebhookDeadLetter).filter(WebhookDeadLetter.id == dead_letter_id).first()
+    if not dead_letter:
+        raise HTTPException(status_code=404, detail="Dead letter not found")
+    consumer = db.query(ExternalConsumer).filter(ExternalConsumer.id == dead_letter.consumer_id, ExternalConsumer.is_active == True).first()
+    if not consumer or not consumer.webhook_url:
+        raise HTTPException(status_code=409, detail="Consumer is revoked or has no webhook URL")
+
+    # Re-sent with the consumer's current URL and secret; original event ids are kept so receivers can dedupe
+    events = json.loads(dead_letter.payload)["events"]
+    webhook_dispatcher.requeue(consumer_cache.upsert(consumer), events)
+    db.delete(dead_letter)
+    db.commit()
+    return {"message": "Dead letter re-queued", "event_count": len(events)}
+
 def verify_hmac(request_body: bytes, timestamp: str, secret: str, signature: str):
     try:
         # Prevent replay attacks > 60 seconds
@@ -41,31 +204,60 @@ def verify_hmac(request_body: bytes, timestamp: str, secret: str, signature: str
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid timestamp format")
     
-    msg = f"{timestamp}.".encode() + request_body
-    expected_signature = hmac.new(
-        secret.encode(),
-        msg,
-        hashlib.sha256
-    ).hexdigest()
-    
-    # Constant time compare for security
-    if not hmac.compare_digest(expected_signature, signature):
+    if not signature_matches(secret, timestamp, request_body, signature):
         raise HTTPException(status_code=401, detail="Invalid HMAC signature")
 
+async def _authenticate_consumer(request: Request, x_api_key: str, x_timestamp: str, x_signature: str, db: AsyncSession):
+    # Served from memory; only a key this worker has never seen goes to the database
+    consumer = consumer_cache.get(x_api_key)
+    if consumer is MISSING:
+        db_consumer = (await db.execute(
+            select(ExternalConsumer).where(ExternalConsumer.api_key == x_api_key)
+        )).scalars().first()
+        consumer = consumer_cache.remember(x_api_key, db_consumer)
+    if not consumer:
+        raise HTTPException(status_code=401, detail="Invalid X-API-KEY")
+        
+    body = await request.body()
+    verify_hmac(body, x_timestamp, consumer.webhook_secret, x_signature)
+    return consumer, body
+
+def _enforce_rate_limit(consumer, endpoint: str, response: Optional[Response] = None) -> dict:
+    """Takes a token from the consumer's bucket (429 when empty) and meters the request; returns the RateLimit-* headers"""
+    decision = rate_limiter.check(consumer)
+    rejected = decision is not None and not decision.allowed
+    usage_meter.record(consumer.id, endpoint, rejected=rejected)
+    if decision is None:
+        return {}
+    if rejected:
+        raise HTTPException(status_code=429, detail="Rate limit exceeded", headers=decision.headers())
+    if response is not None:
+        response.headers.update(decision.headers())
+    return decision.headers()
+
+async def _run_idempotent(consumer, endpoint: str, idempotency_key: Optional[str], body: bytes, response: Response, evaluate):
+    """Runs evaluate() once per (consumer, endpoint, Idempotency-Key); retries get the stored response"""
+    if not idempotency_key:
+        return await evaluate()
+    result, replayed = await idempotency_store.run(
+        f"{consumer.id}:{endpoint}", idempotency_key, idempotency_store.fingerprint(body), evaluate
+    )
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
 @router.post("/v1/credit-evaluate")
 async def evaluate_credit(
     request: Request,
     x_api_key: str = Header(..., alias="X-API-KEY"),
     x_timestamp: str = Header(..., alias="X-TIMESTAMP"),
     x_signature: str = Header(..., alias="X-SIGNATURE"),
-    db: Session = Depends(get_db)
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    response: Response = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    consumer = db.query(ExternalConsumer).filter(ExternalConsumer.api_key == x_api_key).first()
-    if not consumer:
-        raise HTTPException(status_code=401, detail="Invalid X-API-KEY")
-        
-    body = await request.body()
-    verify_hmac(body, x_timestamp, consumer.webhook_secret, x_signature)
+    consumer, body = await _authenticate_consumer(request, x_api_key, x_timestamp, x_signature, db)
+    _enforce_rate_limit(consumer, "credit-evaluate", response)
     
     try:
         data = json.loads(body)
@@ -73,4 +265,198 @@ async def evaluate_credit(
     except Exception as e:
         raise HTTPException(status_code=400, detail="Invalid JSON body or missing fields")
         
-    return verify_full_check(verify_req, db)
+    async def evaluate():
+        cache_key, cached = credit_cache.lookup(verify_req.gst_number, verify_req.aadhaar_number, verify_req.pan_number)
+        if cached is not None:
+            await record_verification_async(db, verify_req, cached)
+            return cached
+
+        result = await verify_full_check_async(verify_req, db)
+        credit_cache.store(cache_key, result)
+        return result
+
+    async def evaluate_and_notify():
+        result = await evaluate()
+        webhook_dispatcher.publish(EVALUATION_COMPLETED, {"request": verify_req.model_dump(), "result": result}, consumers=[consumer])
+        return result
+
+    return await _run_idempotent(consumer, "credit-evaluate", idempotency_key, body, response, evaluate_and_notify)
+
+@router.post("/v1/credit-evaluate/batch")
+async def evaluate_credit_batch(
+    request: Request,
+    x_api_key: str = Header(..., alias="X-API-KEY"),
+    x_timestamp: str = Header(..., alias="X-TIMESTAMP"),
+    x_signature: str = Header(..., alias="X-SIGNATURE"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    response: Response = None,
+    adb: AsyncSession = Depends(get_async_db),
+    db: Session = Depends(get_db)
+):
+    consumer, body = await _authenticate_consumer(request, x_api_key, x_timestamp, x_signature, adb)
+    _enforce_rate_limit(consumer, "credit-evaluate-batch", response)
+    
+    try:
+        data = json.loads(body)
+        batch_req = VerificationBatchRequest(**data)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail="Invalid JSON body, missing fields or batch too large")
+        
+    async def evaluate():
+        # The set-based batch path is sync; run it off the event loop
+        result = await run_in_threadpool(verify_batch_check, batch_req, db)
+        for entry in result["results"]:
+            if entry["result"] is not None:
+                webhook_dispatcher.publish(EVALUATION_COMPLETED, {
+                    "request": {key: entry[key] for key in ("gst_number", "aadhaar_number", "pan_number")},
+                    "result": entry["result"]
+                }, consumers=[consumer])
+        return result
+
+    return await _run_idempotent(consumer, "credit-evaluate-batch", idempotency_key, body, response, evaluate)
+
+def _notify_job_completed(job):
+    consumer = consumer_cache.get_by_id(job.consumer_id)
+    if consumer is not None:
+        webhook_dispatcher.publish(JOB_COMPLETED, job_progress(job), consumers=[consumer])
+
+job_runner.on_complete = _notify_job_completed
+
+async def _job_upload(request: Request, body: bytes):
+    """Returns (content, content_type) from a raw NDJSON/CSV body or a multipart upload's "file" field"""
+    content_type = request.headers.get("content-type", "application/x-ndjson")
+    if not content_type.startswith("multipart/form-data"):
+        return body, content_type
+    form = await request.form()
+    upload = form.get("file")
+    if upload is None or isinstance(upload, str):
+        raise HTTPException(status_code=400, detail="Multipart upload needs a 'file' field")
+    is_csv = (upload.filename or "").lower().endswith(".csv") or "csv" in (upload.content_type or "")
+    return await upload.read(), "text/csv" if is_csv else "application/x-ndjson"
+
+async def _owned_job(job_id: str, consumer, db: AsyncSession) -> EvaluationJob:
+    job = (await db.execute(
+        select(EvaluationJob).where(EvaluationJob.id == job_id, EvaluationJob.consumer_id == consumer.id)
+    )).scalars().first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.post("/v1/jobs", status_code=202)
+async def submit_evaluation_job(
+    request: Request,
+    x_api_key: str = Header(..., alias="X-API-KEY"),
+    x_timestamp: str = Header(..., alias="X-TIMESTAMP"),
+    x_signature: str = Header(..., alias="X-SIGNATURE"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    response: Response = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Queues a bulk evaluation. The body is NDJSON (one triple per line), CSV with a
+    gst_number,aadhaar_number,pan_number header, or a multipart upload of either.
+    """
+    consumer, body = await _authenticate_consumer(request, x_api_key, x_timestamp, x_signature, db)
+    _enforce_rate_limit(consumer, "jobs", response)
+
+    async def submit():
+        content, content_type = await _job_upload(request, body)
+        try:
+            items = await run_in_threadpool(parse_job_items, content, content_type)
+        except UnicodeDecodeError:
+            raise HTTPException(status_code=400, detail="Job file must be UTF-8")
+        if not items:
+            raise HTTPException(status_code=400, detail="Job file contains no items")
+        if len(items) > EVALUATION_JOB_MAX_ITEMS:
+            raise HTTPException(status_code=413, detail=f"Jobs are limited to {EVALUATION_JOB_MAX_ITEMS} items")
+
+        job = await run_in_threadpool(create_job, consumer.id, items)
+        job_runner.submit(job.id)
+        return job_progress(job)
+
+    return await _run_idempotent(consumer, "jobs", idempotency_key, body, response, submit)
+
+@router.get("/v1/jobs/{job_id}")
+async def get_evaluation_job(
+    job_id: str,
+    request: Request,
+    x_api_key: str = Header(..., alias="X-API-KEY"),
+    x_timestamp: str = Header(..., alias="X-TIMESTAMP"),
+    x_signature: str = Header(..., alias="X-SIGNATURE"),
+    response: Response = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    consumer, _ = await _authenticate_consumer(request, x_api_key, x_timestamp, x_signature, db)
+    _enforce_rate_limit(consumer, "jobs", response)
+    return job_progress(await _owned_job(job_id, consumer, db))
+
+@router.delete("/v1/jobs/{job_id}")
+async def cancel_evaluation_job(
+    job_id: str,
+    request: Request,
+    x_api_key: str = Header(..., alias="X-API-KEY"),
+    x_timestamp: str = Header(..., alias="X-TIMESTAMP"),
+    x_signature: str = Header(..., alias="X-SIGNATURE"),
+    response: Response = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Takes effect at the next chunk boundary; results evaluated so far stay downloadable
+    consumer, _ = await _authenticate_consumer(request, x_api_key, x_timestamp, x_signature, db)
+    _enforce_rate_limit(consumer, "jobs", response)
+    job = await _owned_job(job_id, consumer, db)
+    # Guarded, like the runner's own transitions: a job that completed meanwhile stays COMPLETED
+    await db.execute(update(EvaluationJob).where(
+        EvaluationJob.id == job.id, EvaluationJob.status.in_(ACTIVE_STATUSES)
+    ).values(status="CANCELLED", completed_at=datetime.now(timezone.utc)))
+    await db.commit()
+    await db.refresh(job)
+    return job_progress(job)
+
+# Items per keyset page while streaming job results
+JOB_RESULTS_PAGE_SIZE = 5000
+
+def _stream_job_results(job_id: str, after: int):
+    """NDJSON lines for the job's evaluated items in file order, read in keyset pages with a short-lived session each"""
+    last_seq = after
+    while True:
+        db = SessionLocal()
+        try:
+            items = db.query(
+                EvaluationJobItem.seq, EvaluationJobItem.gst_number, EvaluationJobItem.aadhaar_number,
+                EvaluationJobItem.pan_number, EvaluationJobItem.result, EvaluationJobItem.error
+            ).filter(
+                EvaluationJobItem.job_id == job_id,
+                EvaluationJobItem.status == "DONE",
+                EvaluationJobItem.seq > last_seq
+            ).order_by(EvaluationJobItem.seq).limit(JOB_RESULTS_PAGE_SIZE).all()
+        finally:
+            db.close()
+        if not items:
+            return
+        yield "".join(
+            # result/error are stored as JSON text already, so they are spliced in rather than re-encoded
+            f'{{"seq":{seq},"gst_number":{json.dumps(gst)},"aadhaar_number":{json.dumps(aadhaar)},'
+            f'"pan_number":{json.dumps(pan)},"result":{result or "null"},"error":{error or "null"}}}\n'
+            for seq, gst, aadhaar, pan, result, error in items
+        )
+        last_seq = items[-1].seq
+
+@router.get("/v1/jobs/{job_id}/results")
+async def stream_evaluation_job_results(
+    job_id: str,
+    request: Request,
+    after: int = Query(-1, description="Only items with seq greater than this (to resume a download)"),
+    x_api_key: str = Header(..., alias="X-API-KEY"),
+    x_timestamp: str = Header(..., alias="X-TIMESTAMP"),
+    x_signature: str = Header(..., alias="X-SIGNATURE"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Streams the items evaluated so far as NDJSON; callable while the job is still running"""
+    consumer, _ = await _authenticate_consumer(request, x_api_key, x_timestamp, x_signature, db)
+    rate_headers = _enforce_rate_limit(consumer, "jobs")
+    job = await _owned_job(job_id, consumer, db)
+    return StreamingResponse(
+        _stream_job_results(job.id, after),
+        media_type="application/x-ndjson",
+        headers={**rate_headers, "X-Job-Status": job.status}
+    )
@@ -1,14 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List
-import random
-import string
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
 from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
 import os
 from database import get_db
-from models.database_models import AadhaarProfile, PANProfile, OTPLog, AuditLog, User
+from models.database_models import AadhaarProfile, PANProfile, User
 from models.schemas import AadhaarCreate, AadhaarResponse, PANCreate, PANResponse, OTPRequest, OTPVerifyRequest
-from services.otp_service import generate_otp, send_otp
+from services.otp_service import generate_otp
+from services.otp_store import otp_store
+from services.otp_delivery import otp_dispatcher
+from services.credit_cache import credit_cache
+from services.log_sink import log_sink
+from services.serialization import projection
+from services.id_allocator import aadhaar_numbers, pan_numbers
+from services.search_index import registry_search, paged_response
+from services.identity_import import identity_importer
+from services.bulk_upload import spool_upload
 
 from routers.auth import get_current_admin
 
@@ -24,16 +31,20 @@ def get_aadhaar_by_number(aadhaar_number: str, db: Session = Depends(get_db), cu
     return profile
 
 @router.get("/search/aadhaar", response_model=List[AadhaarResponse])
-def search_aadhaar(query: str, unlinked_pan: bool = False, db: Session = Depends(get_db), current_admin: User = Depends(get_current_admin)):
-    search_query = db.query(AadhaarProfile).filter(AadhaarProfile.name.ilike(f"%{query}%"))
-    
-    if unlinked_pan:
-        # Get IDs of all Aadhaar profiles that have a linked PAN
-        linked_ids = db.query(PANProfile.aadhaar_id).all()
-        linked_ids_list = [r[0] for r in linked_ids]
-        search_query = search_query.filter(AadhaarProfile.id.notin_(linked_ids_list))
-        
-    return search_query.limit(20).all()
+def search_aadhaar(
+    query: str,
+    unlinked_pan: bool = False,
+    after: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_admin: User = Depends(get_current_admin)
+):
+    # Ranked name match, or an Aadhaar/PAN number prefix when the query contains digits;
+    # unlinked_pan is applied inside the index lookup as a NOT EXISTS anti-join
+    return paged_response(
+        registry_search.aadhaar(db, query, projection(AadhaarProfile, AadhaarResponse), unlinked_pan=unlinked_pan),
+        after, limit
+    )
 
 @router.get("/pan/{pan_number}", response_model=PANResponse)
 def get_pan_by_number(pan_number: str, db: Session = Depends(get_db), current_admin: User = Depends(get_current_admin)):
@@ -45,27 +56,19 @@ def get_pan_by_number(pan_number: str, db: Session = Depends(get_db), current_ad
 @router.post("/aadhaar", response_model=AadhaarResponse)
 def create_aadhaar(aadhaar: AadhaarCreate, db: Session = Depends(get_db), current_admin: User = Depends(get_current_admin)):
     # Verify OTP first
-    otp_log = db.query(OTPLog).filter(
-        OTPLog.identity_type == "PHONE",
-        OTPLog.identity_value == aadhaar.phone,
-        OTPLog.verified == True,
-        OTPLog.is_used == False
-    ).order_by(OTPLog.expiry_time.desc()).first()
-    
-    if not otp_log:
+    if not otp_store.is_verified("PHONE", aadhaar.phone):
         raise HTTPException(status_code=400, detail="Phone number not verified via OTP or OTP already used")
 
     db_aadhaar = db.query(AadhaarProfile).filter(AadhaarProfile.phone == aadhaar.phone).first()
     if db_aadhaar:
         raise HTTPException(status_code=400, detail="Phone already registered to an Aadhaar")
     
-    # Generate 12-digit unique Aadhaar
-    while True:
-        first_digit = str(random.randint(1, 9))
-        remaining = ''.join(random.choices(string.digits, k=11))
-        new_number = first_digit + remaining
-        if not db.query(AadhaarProfile).filter(AadhaarProfile.aadhaar_number == new_number).first():
-            break
+    # 12 digits with a Verhoeff check digit, unique by construction (no lookup per candidate)
+    new_number = aadhaar_numbers.allocate()
+
+    # Claims the code in this transaction: it commits with the profile, and a rollback releases it
+    if not otp_store.consume(db, "PHONE", aadhaar.phone):
+        raise HTTPException(status_code=400, detail="Phone number not verified via OTP or OTP already used")
 
     try:
         new_aadhaar = AadhaarProfile(
@@ -80,18 +83,17 @@ def create_aadhaar(aadhaar: AadhaarCreate, db: Session = Depends(get_db), curren
         )
         db.add(new_aadhaar)
         
-        # Mark OTP as used
-        otp_log.is_used = True
-        
         db.flush() # flush to get generated ID
         
-        audit_entry = AuditLog(
+        # Must commit atomically with the entity it records, so it bypasses the write-behind buffer
+        log_sink.audit(
+            db,
+            strict=True,
             actor="ADMIN",
             action="CREATE_AADHAAR",
             entity="AadhaarProfile",
             entity_id=new_aadhaar.id
         )
-        db.add(audit_entry)
         
         # Atomic commit
         db.commit()
@@ -101,6 +103,27 @@ def create_aadhaar(aadhaar: AadhaarCreate, db: Session = Depends(get_db), curren
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Atomic transaction failed: {str(e)}")
 
+@router.patch("/aadhaar/{aadhaar_number}/blacklist", response_model=AadhaarResponse)
+def update_aadhaar_blacklist(aadhaar_number: str, blacklisted: bool, db: Session = Depends(get_db), current_admin: User = Depends(get_current_admin)):
+    profile = db.query(AadhaarProfile).filter(AadhaarProfile.aadhaar_number == aadhaar_number).first()
+    if not profile:
+        raise HTTPException(status_code=404, detail="Aadhaar profile not found")
+        
+    profile.blacklist_flag = blacklisted
+    
+    log_sink.audit(
+        db,
+        actor="ADMIN",
+        action="UPDATE_AADHAAR_BLACKLISTED" if blacklisted else "UPDATE_AADHAAR_CLEARED",
+        entity="AadhaarProfile",
+        entity_id=profile.id
+    )
+    
+    db.commit()
+    db.refresh(profile)
+    credit_cache.invalidate_identity(aadhaar_number=aadhaar_number)
+    return profile
+
 @router.post("/pan", response_model=PANResponse)
 def create_pan(pan: PANCreate, db: Session = Depends(get_db), current_admin: User = Depends(get_current_admin)):
     db_aadhaar = db.query(AadhaarProfile).filter(AadhaarProfile.aadhaar_number == pan.aadhaar_number).first()
@@ -111,26 +134,15 @@ def create_pan(pan: PANCreate, db: Session = Depends(get_db), current_admin: Use
     if db_pan:
         raise HTTPException(status_code=400, detail="PAN already linked to this Aadhaar")
 
-    # Verify OTP first
-    otp_log = db.query(OTPLog).filter(
-        OTPLog.identity_type == "PHONE", # For PAN, we sent OTP to the registered phone
-        OTPLog.identity_value == db_aadhaar.phone,
-        OTPLog.verified == True,
-        OTPLog.is_used == False
-    ).order_by(OTPLog.expiry_time.desc()).first()
-    
-    if not otp_log:
+    # Verify OTP first (for PAN, we sent OTP to the registered phone)
+    if not otp_store.is_verified("PHONE", db_aadhaar.phone):
         raise HTTPException(status_code=400, detail="Aadhaar not verified via OTP or OTP used")
 
-    # Generate format: ABCDE1234F
-    while True:
-        letters1 = ''.join(random.choices(string.ascii_uppercase, k=5))
-        digits = ''.join(random.choices(string.digits, k=4))
-        letter2 = random.choice(string.ascii_uppercase)
-        new_pan = letters1 + digits + letter2
-        
-        if not db.query(PANProfile).filter(PANProfile.pan_number == new_pan).first():
-            break
+    # Format ABCPE1234F (4th letter P for an individual, last letter a check letter), unique by construction
+    new_pan = pan_numbers.allocate()
+
+    if not otp_store.consume(db, "PHONE", db_aadhaar.phone):
+        raise HTTPException(status_code=400, detail="Aadhaar not verified via OTP or OTP used")
 
     try:
         new_pan_record = PANProfile(
@@ -141,20 +153,21 @@ def create_pan(pan: PANCreate, db: Session = Depends(get_db), current_admin: Use
         )
         db.add(new_pan_record)
         
-        otp_log.is_used = True
-        
         db.flush()
         
-        audit_entry = AuditLog(
+        # Must commit atomically with the entity it records, so it bypasses the write-behind buffer
+        log_sink.audit(
+            db,
+            strict=True,
             actor="ADMIN",
             action="CREATE_PAN",
             entity="PANProfile",
             entity_id=new_pan_record.id
         )
-        db.add(audit_entry)
         
         db.commit()
         db.refresh(new_pan_record)
+        credit_cache.invalidate_identity(aadhaar_number=db_aadhaar.aadhaar_number, pan_number=new_pan)
         return new_pan_record
     except Exception as e:
         db.rollback()
@@ -167,22 +180,17 @@ def request_otp(req: OTPRequest, db: Session = Depends(get_db)):
     # In DEV mode, return the OTP so the user can easily copy it from Swagger UI/Console
     dev_otp = otp if ENVIRONMENT == "DEV" else None
     
-    # Save to db
-    expiry = datetime.utcnow() + timedelta(minutes=5)
-    otp_log = OTPLog(
-        identity_type=req.identity_type,
-        identity_value=req.identity_value,
-        otp=otp,
-        expiry_time=expiry
-    )
-    db.add(otp_log)
+    # Live code goes to the OTP store; the ISSUED event to otp_history
+    otp_store.issue(db, req.identity_type, req.identity_value, otp)
     db.commit()
     
-    send_otp(req.identity_value, otp)
+    # Queued for the delivery workers; the request does not wait on the provider
+    if not otp_dispatcher.submit(req.identity_value, otp, otp_store.ttl):
+        raise HTTPException(status_code=503, detail="OTP delivery is busy, try again shortly")
     
     response = {
         "message": f"OTP sent to {req.identity_type} {req.identity_value}",
-        "expires_in": "5 minutes"
+        "expires_in": f"{otp_store.ttl // 60} minutes"
     }
     
     if dev_otp:
@@ -192,24 +200,15 @@ def request_otp(req: OTPRequest, db: Session = Depends(get_db)):
 
 @router.post("/verify-otp")
 def verify_otp_endpoint(req: OTPVerifyRequest, db: Session = Depends(get_db)):
-    otp_log = db.query(OTPLog).filter(
-        OTPLog.identity_type == req.identity_type,
-        OTPLog.identity_value == req.identity_value,
-        OTPLog.verified == False,
-        OTPLog.is_used == False,
-        OTPLog.expiry_time > datetime.utcnow()
-    ).order_by(OTPLog.expiry_time.desc()).first()
+    verified = otp_store.verify(db, req.identity_type, req.identity_value, req.otp)
+    # Commits the VERIFIED / FAILED history row
+    db.commit()
     
-    if not otp_log:
+    if verified is None:
         raise HTTPException(status_code=400, detail="Invalid, used, or expired OTP")
         
-    if otp_log.otp != req.otp:
-        otp_log.attempt_count += 1
-        db.commit()
+    if not verified:
         raise HTTPException(status_code=400, detail="Incorrect OTP")
-        
-    otp_log.verified = True
-    db.commit()
     
     # Find associated identity details (but keep masked depending on requirements)
     # For now, just return verified status
@@ -219,3 +218,22 @@ def verify_otp_endpoint(req: OTPVerifyRequest, db: Session = Depends(get_db)):
         "message": "Identity successfully verified via OTP",
         "identity": req.identity_value
     }
+
+@router.post("/import")
+async def import_identities(request: Request, current_admin: User = Depends(get_current_admin)):
+    """
+    Bulk-creates Aadhaar profiles (and linked PANs) without the per-person OTP step.
+    The body is NDJSON, CSV with a header row, or a multipart upload of either in a
+    "file" field. Returns the import summary with the line and reason of every row
+    that was not created. For very large files use import_identities.py instead.
+    """
+    stream, fmt = await spool_upload(request)
+    try:
+        summary = await run_in_threadpool(identity_importer.run, stream, fmt)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Import file must be UTF-8")
+    finally:
+        stream.close()
+    if not summary["rows"]:
+        raise HTTPException(status_code=400, detail="Import file contains no rows")
+    return summary
@@ -1,184 +1,88 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 from datetime import datetime
-from database import get_db
-from models.database_models import AadhaarProfile, PANProfile, GSTCompany, Invoice, GSTReturn, VerificationLog, OTPLog, AuditLog
-from models.schemas import VerificationCheckRequest
-from services.credit_engine import calculate_owner_score, calculate_company_score, calculate_transaction_score, calculate_final_credit_score
+import asyncio
+import numpy as np
+from database import get_db, AsyncSessionLocal
+from models.database_models import AadhaarProfile, PANProfile, GSTCompany, CompanyCreditStats, OTPHistory
+from models.schemas import VerificationCheckRequest, VerificationBatchRequest
+from services.credit_engine import (
+    calculate_owner_score, calculate_company_score, calculate_transaction_score, calculate_final_credit_score,
+    calculate_owner_score_batch, calculate_company_score_batch, calculate_transaction_score_batch, calculate_final_credit_score_batch,
+    get_risk_category, get_recommendation,
+)
+from services.credit_stats import get_company_stats, get_companies_stats
+from services.log_sink import log_sink
+from services.profiling import stage
+from services.otp_store import VERIFIED
 
 router = APIRouter()
 
-@router.post("/full-check")
-def verify_full_check(request: VerificationCheckRequest, db: Session = Depends(get_db)):
-    
-    # 1. Verification of identity & linkage
-    db_aadhaar = db.query(AadhaarProfile).filter(AadhaarProfile.aadhaar_number == request.aadhaar_number).first()
-    
-    # Secure OTP Check
-    otp_log = db.query(OTPLog).filter(
-        OTPLog.identity_type == "AADHAAR",
-        OTPLog.identity_value == request.aadhaar_number,
-        OTPLog.verified == True
-    ).order_by(OTPLog.expiry_time.desc()).first()
-    
-    if not otp_log:
-        raise HTTPException(status_code=400, detail="Aadhaar OTP verification is required before full check")
-
-    db_pan = db.query(PANProfile).filter(PANProfile.pan_number == request.pan_number).first()
-    db_gst = db.query(GSTCompany).filter(GSTCompany.gst_number == request.gst_number).first()
-    
-    identity_verified = False
-    pan_linked = False
-    blacklist_flag = False
-    
-    if db_aadhaar:
-        identity_verified = (db_aadhaar.kyc_status == "VERIFIED")
-        blacklist_flag = db_aadhaar.blacklist_flag
-    
-    if db_pan and db_aadhaar:
-        pan_linked = db_pan.is_linked and (db_pan.aadhaar_id == db_aadhaar.id)
-        
-    gst_active = False
-    is_suspended = False
-    company_age = 0
-    if db_gst:
-        gst_active = True
-        is_suspended = db_gst.is_suspended
-        company_age = (datetime.utcnow().date() - db_gst.created_at.date()).days // 365
-        
-    # Owner Score Calculation
-    # For now, mocking defaults count to 0. Can be expanded if we track historical    defaults_count = 0 # In a real system, you'd check a table of past defaults for this Aadhaar
+def scoring_inputs(db_aadhaar, db_pan, db_gst, stats) -> dict:
+    """Flattens the already-loaded rows for one triple into the credit_engine inputs (no DB access)"""
+    # For now, mocking defaults count to 0. Can be expanded if we track historical defaults
+    defaults_count = 0 # In a real system, you'd check a table of past defaults for this Aadhaar
     mismatch = False
     if db_pan and db_pan.aadhaar_id != db_aadhaar.id:
         mismatch = True
 
-    owner_score = calculate_owner_score(
-        aadhaar_verified=True, # We hit this endpoint securely
-        pan_linked=db_pan.is_linked if db_pan else False,
-        blacklist_flag=db_aadhaar.blacklist_flag,
-        defaults_count=defaults_count,
-        mismatch=mismatch
-    )
-    
-    # 2. Company Score (40%)
-    company_score = 600
+    compliance_avg = 0
+    age_years = 0
+    total_inv = 0
+    paid_ratio = default_ratio = avg_delay = 0
     if db_gst: # Changed db_company to db_gst to match existing variable
-        returns = db.query(GSTReturn).filter(GSTReturn.company_id == db_gst.id).all()
-        compliance_avg = sum(r.compliance_score for r in returns) / len(returns) if returns else 0
-        
+        compliance_avg = stats.compliance_sum / stats.return_count if stats.return_count else 0
+
         # calculate age
         created_year = db_gst.created_at.year if db_gst.created_at else datetime.now().year
         age_years = datetime.now().year - created_year
-        
-        company_score = calculate_company_score(
-            gst_active=True,
-            compliance_avg=compliance_avg,
-            company_age_years=age_years,
-            is_suspended=db_gst.is_suspended
-        )
-        
-    # 3. Transaction Score (20%)
-    transaction_score = 650
-    if db_gst: # Changed db_company to db_gst to match existing variable
-        invoices = db.query(Invoice).filter(Invoice.company_id == db_gst.id).all()
-        total_inv = len(invoices)
+
+        total_inv = stats.invoice_count
         if total_inv > 0:
-            paid_count = sum(1 for i in invoices if i.status == "PAID") # Changed "paid" to "PAID" to match existing data
-            default_count = sum(1 for i in invoices if i.status == "DEFAULTED") # Changed "defaulted" to "DEFAULTED" to match existing data
-            
-            paid_ratio = paid_count / total_inv
-            default_ratio = default_count / total_inv
-            
-            avg_delay = sum(i.delay_days for i in invoices) / total_inv
-            
-            transaction_score = calculate_transaction_score(
-                total_invoices=total_inv,
-                paid_ratio=paid_ratio,
-                default_ratio=default_ratio,
-                avg_delay_days=avg_delay
-            )
-    
-    # Final Score
-    credit_score = calculate_final_credit_score(owner_score, company_score, transaction_score)
-    
-    # Helper functions for risk category and recommendation
-    def get_risk_category(score):
-        if score <= 300:
-            return "HIGH_RISK"
-        elif score <= 600:
-            return "MEDIUM_RISK"
-        elif score <= 800:
-            return "LOW_RISK"
-        else:
-            return "EXCELLENT"
-
-    def get_recommendation(risk_cat):
-        if risk_cat in ["HIGH_RISK", "MEDIUM_RISK"]:
-            return "REJECT"
-        else:
-            return "APPROVE"
+            paid_ratio = stats.paid_count / total_inv
+            default_ratio = stats.defaulted_count / total_inv
+            avg_delay = stats.delay_days_sum / total_inv
 
+    return {
+        "aadhaar_verified": True, # We hit this endpoint securely
+        "pan_linked": db_pan.is_linked if db_pan else False,
+        "blacklist_flag": db_aadhaar.blacklist_flag,
+        "defaults_count": defaults_count,
+        "mismatch": mismatch,
+        "has_company": db_gst is not None,
+        "compliance_avg": compliance_avg,
+        "company_age_years": age_years,
+        "is_suspended": db_gst.is_suspended if db_gst else False,
+        "total_invoices": total_inv,
+        "paid_ratio": paid_ratio,
+        "default_ratio": default_ratio,
+        "avg_delay_days": avg_delay,
+    }
+
+def build_verification_result(inputs: dict, owner_score: int, company_score: int, transaction_score: int, credit_score: int) -> dict:
     risk_category = get_risk_category(credit_score)
     recommendation = get_recommendation(risk_category)
-    
+
     # Verification Decision Logic
     is_verified = True
     reason = []
-    
-    if db_aadhaar and db_aadhaar.blacklist_flag: # Added check for db_aadhaar existence
+
+    if inputs["blacklist_flag"]:
         is_verified = False
         reason.append("AADHAAR_BLACKLISTED")
         recommendation = "REJECT"
-        
-    if db_gst and db_gst.is_suspended: # Changed db_company to db_gst to match existing variable
+
+    if inputs["is_suspended"]:
         is_verified = False
         reason.append("GST_SUSPENDED")
         recommendation = "REJECT"
-        
+
     if credit_score < 350:
         is_verified = False
         reason.append("LOW_CREDIT_SCORE")
         recommendation = "REJECT"
-        
-    # Build Payload
-    payload = {
-        "verification_complete": True,
-        "verified": is_verified,
-        "credit_score": credit_score,
-        "risk_category": risk_category,
-        "recommendation": recommendation,
-        "owner_score": owner_score,
-        "company_score": company_score,
-        "transaction_score": transaction_score,
-    }
-    
-    if not is_verified:
-        payload["reason"] = ", ".join(reason)
-        
-    # Log the verification attempt
-    log_entry = VerificationLog(
-        gst_number=request.gst_number,
-        aadhaar_number=request.aadhaar_number,
-        pan_number=request.pan_number,
-        owner_score=owner_score,
-        company_score=company_score,
-        transaction_score=transaction_score,
-        credit_score=credit_score,
-        risk_category=risk_category,
-        recommendation=recommendation
-    )
-    db.add(log_entry)
-    
-    audit_entry = AuditLog(
-        actor="EXTERNAL_GATEWAY",
-        action="EVALUATE_CREDIT",
-        entity="GSTCompany",
-        entity_id=request.gst_number
-    )
-    db.add(audit_entry)
-    
-    db.commit()
 
     response = {
         "verification_complete": True,
@@ -191,8 +95,277 @@ def verify_full_check(request: VerificationCheckRequest, db: Session = Depends(g
         "transaction_score": transaction_score,
         "flags": [] if not reason else reason
     }
-    
+
     if not is_verified:
         response["reason"] = ", ".join(reason)
 
     return response
+
+def score_verification(db_aadhaar, db_pan, db_gst, stats) -> dict:
+    """Scores one triple from rows that have already been loaded"""
+    inputs = scoring_inputs(db_aadhaar, db_pan, db_gst, stats)
+
+    owner_score = calculate_owner_score(
+        aadhaar_verified=inputs["aadhaar_verified"],
+        pan_linked=inputs["pan_linked"],
+        blacklist_flag=inputs["blacklist_flag"],
+        defaults_count=inputs["defaults_count"],
+        mismatch=inputs["mismatch"]
+    )
+
+    # 2. Company Score (40%)
+    company_score = 600
+    if inputs["has_company"]:
+        with stage("company_scoring"):
+            company_score = calculate_company_score(
+                gst_active=True,
+                compliance_avg=inputs["compliance_avg"],
+                company_age_years=inputs["company_age_years"],
+                is_suspended=inputs["is_suspended"]
+            )
+
+    # 3. Transaction Score (20%) - 650 when there is no company or no invoice history
+    with stage("transaction_scoring"):
+        transaction_score = calculate_transaction_score(
+            total_invoices=inputs["total_invoices"],
+            paid_ratio=inputs["paid_ratio"],
+            default_ratio=inputs["default_ratio"],
+            avg_delay_days=inputs["avg_delay_days"]
+        )
+
+    # Final Score
+    credit_score = calculate_final_credit_score(owner_score, company_score, transaction_score)
+
+    return build_verification_result(inputs, owner_score, company_score, transaction_score, credit_score)
+
+def score_verifications(inputs_list: list) -> list:
+    """Vectorized score_verification over many scoring_inputs() dicts; identical results"""
+    if not inputs_list:
+        return []
+    columns = {key: np.array([inputs[key] for inputs in inputs_list]) for key in inputs_list[0]}
+
+    owner_scores = calculate_owner_score_batch(
+        columns["aadhaar_verified"], columns["pan_linked"], columns["blacklist_flag"],
+        columns["defaults_count"], columns["mismatch"]
+    )
+    company_scores = np.where(
+        columns["has_company"],
+        calculate_company_score_batch(True, columns["compliance_avg"], columns["company_age_years"], columns["is_suspended"]),
+        600
+    )
+    transaction_scores = calculate_transaction_score_batch(
+        columns["total_invoices"], columns["paid_ratio"], columns["default_ratio"], columns["avg_delay_days"]
+    )
+    credit_scores = calculate_final_credit_score_batch(owner_scores, company_scores, transaction_scores)
+
+    return [
+        build_verification_result(inputs, owner, company, transaction, credit)
+        for inputs, owner, company, transaction, credit in zip(
+            inputs_list, owner_scores.tolist(), company_scores.tolist(),
+            transaction_scores.tolist(), credit_scores.tolist()
+        )
+    ]
+
+def verification_log_row(request: VerificationCheckRequest, result: dict) -> dict:
+    return {
+        "gst_number": request.gst_number,
+        "aadhaar_number": request.aadhaar_number,
+        "pan_number": request.pan_number,
+        "owner_score": result["owner_score"],
+        "company_score": result["company_score"],
+        "transaction_score": result["transaction_score"],
+        "credit_score": result["credit_score"],
+        "risk_category": result["risk_category"],
+        "recommendation": result["recommendation"],
+    }
+
+def audit_log_row(request: VerificationCheckRequest) -> dict:
+    return {
+        "actor": "EXTERNAL_GATEWAY",
+        "action": "EVALUATE_CREDIT",
+        "entity": "GSTCompany",
+        "entity_id": request.gst_number,
+    }
+
+def record_verification(db: Session, request: VerificationCheckRequest, result: dict):
+    """Logs one verification attempt (also used for cache hits, so the audit trail is unchanged)"""
+    with stage("log_writes"):
+        log_sink.verification(db, **verification_log_row(request, result))
+        log_sink.audit(db, **audit_log_row(request))
+        db.commit()
+
+@router.post("/full-check")
+def verify_full_check(request: VerificationCheckRequest, db: Session = Depends(get_db)):
+
+    # 1. Verification of identity & linkage
+    with stage("identity_lookup"):
+        db_aadhaar = db.query(AadhaarProfile).filter(AadhaarProfile.aadhaar_number == request.aadhaar_number).first()
+
+    # Secure OTP Check
+    with stage("otp_check"):
+        # Durable history, so the check still passes after the code itself has expired and been purged
+        otp_log = db.query(OTPHistory.id).filter(
+            OTPHistory.identity_type == "AADHAAR",
+            OTPHistory.identity_value == request.aadhaar_number,
+            OTPHistory.event == VERIFIED
+        ).first()
+
+    if not otp_log:
+        raise HTTPException(status_code=400, detail="Aadhaar OTP verification is required before full check")
+
+    if not db_aadhaar:
+        raise HTTPException(status_code=404, detail="Aadhaar not found")
+
+    with stage("identity_lookup"):
+        db_pan = db.query(PANProfile).filter(PANProfile.pan_number == request.pan_number).first()
+        db_gst = db.query(GSTCompany).filter(GSTCompany.gst_number == request.gst_number).first()
+
+    # Running totals maintained on every invoice/return write: one row read per company
+    with stage("company_scoring"):
+        stats = get_company_stats(db, db_gst.id) if db_gst else None
+
+    response = score_verification(db_aadhaar, db_pan, db_gst, stats)
+
+    record_verification(db, request, response)
+
+    return response
+
+async def _first_row(stmt, stage_name):
+    # Each lookup gets its own session (and pooled connection) so they can run concurrently
+    with stage(stage_name):
+        async with AsyncSessionLocal() as session:
+            return (await session.execute(stmt)).first()
+
+async def verify_full_check_async(request: VerificationCheckRequest, db: AsyncSession):
+    """
+    Non-blocking form of verify_full_check for async endpoints. The Aadhaar, OTP, PAN and
+    GST/stats lookups are independent, so they are issued concurrently instead of one
+    round trip after another; scoring and logging are shared with the sync path.
+    """
+    aadhaar_row, otp_row, pan_row, gst_row = await asyncio.gather(
+        _first_row(select(AadhaarProfile).where(AadhaarProfile.aadhaar_number == request.aadhaar_number), "identity_lookup"),
+        _first_row(
+            select(OTPHistory.id).where(
+                OTPHistory.identity_type == "AADHAAR",
+                OTPHistory.identity_value == request.aadhaar_number,
+                OTPHistory.event == VERIFIED
+            ).limit(1),
+            "otp_check"
+        ),
+        _first_row(select(PANProfile).where(PANProfile.pan_number == request.pan_number), "identity_lookup"),
+        _first_row(
+            select(GSTCompany, CompanyCreditStats)
+            .outerjoin(CompanyCreditStats, CompanyCreditStats.company_id == GSTCompany.id)
+            .where(GSTCompany.gst_number == request.gst_number),
+            "company_scoring"
+        ),
+    )
+
+    if not otp_row:
+        raise HTTPException(status_code=400, detail="Aadhaar OTP verification is required before full check")
+
+    if not aadhaar_row:
+        raise HTTPException(status_code=404, detail="Aadhaar not found")
+
+    db_gst, stats = gst_row if gst_row else (None, None)
+    if db_gst and stats is None:
+        # Company has no stats row yet: fall back to the live aggregate
+        with stage("company_scoring"):
+            stats = await db.run_sync(get_company_stats, db_gst.id)
+
+    response = score_verification(aadhaar_row[0], pan_row[0] if pan_row else None, db_gst, stats)
+
+    await record_verification_async(db, request, response)
+
+    return response
+
+async def record_verification_async(db: AsyncSession, request: VerificationCheckRequest, result: dict):
+    with stage("log_writes"):
+        await log_sink.verification_async(db, **verification_log_row(request, result))
+        await log_sink.audit_async(db, **audit_log_row(request))
+        await db.commit()
+
+@router.post("/batch-check")
+def verify_batch_check(batch: VerificationBatchRequest, db: Session = Depends(get_db)):
+    """
+    Evaluates many triples at once. Every lookup is a single set-based IN query over
+    the whole batch, and the log rows are written with one bulk insert per table.
+    Each item carries its own result or error.
+    """
+    items = batch.items
+    aadhaar_numbers = {item.aadhaar_number for item in items}
+    pan_numbers = {item.pan_number for item in items}
+    gst_numbers = {item.gst_number for item in items}
+
+    aadhaars = {
+        a.aadhaar_number: a for a in
+        db.query(AadhaarProfile).filter(AadhaarProfile.aadhaar_number.in_(aadhaar_numbers))
+    }
+    otp_verified = {
+        value for (value,) in db.query(OTPHistory.identity_value).filter(
+            OTPHistory.identity_type == "AADHAAR",
+            OTPHistory.identity_value.in_(aadhaar_numbers),
+            OTPHistory.event == VERIFIED
+        ).distinct()
+    }
+    pans = {
+        p.pan_number: p for p in
+        db.query(PANProfile).filter(PANProfile.pan_number.in_(pan_numbers))
+    }
+    companies = {
+        c.gst_number: c for c in
+        db.query(GSTCompany).filter(GSTCompany.gst_number.in_(gst_numbers))
+    }
+    stats = get_companies_stats(db, [c.id for c in companies.values()])
+
+    results = []
+    scored = []
+    inputs_list = []
+    verification_rows = []
+    audit_rows = []
+    for index, item in enumerate(items):
+        entry = {
+            "index": index,
+            "gst_number": item.gst_number,
+            "aadhaar_number": item.aadhaar_number,
+            "pan_number": item.pan_number,
+            "result": None,
+            "error": None,
+        }
+        results.append(entry)
+
+        if item.aadhaar_number not in otp_verified:
+            entry["error"] = {"status_code": 400, "detail": "Aadhaar OTP verification is required before full check"}
+            continue
+        db_aadhaar = aadhaars.get(item.aadhaar_number)
+        if not db_aadhaar:
+            entry["error"] = {"status_code": 404, "detail": "Aadhaar not found"}
+            continue
+
+        db_gst = companies.get(item.gst_number)
+        scored.append(entry)
+        inputs_list.append(scoring_inputs(
+            db_aadhaar,
+            pans.get(item.pan_number),
+            db_gst,
+            stats.get(db_gst.id) if db_gst else None
+        ))
+
+    # Score every resolved item in one vectorized pass
+    for entry, result in zip(scored, score_verifications(inputs_list)):
+        item = items[entry["index"]]
+        entry["result"] = result
+        verification_rows.append(verification_log_row(item, result))
+        audit_rows.append(audit_log_row(item))
+
+    if verification_rows:
+        log_sink.verification_many(db, verification_rows)
+        log_sink.audit_many(db, audit_rows)
+        db.commit()
+
+    return {
+        "total": len(results),
+        "succeeded": len(verification_rows),
+        "failed": len(results) - len(verification_rows),
+        "results": results
+    }
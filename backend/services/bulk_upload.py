@@ -0,0 +1,80 @@
+import io
+import csv
+import json
+import tempfile
+
+from fastapi import HTTPException, Request
+from pydantic import ValidationError
+
+# Raw upload bodies above this size are spooled to disk instead of held in memory
+UPLOAD_SPOOL_BYTES = 16 * 1024 * 1024
+
+async def spool_upload(request: Request):
+    """
+    Returns (binary file object, "csv" or "ndjson") for a raw CSV/NDJSON body or a
+    multipart upload's "file" field, without holding a large body in memory.
+    """
+    content_type = request.headers.get("content-type", "application/x-ndjson")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Multipart upload needs a 'file' field")
+        is_csv = (upload.filename or "").lower().endswith(".csv") or "csv" in (upload.content_type or "")
+        return upload.file, "csv" if is_csv else "ndjson"
+
+    stream = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES)
+    async for chunk in request.stream():
+        stream.write(chunk)
+    stream.seek(0)
+    return stream, "csv" if "csv" in content_type else "ndjson"
+
+def iter_records(stream, fmt: str):
+    """
+    Yields (line, record, error) from a binary CSV or NDJSON stream without reading it
+    whole. CSV needs a header row; blank CSV cells and JSON nulls count as missing.
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, {key: value for key, value in row.items() if key and value not in ("", None)}, None
+        return
+    for line, raw in enumerate(text, start=1):
+        if not raw.strip():
+            continue
+        try:
+            record = json.loads(raw)
+        except ValueError:
+            yield line, None, "Line is not valid JSON"
+            continue
+        if not isinstance(record, dict):
+            yield line, None, "Line is not a JSON object"
+            continue
+        yield line, {key: value for key, value in record.items() if value is not None}, None
+
+def validation_message(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in e['loc'])}: {e['msg']}" for e in error.errors())
+
+def write_rows(db, table, columns, rows):
+    """
+    Bulk-inserts row dicts in the session's transaction: COPY on Postgres (no
+    per-row statement overhead), executemany elsewhere. Columns left out, such as
+    created_at, take their server defaults.
+    """
+    if not rows:
+        return
+    conn = db.connection()
+    if conn.dialect.name != "postgresql":
+        conn.execute(table.insert(), [{column: row[column] for column in columns} for row in rows])
+        return
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[column] for column in columns])
+    buffer.seek(0)
+    cursor = conn.connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
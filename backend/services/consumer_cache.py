@@ -0,0 +1,226 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+from database import SessionLocal
+from models.database_models import ExternalConsumer
+
+CONSUMER_CACHE_REFRESH_SECONDS = float(os.getenv("CONSUMER_CACHE_REFRESH_SECONDS", "60"))
+CONSUMER_CACHE_NEGATIVE_TTL_SECONDS = float(os.getenv("CONSUMER_CACHE_NEGATIVE_TTL_SECONDS", "30"))
+CONSUMER_CACHE_NEGATIVE_MAX_ENTRIES = int(os.getenv("CONSUMER_CACHE_NEGATIVE_MAX_ENTRIES", "100000"))
+
+# Shape of the keys issued by /external/generate-keys; anything else is rejected without a lookup
+API_KEY_PATTERN = re.compile(r"^api_[0-9a-f]{32}$")
+
+# Returned by get() when the cache has no answer either way and the caller must ask the database
+MISSING = object()
+
+class ConsumerCredentials(NamedTuple):
+    id: str
+    name: str
+    api_key: str
+    webhook_secret: str
+    rate_limit_per_second: float = None
+    rate_limit_burst: int = None
+    webhook_url: str = None
+    webhook_events: str = None
+
+    @classmethod
+    def from_model(cls, consumer: ExternalConsumer):
+        return cls(
+            consumer.id, consumer.name, consumer.api_key, consumer.webhook_secret,
+            consumer.rate_limit_per_second, consumer.rate_limit_burst,
+            consumer.webhook_url, consumer.webhook_events
+        )
+
+    def subscribes_to(self, event_type: str) -> bool:
+        if not self.webhook_url:
+            return False
+        return not self.webhook_events or event_type in self.webhook_events.split(",")
+
+class ConsumerKeyCache:
+    """
+    Credentials of every active ExternalConsumer, held in memory so the HMAC gateway
+    authenticates without touching the database.
+
+    The whole table is loaded at start() and reloaded by a background thread every
+    refresh_interval. Keys issued, rotated or revoked in this process are applied
+    immediately; other workers pick them up on their next reload (a key they have not
+    seen yet is looked up once on demand). Unknown keys are remembered for
+    negative_ttl so a flood of bad keys costs at most one query per distinct key.
+    get() never queries the database itself: if the cache was never started or the
+    refresher has stalled, it starts a one-off reload in the background and answers
+    from what it has meanwhile.
+    """
+
+    def __init__(self, refresh_interval=CONSUMER_CACHE_REFRESH_SECONDS,
+                 negative_ttl=CONSUMER_CACHE_NEGATIVE_TTL_SECONDS,
+                 negative_max_entries=CONSUMER_CACHE_NEGATIVE_MAX_ENTRIES):
+        self.refresh_interval = refresh_interval
+        self.negative_ttl = negative_ttl
+        self.negative_max_entries = negative_max_entries
+
+        self._by_key = {}
+        self._negative = OrderedDict()
+        self._changes = [] # upserts/revocations made while a reload is reading the table
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._reload_attempted_at = None # last background reload started by get()
+        self._stop = threading.Event()
+        self._thread = None
+        self.counters = {"hits": 0, "negative_hits": 0, "rejected_malformed": 0, "misses": 0, "reloads": 0}
+
+    # --- Lookups ---
+
+    def get(self, api_key: str):
+        """
+        Returns the cached ConsumerCredentials, None if the key is known to be invalid,
+        or MISSING if the caller has to look it up and report back through remember().
+        """
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_interval * 2:
+            # Not started (scripts, tests) or the refresher has stalled
+            self._reload_in_background()
+
+        if not API_KEY_PATTERN.match(api_key):
+            self.counters["rejected_malformed"] += 1
+            return None
+
+        with self._lock:
+            credentials = self._by_key.get(api_key)
+            if credentials is not None:
+                self.counters["hits"] += 1
+                return credentials
+
+            expires_at = self._negative.get(api_key)
+            if expires_at is not None:
+                if expires_at > time.monotonic():
+                    self.counters["negative_hits"] += 1
+                    return None
+                del self._negative[api_key]
+
+        self.counters["misses"] += 1
+        return MISSING
+
+    def remember(self, api_key: str, consumer):
+        """Records the outcome of a lookup that get() could not answer; returns what get() now would"""
+        if consumer is not None and consumer.is_active:
+            return self.upsert(consumer)
+        self._remember_negative(api_key)
+        return None
+
+    def _remember_negative(self, api_key):
+        with self._lock:
+            self._negative[api_key] = time.monotonic() + self.negative_ttl
+            self._negative.move_to_end(api_key)
+            while len(self._negative) > self.negative_max_entries:
+                self._negative.popitem(last=False)
+
+    # --- Key lifecycle events ---
+
+    def upsert(self, consumer: ExternalConsumer):
+        credentials = ConsumerCredentials.from_model(consumer)
+        with self._lock:
+            self._negative.pop(credentials.api_key, None)
+            self._by_key[credentials.api_key] = credentials
+            self._changes.append((credentials.api_key, credentials))
+        return credentials
+
+    def revoke(self, api_key: str):
+        with self._lock:
+            self._by_key.pop(api_key, None)
+            self._changes.append((api_key, None))
+        self._remember_negative(api_key)
+
+    # --- Loading ---
+
+    def reload(self):
+        with self._lock:
+            self._changes = []
+        db = SessionLocal()
+        try:
+            rows = db.query(
+                ExternalConsumer.id, ExternalConsumer.name, ExternalConsumer.api_key, ExternalConsumer.webhook_secret,
+                ExternalConsumer.rate_limit_per_second, ExternalConsumer.rate_limit_burst,
+                ExternalConsumer.webhook_url, ExternalConsumer.webhook_events
+            ).filter(ExternalConsumer.is_active == True).all()
+        finally:
+            db.close()
+
+        by_key = {row.api_key: ConsumerCredentials(*row) for row in rows}
+        with self._lock:
+            # Re-apply events from this process that the snapshot may predate (e.g. a key revoked mid-read)
+            for api_key, credentials in self._changes:
+                if credentials is None:
+                    by_key.pop(api_key, None)
+                else:
+                    by_key[api_key] = credentials
+            self._changes = []
+            self._by_key = by_key
+            # A key may have been issued elsewhere since it was negatively cached
+            for api_key in by_key.keys() & self._negative.keys():
+                del self._negative[api_key]
+            self._loaded_at = time.monotonic()
+        self.counters["reloads"] += 1
+
+    def _reload_in_background(self):
+        """
+        Starts one reload thread, at most once per refresh_interval, and returns at once:
+        get() runs on the event loop. Until it lands, keys missing from the (possibly
+        empty) map come back as MISSING and are looked up by the caller.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._reload_attempted_at is not None and now - self._reload_attempted_at < self.refresh_interval:
+                return
+            self._reload_attempted_at = now
+        threading.Thread(target=self._reload_logged, name="consumer-cache-reload", daemon=True).start()
+
+    def _reload_logged(self):
+        try:
+            self.reload()
+        except Exception as e:
+            # Keep serving the last good snapshot
+            print(f"[CONSUMER CACHE ERROR] {str(e)}")
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_interval):
+            self._reload_logged()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self.reload()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="consumer-cache-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=5)
+        self._thread = None
+
+    def get_by_id(self, consumer_id: str):
+        with self._lock:
+            return next((c for c in self._by_key.values() if c.id == consumer_id), None)
+
+    def subscribers(self, event_type: str) -> list:
+        """Active consumers with a webhook URL subscribed to this event type"""
+        if self._loaded_at is None:
+            self.reload()
+        with self._lock:
+            return [c for c in self._by_key.values() if c.subscribes_to(event_type)]
+
+    def stats(self) -> dict:
+        return {
+            "consumers": len(self._by_key),
+            "negative_entries": len(self._negative),
+            "refresh_interval_seconds": self.refresh_interval,
+            **self.counters,
+        }
+
+consumer_cache = ConsumerKeyCache()
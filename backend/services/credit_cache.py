@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+
+CREDIT_CACHE_BACKEND = os.getenv("CREDIT_CACHE_BACKEND", "MEMORY") # MEMORY, REDIS, LOCAL
+CREDIT_CACHE_TTL_SECONDS = int(os.getenv("CREDIT_CACHE_TTL_SECONDS", "300"))
+CREDIT_CACHE_MAX_ENTRIES = int(os.getenv("CREDIT_CACHE_MAX_ENTRIES", "50000"))
+
+class LocalKeyValueStore:
+    """
+    In-process stand-in for a shared key-value store. Implements the small Redis
+    subset the shared backends rely on (get / set with ex and nx / incr / delete / mget),
+    so it can replace a real Redis client in development and tests.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _alive(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key):
+        with self._lock:
+            entry = self._alive(key)
+            return entry[0] if entry else None
+
+    def mget(self, keys):
+        with self._lock:
+            return [entry[0] if entry else None for entry in map(self._alive, keys)]
+
+    def set(self, key, value, ex=None, nx=False):
+        with self._lock:
+            if nx and self._alive(key):
+                return None
+            self._data[key] = (value, time.monotonic() + ex if ex else None)
+        return True
+
+    def incr(self, key, amount=1):
+        with self._lock:
+            entry = self._alive(key)
+            value = int(entry[0]) + amount if entry else amount
+            self._data[key] = (value, entry[1] if entry else None)
+            return value
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(1 for key in keys if self._data.pop(key, None) is not None)
+
+class InMemoryCacheBackend:
+    """Per-process TTL + LRU cache. Versions live in a separate map that is never evicted."""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = CREDIT_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: int):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_versions(self, names):
+        with self._lock:
+            return [self._versions.get(name, 0) for name in names]
+
+    def bump_version(self, name):
+        with self._lock:
+            self._versions[name] = self._versions.get(name, 0) + 1
+
+    def size(self):
+        return len(self._entries)
+
+class SharedStoreCacheBackend:
+    """
+    Cache shared by all workers through a Redis-compatible client. TTL is enforced by
+    the store (SET ... EX) and LRU eviction by its maxmemory policy (allkeys-lru).
+    Version counters are plain INCR keys without expiry.
+    """
+
+    name = "shared"
+
+    def __init__(self, client, prefix: str = "credit-cache"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(f"{self.prefix}:entry:{key}")
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl: int):
+        self.client.set(f"{self.prefix}:entry:{key}", json.dumps(value), ex=ttl)
+
+    def get_versions(self, names):
+        return [int(v) if v is not None else 0 for v in self.client.mget([f"{self.prefix}:version:{n}" for n in names])]
+
+    def bump_version(self, name):
+        self.client.incr(f"{self.prefix}:version:{name}")
+
+    def size(self):
+        return None
+
+class CreditEvaluationCache:
+    """
+    Caches scored credit evaluations per (gst_number, aadhaar_number, pan_number).
+    Every entry key embeds the current versions of the company, the Aadhaar and the PAN,
+    so bumping any of them makes the old entries unreachable (they then age out via TTL/LRU).
+    """
+
+    def __init__(self, backend, ttl_seconds: int = CREDIT_CACHE_TTL_SECONDS):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _version_names(gst_number, aadhaar_number, pan_number):
+        return [f"company:{gst_number}", f"aadhaar:{aadhaar_number}", f"pan:{pan_number}"]
+
+    def lookup(self, gst_number: str, aadhaar_number: str, pan_number: str):
+        """
+        Returns (cache_key, cached_result or None). Pass the key back to store(): it was
+        built from the versions read *before* evaluating, so a result computed while a
+        change was being committed is stored under a key that is already stale.
+        """
+        versions = self.backend.get_versions(self._version_names(gst_number, aadhaar_number, pan_number))
+        cache_key = ":".join([gst_number, aadhaar_number, pan_number, *map(str, versions)])
+        cached = self.backend.get(cache_key)
+        if cached is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return cache_key, cached
+
+    def store(self, cache_key: str, result: dict):
+        self.backend.set(cache_key, result, self.ttl_seconds)
+
+    def invalidate_company(self, gst_number: str):
+        self.backend.bump_version(f"company:{gst_number}")
+
+    def invalidate_identity(self, aadhaar_number: str = None, pan_number: str = None):
+        if aadhaar_number:
+            self.backend.bump_version(f"aadhaar:{aadhaar_number}")
+        if pan_number:
+            self.backend.bump_version(f"pan:{pan_number}")
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "backend": self.backend.name,
+            "ttl_seconds": self.ttl_seconds,
+            "entries": self.backend.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+def _backend_from_env():
+    if CREDIT_CACHE_BACKEND == "MEMORY":
+        return InMemoryCacheBackend()
+    elif CREDIT_CACHE_BACKEND == "REDIS":
+        import redis # Optional dependency, only needed for the shared backend
+        return SharedStoreCacheBackend(redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0")))
+    elif CREDIT_CACHE_BACKEND == "LOCAL":
+        return SharedStoreCacheBackend(LocalKeyValueStore())
+    else:
+        raise ValueError(f"Unknown credit cache backend: {CREDIT_CACHE_BACKEND}")
+
+credit_cache = CreditEvaluationCache(_backend_from_env())
@@ -1,3 +1,7 @@
+import numpy as np
+from services.profiling import profiled
+
+@profiled("credit_engine.calculate_owner_score")
 def calculate_owner_score(aadhaar_verified: bool, pan_linked: bool, blacklist_flag: bool, defaults_count: int, mismatch: bool = False) -> int:
     score = 700
 
@@ -17,6 +21,7 @@ def calculate_owner_score(aadhaar_verified: bool, pan_linked: bool, blacklist_fl
     
     return max(0, min(1000, score))
 
+@profiled("credit_engine.calculate_company_score")
 def calculate_company_score(gst_active: bool, compliance_avg: int, company_age_years: int, is_suspended: bool) -> int:
     score = 600
     
@@ -34,6 +39,7 @@ def calculate_company_score(gst_active: bool, compliance_avg: int, company_age_y
     score = base_comp - penalties
     return int(max(0, min(1000, score)))
 
+@profiled("credit_engine.calculate_transaction_score")
 def calculate_transaction_score(total_invoices: int, paid_ratio: float, default_ratio: float, avg_delay_days: float) -> int:
     if total_invoices == 0:
         return 650
@@ -57,9 +63,97 @@ def calculate_transaction_score(total_invoices: int, paid_ratio: float, default_
     
     return max(0, min(1000, score))
 
+@profiled("credit_engine.calculate_final_credit_score")
 def calculate_final_credit_score(owner_score: int, company_score: int, transaction_score: int) -> int:
     """ Computes the final credit score based on the weighted components
     Owner: 40%, Company: 40%, Transaction: 20%
     """
     final_score = (owner_score * 0.4) + (company_score * 0.4) + (transaction_score * 0.2)
     return int(final_score)
+
+
+def get_risk_category(score: int) -> str:
+    if score <= 300:
+        return "HIGH_RISK"
+    elif score <= 600:
+        return "MEDIUM_RISK"
+    elif score <= 800:
+        return "LOW_RISK"
+    else:
+        return "EXCELLENT"
+
+def get_recommendation(risk_cat: str) -> str:
+    if risk_cat in ["HIGH_RISK", "MEDIUM_RISK"]:
+        return "REJECT"
+    else:
+        return "APPROVE"
+
+# --- Vectorized (batch) scoring ---
+# Array versions of the scorers above: each takes equal-length NumPy arrays (or anything
+# np.asarray accepts) and returns an int64 array element-wise identical to the scalar function.
+
+@profiled("credit_engine.calculate_owner_score_batch")
+def calculate_owner_score_batch(aadhaar_verified, pan_linked, blacklist_flag, defaults_count, mismatch=None) -> np.ndarray:
+    aadhaar_verified = np.asarray(aadhaar_verified, dtype=bool)
+    pan_linked = np.asarray(pan_linked, dtype=bool)
+    blacklist_flag = np.asarray(blacklist_flag, dtype=bool)
+    defaults_count = np.asarray(defaults_count, dtype=np.int64)
+    mismatch = np.zeros_like(pan_linked) if mismatch is None else np.asarray(mismatch, dtype=bool)
+
+    score = np.full(pan_linked.shape, 700, dtype=np.int64)
+    score += np.where(aadhaar_verified, 100, 0)
+    score += np.where(pan_linked, 50, -200)
+    score -= np.where(blacklist_flag, 500, 0)
+    score -= np.where(mismatch, 150, 0)
+    score -= defaults_count * 100
+
+    return np.clip(score, 0, 1000)
+
+@profiled("credit_engine.calculate_company_score_batch")
+def calculate_company_score_batch(gst_active, compliance_avg, company_age_years, is_suspended) -> np.ndarray:
+    compliance_avg = np.asarray(compliance_avg, dtype=np.float64)
+    company_age_years = np.asarray(company_age_years, dtype=np.float64)
+    is_suspended = np.asarray(is_suspended, dtype=bool)
+
+    compliance_component = np.minimum(1000, compliance_avg * 10)
+    age_bonus = np.minimum(200, company_age_years * 20)
+
+    base_comp = (compliance_component * 0.7) + (age_bonus * 0.3)
+
+    penalties = np.where(is_suspended, 500, 0) + np.where(compliance_avg < 50, 150, 0)
+
+    score = base_comp - penalties
+    # Clipped to >= 0 first, so truncation matches int()
+    return np.trunc(np.clip(score, 0, 1000)).astype(np.int64)
+
+@profiled("credit_engine.calculate_transaction_score_batch")
+def calculate_transaction_score_batch(total_invoices, paid_ratio, default_ratio, avg_delay_days) -> np.ndarray:
+    total_invoices = np.asarray(total_invoices, dtype=np.int64)
+    paid_ratio = np.asarray(paid_ratio, dtype=np.float64)
+    default_ratio = np.asarray(default_ratio, dtype=np.float64)
+    avg_delay_days = np.asarray(avg_delay_days, dtype=np.float64)
+
+    score = np.full(total_invoices.shape, 700, dtype=np.int64)
+    score += np.where(paid_ratio > 0.8, 100, np.where(paid_ratio > 0.6, 50, 0))
+    score -= np.where(default_ratio > 0.4, 400, np.where(default_ratio > 0.2, 200, 0))
+    score -= np.where(avg_delay_days > 60, 200, np.where(avg_delay_days > 30, 100, 0))
+
+    return np.where(total_invoices == 0, 650, np.clip(score, 0, 1000))
+
+@profiled("credit_engine.calculate_final_credit_score_batch")
+def calculate_final_credit_score_batch(owner_score, company_score, transaction_score) -> np.ndarray:
+    """ Array form of calculate_final_credit_score (Owner: 40%, Company: 40%, Transaction: 20%) """
+    owner_score = np.asarray(owner_score, dtype=np.float64)
+    company_score = np.asarray(company_score, dtype=np.float64)
+    transaction_score = np.asarray(transaction_score, dtype=np.float64)
+
+    final_score = (owner_score * 0.4) + (company_score * 0.4) + (transaction_score * 0.2)
+    return np.trunc(final_score).astype(np.int64)
+
+def get_risk_category_batch(score) -> np.ndarray:
+    score = np.asarray(score)
+    return np.select(
+        [score <= 300, score <= 600, score <= 800],
+        ["HIGH_RISK", "MEDIUM_RISK", "LOW_RISK"],
+        default="EXCELLENT"
+    )
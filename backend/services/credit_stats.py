@@ -0,0 +1,190 @@
+from sqlalchemy import func, case, update
+from sqlalchemy.orm import Session
+from database import dialect_insert
+from models.database_models import CompanyCreditStats, GSTCompany, Invoice, GSTReturn
+
+STATUS_COLUMNS = {
+    "PAID": "paid_count",
+    "UNPAID": "unpaid_count",
+    "DEFAULTED": "defaulted_count",
+}
+
+def _aggregate_company(db: Session, company_id: str) -> dict:
+    """Computes the stats row for one company straight from invoice/gst_return"""
+    invoice_count, paid_count, unpaid_count, defaulted_count, delay_days_sum = db.query(
+        func.count(Invoice.id),
+        func.coalesce(func.sum(case((Invoice.status == "PAID", 1), else_=0)), 0),
+        func.coalesce(func.sum(case((Invoice.status == "UNPAID", 1), else_=0)), 0),
+        func.coalesce(func.sum(case((Invoice.status == "DEFAULTED", 1), else_=0)), 0),
+        func.coalesce(func.sum(Invoice.delay_days), 0)
+    ).filter(Invoice.company_id == company_id).one()
+
+    return_count, compliance_sum = db.query(
+        func.count(GSTReturn.id),
+        func.coalesce(func.sum(GSTReturn.compliance_score), 0)
+    ).filter(GSTReturn.company_id == company_id).one()
+
+    return {
+        "invoice_count": invoice_count,
+        "paid_count": paid_count,
+        "unpaid_count": unpaid_count,
+        "defaulted_count": defaulted_count,
+        "delay_days_sum": delay_days_sum,
+        "return_count": return_count,
+        "compliance_sum": compliance_sum,
+    }
+
+def _apply_deltas(db: Session, company_id: str, deltas: dict):
+    """
+    Adds the deltas to the company's stats row inside the caller's transaction.
+    Must run before the invoice/return change itself is flushed, so that a missing
+    row can be seeded from the data as it was before this change.
+    """
+    values = {name: getattr(CompanyCreditStats, name) + delta for name, delta in deltas.items() if delta}
+    if not values:
+        return
+    stmt = update(CompanyCreditStats).where(CompanyCreditStats.company_id == company_id).values(**values)
+
+    if db.execute(stmt).rowcount == 0:
+        # Company predates the stats table and the backfill hasn't run yet
+        insert = dialect_insert(db)
+        db.execute(
+            insert(CompanyCreditStats)
+            .values(company_id=company_id, **_aggregate_company(db, company_id))
+            .on_conflict_do_nothing(index_elements=["company_id"])
+        )
+        db.execute(stmt)
+
+def init_company_stats(db: Session, company_id: str):
+    db.add(CompanyCreditStats(company_id=company_id))
+
+def init_companies_stats(db: Session, company_ids: list):
+    if company_ids:
+        db.execute(CompanyCreditStats.__table__.insert(), [{"company_id": company_id} for company_id in company_ids])
+
+def record_invoice(db: Session, company_id: str, status: str, delay_days: int):
+    deltas = {"invoice_count": 1, "delay_days_sum": delay_days or 0}
+    deltas[STATUS_COLUMNS[status]] = 1
+    _apply_deltas(db, company_id, deltas)
+
+def record_invoices(db: Session, invoices):
+    """
+    record_invoice() for a batch of (company_id, status, delay_days): deltas are summed
+    per company and applied with one multi-row upsert. Like _apply_deltas it must run
+    before the invoices are flushed, so a missing stats row is seeded from the data as
+    it was before the batch.
+    """
+    totals = {}
+    for company_id, status, delay_days in invoices:
+        deltas = totals.setdefault(company_id, {"invoice_count": 0, "paid_count": 0, "unpaid_count": 0, "defaulted_count": 0, "delay_days_sum": 0})
+        deltas["invoice_count"] += 1
+        deltas["delay_days_sum"] += delay_days or 0
+        deltas[STATUS_COLUMNS[status]] += 1
+    if not totals:
+        return
+
+    insert = dialect_insert(db)
+    company_ids = list(totals)
+    # Chunked like the upsert below: one statement must stay under SQLite's bound-variable limit
+    for i in range(0, len(company_ids), 1000):
+        chunk = company_ids[i:i + 1000]
+        existing = {company_id for (company_id,) in db.query(CompanyCreditStats.company_id).filter(CompanyCreditStats.company_id.in_(chunk))}
+        missing = set(chunk) - existing
+        if missing:
+            # Companies that predate the stats table and the backfill hasn't run yet
+            seeds = [{"company_id": company_id, **aggregate} for company_id, aggregate in _aggregate_companies(db, missing).items()]
+            if seeds:
+                db.execute(insert(CompanyCreditStats).values(seeds).on_conflict_do_nothing(index_elements=["company_id"]))
+
+    rows = [{"company_id": company_id, **deltas} for company_id, deltas in totals.items()]
+    for i in range(0, len(rows), 1000):
+        stmt = insert(CompanyCreditStats).values(rows[i:i + 1000])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["company_id"],
+            set_={name: getattr(CompanyCreditStats, name) + getattr(stmt.excluded, name) for name in rows[0] if name != "company_id"}
+        )
+        db.execute(stmt)
+
+def record_invoice_update(db: Session, company_id: str, old_status: str, old_delay_days: int, new_status: str, new_delay_days: int):
+    deltas = {"delay_days_sum": (new_delay_days or 0) - (old_delay_days or 0)}
+    if old_status != new_status:
+        if old_status in STATUS_COLUMNS:
+            deltas[STATUS_COLUMNS[old_status]] = -1
+        deltas[STATUS_COLUMNS[new_status]] = 1
+    _apply_deltas(db, company_id, deltas)
+
+def record_return(db: Session, company_id: str, compliance_score: int):
+    _apply_deltas(db, company_id, {"return_count": 1, "compliance_sum": compliance_score or 0})
+
+def get_company_stats(db: Session, company_id: str) -> CompanyCreditStats:
+    """
+    Single primary-key read of the company's running totals. Falls back to a live
+    aggregate (returned as a transient, unsaved row) if the company has no stats yet.
+    """
+    stats = db.get(CompanyCreditStats, company_id)
+    if stats is None:
+        stats = CompanyCreditStats(company_id=company_id, **_aggregate_company(db, company_id))
+    return stats
+
+def get_companies_stats(db: Session, company_ids) -> dict:
+    """Batch form of get_company_stats: company_id -> stats row, one IN query plus grouped fallbacks"""
+    company_ids = set(company_ids)
+    if not company_ids:
+        return {}
+    stats = {
+        s.company_id: s for s in
+        db.query(CompanyCreditStats).filter(CompanyCreditStats.company_id.in_(company_ids))
+    }
+    missing = company_ids - stats.keys()
+    if missing:
+        for company_id, totals in _aggregate_companies(db, missing).items():
+            stats[company_id] = CompanyCreditStats(company_id=company_id, **totals)
+    return stats
+
+def _aggregate_companies(db: Session, company_ids=None) -> dict:
+    """Grouped form of _aggregate_company over the given companies (all companies if None)"""
+    invoice_query = db.query(
+        Invoice.company_id,
+        func.count(Invoice.id),
+        func.coalesce(func.sum(case((Invoice.status == "PAID", 1), else_=0)), 0),
+        func.coalesce(func.sum(case((Invoice.status == "UNPAID", 1), else_=0)), 0),
+        func.coalesce(func.sum(case((Invoice.status == "DEFAULTED", 1), else_=0)), 0),
+        func.coalesce(func.sum(Invoice.delay_days), 0)
+    )
+    return_query = db.query(
+        GSTReturn.company_id,
+        func.count(GSTReturn.id),
+        func.coalesce(func.sum(GSTReturn.compliance_score), 0)
+    )
+    company_query = db.query(GSTCompany.id)
+    if company_ids is not None:
+        invoice_query = invoice_query.filter(Invoice.company_id.in_(company_ids))
+        return_query = return_query.filter(GSTReturn.company_id.in_(company_ids))
+        company_query = company_query.filter(GSTCompany.id.in_(company_ids))
+
+    invoice_totals = {row[0]: row[1:] for row in invoice_query.group_by(Invoice.company_id)}
+    return_totals = {row[0]: row[1:] for row in return_query.group_by(GSTReturn.company_id)}
+
+    totals = {}
+    for (company_id,) in company_query:
+        invoice_count, paid_count, unpaid_count, defaulted_count, delay_days_sum = invoice_totals.get(company_id, (0, 0, 0, 0, 0))
+        return_count, compliance_sum = return_totals.get(company_id, (0, 0))
+        totals[company_id] = {
+            "invoice_count": invoice_count,
+            "paid_count": paid_count,
+            "unpaid_count": unpaid_count,
+            "defaulted_count": defaulted_count,
+            "delay_days_sum": delay_days_sum,
+            "return_count": return_count,
+            "compliance_sum": compliance_sum,
+        }
+    return totals
+
+def rebuild_company_stats(db: Session, chunk_size: int = 1000) -> int:
+    """Recomputes every company's stats row from invoice/gst_return. Caller commits."""
+    rows = [{"company_id": company_id, **totals} for company_id, totals in _aggregate_companies(db).items()]
+
+    db.query(CompanyCreditStats).delete(synchronize_session=False)
+    for i in range(0, len(rows), chunk_size):
+        db.execute(CompanyCreditStats.__table__.insert(), rows[i:i + chunk_size])
+    return len(rows)
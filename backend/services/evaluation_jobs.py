@@ -0,0 +1,271 @@
+import os
+import csv
+import io
+import json
+import uuid
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+
+from pydantic import ValidationError
+from sqlalchemy import insert, update, or_, func
+
+from database import SessionLocal
+from models.database_models import EvaluationJob, EvaluationJobItem
+from models.schemas import VerificationCheckRequest, VerificationBatchRequest
+from routers.verification import verify_batch_check
+
+EVALUATION_JOB_WORKERS = int(os.getenv("EVALUATION_JOB_WORKERS", "2"))
+EVALUATION_JOB_CHUNK_SIZE = int(os.getenv("EVALUATION_JOB_CHUNK_SIZE", "500"))
+EVALUATION_JOB_MAX_ITEMS = int(os.getenv("EVALUATION_JOB_MAX_ITEMS", "1000000"))
+EVALUATION_JOB_LEASE_SECONDS = int(os.getenv("EVALUATION_JOB_LEASE_SECONDS", "60"))
+
+ACTIVE_STATUSES = ("QUEUED", "RUNNING")
+
+def parse_job_items(content: bytes, content_type: str) -> list:
+    """
+    Parses an NDJSON body (one {"gst_number", "aadhaar_number", "pan_number"} object per
+    line) or a CSV file with those column headers. Returns item dicts in file order; a
+    line that does not parse becomes an item with an error instead of failing the job.
+    """
+    text = content.decode("utf-8-sig")
+    if "csv" in content_type:
+        records = [(row, None) for row in csv.DictReader(io.StringIO(text))]
+    else:
+        records = []
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            try:
+                records.append((json.loads(line), None))
+            except ValueError:
+                records.append((None, "Line is not valid JSON"))
+
+    items = []
+    for seq, (record, error) in enumerate(records):
+        item = {"seq": seq, "gst_number": None, "aadhaar_number": None, "pan_number": None, "status": "PENDING", "error": None}
+        if error is None:
+            try:
+                request = VerificationCheckRequest(**record) if isinstance(record, dict) else None
+            except ValidationError:
+                request = None
+            if request is None:
+                error = "Missing or invalid gst_number / aadhaar_number / pan_number"
+            else:
+                item.update(gst_number=request.gst_number, aadhaar_number=request.aadhaar_number, pan_number=request.pan_number)
+        if error is not None:
+            item.update(status="DONE", error=json.dumps({"status_code": 422, "detail": error}))
+        items.append(item)
+    return items
+
+def create_job(consumer_id: str, items: list) -> EvaluationJob:
+    """Persists the job and its items (bulk insert in chunks) before anything is evaluated"""
+    invalid = sum(1 for item in items if item["status"] == "DONE")
+    db = SessionLocal()
+    try:
+        job = EvaluationJob(
+            consumer_id=consumer_id,
+            status="QUEUED",
+            total_items=len(items),
+            processed_items=invalid,
+            failed_items=invalid,
+        )
+        db.add(job)
+        db.flush()
+        for start in range(0, len(items), EVALUATION_JOB_CHUNK_SIZE * 10):
+            chunk = items[start:start + EVALUATION_JOB_CHUNK_SIZE * 10]
+            db.execute(insert(EvaluationJobItem), [{"job_id": job.id, **item} for item in chunk])
+        db.commit()
+        db.refresh(job)
+        db.expunge(job)
+        return job
+    finally:
+        db.close()
+
+def job_progress(job: EvaluationJob) -> dict:
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "total_items": job.total_items,
+        "processed_items": job.processed_items,
+        "succeeded_items": job.succeeded_items,
+        "failed_items": job.failed_items,
+        "progress": round(job.processed_items / job.total_items, 4) if job.total_items else 1.0,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "completed_at": job.completed_at,
+    }
+
+class EvaluationJobRunner:
+    """
+    Runs evaluation jobs on a local thread pool, one chunk at a time through the same
+    set-based scoring as /verification/batch-check. A runner claims a job with a
+    guarded UPDATE that makes it the owner for lease_seconds, renews the lease before
+    every chunk, and commits each chunk's results together with counter increments
+    that only apply while it still owns the job. Jobs nobody holds a live lease on
+    (their process crashed, or stopped mid-job) are taken over by resume(), at start
+    and then once per lease period, and continue with the first PENDING item. A chunk
+    interrupted mid-way, or still running when its lease was taken over, is evaluated
+    again (its log rows may then appear twice). Cancellation is seen at the next lease
+    renewal, and every status change is guarded, so it is never overwritten.
+    """
+
+    def __init__(self, workers=EVALUATION_JOB_WORKERS, chunk_size=EVALUATION_JOB_CHUNK_SIZE,
+                 lease_seconds=EVALUATION_JOB_LEASE_SECONDS):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._pool = None
+        self._scheduled = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.on_complete = None # callback(job) when a job ends COMPLETED or FAILED, from the worker thread
+
+    def submit(self, job_id: str) -> bool:
+        with self._lock:
+            if self._pool is None or job_id in self._scheduled:
+                return False
+            self._scheduled.add(job_id)
+        self._pool.submit(self._run_job, job_id)
+        return True
+
+    def resume(self):
+        """Schedules QUEUED or RUNNING jobs that no runner holds a live lease on"""
+        db = SessionLocal()
+        try:
+            job_ids = [job_id for (job_id,) in db.query(EvaluationJob.id).filter(
+                EvaluationJob.status.in_(ACTIVE_STATUSES),
+                self._claimable(datetime.now(timezone.utc))
+            ).order_by(EvaluationJob.created_at)]
+        finally:
+            db.close()
+        resumed = sum(1 for job_id in job_ids if self.submit(job_id))
+        if resumed:
+            print(f"[EVALUATION JOBS] Resumed {resumed} unfinished jobs")
+
+    def _claimable(self, now):
+        return or_(EvaluationJob.lease_expires_at.is_(None), EvaluationJob.lease_expires_at < now, EvaluationJob.owner == self.owner)
+
+    def _run_job(self, job_id):
+        db = SessionLocal()
+        finished = False
+        owned = EvaluationJob.owner == self.owner
+        try:
+            now = datetime.now(timezone.utc)
+            if not self._transition(db, job_id, ACTIVE_STATUSES, self._claimable(now), status="RUNNING", owner=self.owner,
+                                    lease_expires_at=now + timedelta(seconds=self.lease_seconds),
+                                    started_at=func.coalesce(EvaluationJob.started_at, now)):
+                return # finished, cancelled, or another runner holds it
+
+            last_seq = -1
+            while True:
+                items = db.query(EvaluationJobItem).filter(
+                    EvaluationJobItem.job_id == job_id,
+                    EvaluationJobItem.status == "PENDING",
+                    EvaluationJobItem.seq > last_seq
+                ).order_by(EvaluationJobItem.seq).limit(self.chunk_size).all()
+                if not items:
+                    break
+                last_seq = items[-1].seq
+
+                if self._pool is None:
+                    # Shutting down: stays RUNNING, free for the next runner to take over at once
+                    self._transition(db, job_id, ("RUNNING",), owned, owner=None, lease_expires_at=None)
+                    return
+                # Fails once the job is cancelled or another runner has taken it over
+                if not self._transition(db, job_id, ("RUNNING",), owned,
+                                        lease_expires_at=datetime.now(timezone.utc) + timedelta(seconds=self.lease_seconds)):
+                    return
+                if not self._run_chunk(db, job_id, items):
+                    return
+
+            # A DELETE during the last chunk leaves the job CANCELLED, with no job.completed event
+            finished = self._transition(db, job_id, ("RUNNING",), owned, status="COMPLETED", lease_expires_at=None,
+                                        completed_at=datetime.now(timezone.utc))
+        except Exception as e:
+            db.rollback()
+            finished = self._transition(db, job_id, ACTIVE_STATUSES, owned, status="FAILED", error=str(e)[:1000],
+                                        lease_expires_at=None, completed_at=datetime.now(timezone.utc))
+            print(f"[EVALUATION JOBS ERROR] Job {job_id}: {str(e)}")
+        finally:
+            with self._lock:
+                self._scheduled.discard(job_id)
+            if finished and self.on_complete:
+                self.on_complete(db.query(EvaluationJob).filter(EvaluationJob.id == job_id).first())
+            db.close()
+
+    @staticmethod
+    def _transition(db, job_id, from_statuses, *criteria, **values) -> bool:
+        """Sets values only if the job is still in one of from_statuses (and matches criteria); False if it has moved on"""
+        result = db.execute(
+            update(EvaluationJob).where(EvaluationJob.id == job_id, EvaluationJob.status.in_(from_statuses), *criteria).values(**values)
+        )
+        db.commit()
+        return result.rowcount == 1
+
+    def _run_chunk(self, db, job_id, items) -> bool:
+        """Evaluates and records one chunk; False (nothing recorded) if the job is no longer this runner's"""
+        batch = VerificationBatchRequest.model_construct(items=[
+            VerificationCheckRequest.model_construct(
+                gst_number=item.gst_number, aadhaar_number=item.aadhaar_number, pan_number=item.pan_number, invoice_id=None
+            )
+            for item in items
+        ])
+        outcome = verify_batch_check(batch, db)
+
+        db.execute(update(EvaluationJobItem), [
+            {
+                "job_id": job_id,
+                "seq": item.seq,
+                "status": "DONE",
+                "result": json.dumps(entry["result"]) if entry["result"] is not None else None,
+                "error": json.dumps(entry["error"]) if entry["error"] is not None else None,
+            }
+            for item, entry in zip(items, outcome["results"])
+        ])
+        # Increments, in the same transaction as the items, and only while this runner owns the job
+        counted = db.execute(update(EvaluationJob).where(EvaluationJob.id == job_id, EvaluationJob.owner == self.owner).values(
+            processed_items=EvaluationJob.processed_items + outcome["total"],
+            succeeded_items=EvaluationJob.succeeded_items + outcome["succeeded"],
+            failed_items=EvaluationJob.failed_items + outcome["failed"],
+        ))
+        if counted.rowcount != 1:
+            db.rollback()
+            return False
+        db.commit()
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.lease_seconds):
+            try:
+                self.resume()
+            except Exception as e:
+                print(f"[EVALUATION JOBS ERROR] {str(e)}")
+
+    def start(self):
+        if self._pool is not None:
+            return
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="evaluation-job")
+        self.resume()
+        # Takes over jobs from runners that stopped renewing their lease
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="evaluation-job-resume", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._pool is None:
+            return
+        pool, self._pool = self._pool, None
+        self._stop.set()
+        self._thread.join(timeout=5)
+        self._thread = None
+        # Running chunks finish, then release their job (still RUNNING) for the next runner
+        pool.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            self._scheduled.clear()
+
+job_runner = EvaluationJobRunner()
@@ -0,0 +1,11 @@
+import hmac
+import hashlib
+
+def sign(secret: str, timestamp: str, body: bytes) -> str:
+    """HMAC-SHA256 over "<timestamp>.<body>", hex encoded; used for inbound and outbound (webhook) requests"""
+    msg = f"{timestamp}.".encode() + body
+    return hmac.new(secret.encode(), msg, hashlib.sha256).hexdigest()
+
+def signature_matches(secret: str, timestamp: str, body: bytes, signature: str) -> bool:
+    # Constant time compare for security
+    return hmac.compare_digest(sign(secret, timestamp, body), signature)
@@ -0,0 +1,220 @@
+import os
+import string
+import threading
+from collections import deque
+
+from sqlalchemy import select, func, or_
+
+from database import engine, dialect_insert
+from models.database_models import IdSequence, AadhaarProfile, PANProfile, GSTCompany
+
+ID_BLOCK_SIZE = int(os.getenv("ID_BLOCK_SIZE", "100"))
+
+ALPHANUMERIC = string.digits + string.ascii_uppercase
+
+# --- Check digits ---
+
+_VERHOEFF_D = (
+    (0, 1, 2, 3, 4, 5, 6, 7, 8, 9),
+    (1, 2, 3, 4, 0, 6, 7, 8, 9, 5),
+    (2, 3, 4, 0, 1, 7, 8, 9, 5, 6),
+    (3, 4, 0, 1, 2, 8, 9, 5, 6, 7),
+    (4, 0, 1, 2, 3, 9, 5, 6, 7, 8),
+    (5, 9, 8, 7, 6, 0, 4, 3, 2, 1),
+    (6, 5, 9, 8, 7, 1, 0, 4, 3, 2),
+    (7, 6, 5, 9, 8, 2, 1, 0, 4, 3),
+    (8, 7, 6, 5, 9, 3, 2, 1, 0, 4),
+    (9, 8, 7, 6, 5, 4, 3, 2, 1, 0),
+)
+_VERHOEFF_P = (
+    (0, 1, 2, 3, 4, 5, 6, 7, 8, 9),
+    (1, 5, 7, 6, 2, 8, 3, 0, 9, 4),
+    (5, 8, 0, 3, 7, 9, 6, 1, 4, 2),
+    (8, 9, 1, 6, 0, 4, 3, 5, 2, 7),
+    (9, 4, 5, 3, 1, 2, 6, 8, 7, 0),
+    (4, 2, 8, 6, 5, 7, 3, 9, 0, 1),
+    (2, 7, 9, 3, 8, 0, 6, 4, 1, 5),
+    (7, 0, 4, 6, 9, 1, 3, 2, 5, 8),
+)
+_VERHOEFF_INV = (0, 4, 3, 2, 1, 5, 6, 7, 8, 9)
+
+def verhoeff_check_digit(digits: str) -> str:
+    """The Verhoeff digit UIDAI appends to the 11-digit Aadhaar payload"""
+    c = 0
+    for i, digit in enumerate(reversed(digits)):
+        c = _VERHOEFF_D[c][_VERHOEFF_P[(i + 1) % 8][int(digit)]]
+    return str(_VERHOEFF_INV[c])
+
+def verhoeff_is_valid(number: str) -> bool:
+    c = 0
+    for i, digit in enumerate(reversed(number)):
+        c = _VERHOEFF_D[c][_VERHOEFF_P[i % 8][int(digit)]]
+    return c == 0
+
+def gstin_check_char(first14: str) -> str:
+    """GSTN's mod-36 check character over the first 14 characters of a GSTIN"""
+    total = 0
+    for i, char in enumerate(first14):
+        product = ALPHANUMERIC.index(char) * (2 if i % 2 else 1)
+        total += product // 36 + product % 36
+    return ALPHANUMERIC[(36 - total % 36) % 36]
+
+def pan_check_letter(first9: str) -> str:
+    # The Income Tax Department does not publish its algorithm; a weighted mod-26 sum keeps our PANs self-checking
+    total = sum((i + 1) * ALPHANUMERIC.index(char) for i, char in enumerate(first9))
+    return string.ascii_uppercase[total % 26]
+
+# --- Number formats ---
+
+AADHAAR_SPACE = 8 * 10**10 # payloads 20000000000-99999999999 (Aadhaar never starts with 0 or 1)
+PAN_SPACE = 26**4 * 10**4 # AAA P A 9999, with the 4th letter fixed to P (individual holder)
+
+def render_aadhaar(index: int) -> str:
+    payload = str(2 * 10**10 + index)
+    return payload + verhoeff_check_digit(payload)
+
+def render_pan(index: int) -> str:
+    index, serial = divmod(index, 10**4)
+    letters = ""
+    for _ in range(4):
+        index, letter = divmod(index, 26)
+        letters += string.ascii_uppercase[letter]
+    first9 = f"{letters[:3]}P{letters[3]}{serial:04d}"
+    return first9 + pan_check_letter(first9)
+
+def _feistel_permutation(space: int, keys=(0x5BD1E995, 0x1B873593, 0xCC9E2D51, 0x85EBCA6B)):
+    """
+    A fixed bijection on range(space): a balanced Feistel network over the smallest
+    even-width bit domain covering the space, cycle-walking until the value lands
+    inside it. Neighbouring ordinals map to unrelated-looking numbers.
+    """
+    half_bits = ((space - 1).bit_length() + 1) // 2
+    mask = (1 << half_bits) - 1
+
+    def permute(value):
+        while True:
+            left, right = value >> half_bits, value & mask
+            for key in keys:
+                left, right = right, left ^ (((right * 0x9E3779B1) ^ key ^ (right >> 3)) & mask)
+            value = (left << half_bits) | right
+            if value < space:
+                return value
+
+    return permute
+
+class BlockAllocator:
+    """
+    Hands out unique identity numbers without a uniqueness query per number. Each
+    process reserves a block of ordinals by atomically advancing a row in id_sequences,
+    then renders numbers from that block in memory. Ordinals pass through a fixed
+    permutation of the number space, so consecutive allocations do not come out in
+    sequence. One IN query per block skips numbers issued by the old random generator.
+    Numbers left in a block when the process exits are never issued.
+    """
+
+    def __init__(self, name, space, render, column, block_size=ID_BLOCK_SIZE, bind=engine):
+        self.name = name
+        self.space = space
+        self.render = render
+        self.column = column
+        self.block_size = block_size
+        self.bind = bind
+        self._permute = _feistel_permutation(space)
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self.blocks_reserved = 0
+        self.allocated = 0
+        self.skipped = 0
+
+    def allocate(self) -> str:
+        with self._lock:
+            while not self._pending:
+                self._reserve_block()
+            self.allocated += 1
+            return self._pending.popleft()
+
+    def allocate_many(self, count: int) -> list:
+        """count numbers at once; a bulk caller reserves one block sized to its batch"""
+        with self._lock:
+            while len(self._pending) < count:
+                self._reserve_block(max(self.block_size, count - len(self._pending)))
+            self.allocated += count
+            return [self._pending.popleft() for _ in range(count)]
+
+    def _reserve_block(self, size=None):
+        size = size or self.block_size
+        with self.bind.begin() as conn:
+            insert = dialect_insert(conn)
+            conn.execute(
+                insert(IdSequence)
+                .values(name=self.name, next_value=size)
+                .on_conflict_do_update(
+                    index_elements=[IdSequence.name],
+                    set_={"next_value": IdSequence.next_value + size, "updated_at": func.now()}
+                )
+            )
+            # Same transaction as the increment, so this is our own reservation
+            end = conn.execute(select(IdSequence.next_value).where(IdSequence.name == self.name)).scalar()
+            start = end - size
+            if start >= self.space:
+                raise RuntimeError(f"Number space for {self.name} is exhausted")
+
+            candidates = [
+                self.render(self._permute(ordinal))
+                for ordinal in range(start, min(end, self.space))
+            ]
+            taken = set(conn.execute(select(self.column).where(self.column.in_(candidates))).scalars())
+
+        self.blocks_reserved += 1
+        self.skipped += len(taken)
+        self._pending.extend(number for number in candidates if number not in taken)
+
+    def stats(self) -> dict:
+        return {
+            "blocks_reserved": self.blocks_reserved,
+            "allocated": self.allocated,
+            "skipped": self.skipped,
+            "pending": len(self._pending),
+        }
+
+aadhaar_numbers = BlockAllocator("aadhaar", AADHAAR_SPACE, render_aadhaar, AadhaarProfile.aadhaar_number)
+pan_numbers = BlockAllocator("pan", PAN_SPACE, render_pan, PANProfile.pan_number)
+
+# --- GSTIN ---
+
+GSTIN_ENTITY_CODES = ALPHANUMERIC[1:] # 1-9 then A-Z: the registration's ordinal under the PAN within the state
+
+def allocate_gstin(db, state_code: str, pan_number: str):
+    """
+    Builds the next GSTIN for a PAN in a state: state code + PAN + the lowest unused
+    entity code + "Z" + check character. A GSTIN is a function of its PAN, so there is
+    no block to reserve; one prefix query finds the codes already used. Returns None
+    when all 35 entity codes are taken.
+    """
+    return allocate_gstins(db, [(state_code, pan_number)])[0]
+
+def allocate_gstins(db, registrations) -> list:
+    """
+    allocate_gstin() for many (state_code, pan_number) pairs with one query over all
+    their prefixes. Pairs sharing a prefix get successive entity codes.
+    """
+    prefixes = {f"{state_code}{pan_number}" for state_code, pan_number in registrations}
+    used = {prefix: set() for prefix in prefixes}
+    if prefixes:
+        for (gst_number,) in db.query(GSTCompany.gst_number).filter(
+            or_(*(GSTCompany.gst_number.startswith(prefix, autoescape=True) for prefix in prefixes))
+        ):
+            if len(gst_number) > 12 and gst_number[:12] in used:
+                used[gst_number[:12]].add(gst_number[12])
+
+    gstins = []
+    for state_code, pan_number in registrations:
+        prefix = f"{state_code}{pan_number}"
+        entity_code = next((code for code in GSTIN_ENTITY_CODES if code not in used[prefix]), None)
+        if entity_code is None:
+            gstins.append(None)
+            continue
+        used[prefix].add(entity_code)
+        first14 = f"{prefix}{entity_code}Z"
+        gstins.append(first14 + gstin_check_char(first14))
+    return gstins
@@ -0,0 +1,135 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+
+from fastapi import HTTPException
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_MAX_BYTES = int(os.getenv("IDEMPOTENCY_MAX_BYTES", str(32 * 1024 * 1024)))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+class IdempotencyStore:
+    """
+    Replay cache for the external gateway, keyed by (scope, Idempotency-Key) where the
+    scope is the consumer and endpoint. The first request with a key runs; duplicates
+    that arrive while it is still running await its outcome, and later duplicates within
+    the TTL get the stored response back. Client errors (4xx) are replayed too; a 5xx or
+    unexpected failure is not stored, so the next attempt runs again.
+
+    Entries are evicted oldest-first once they expire or the stored responses exceed
+    max_bytes. The store is per worker process: with several workers, a retry that lands
+    on a different worker than the original runs again.
+    """
+
+    def __init__(self, ttl_seconds=IDEMPOTENCY_TTL_SECONDS, max_bytes=IDEMPOTENCY_MAX_BYTES):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict() # key -> (fingerprint, status_code, body, size, expires_at)
+        self._in_flight = {} # key -> (fingerprint, asyncio.Future)
+        self._bytes = 0
+        self.counters = {"executed": 0, "replayed": 0, "joined_in_flight": 0, "evicted": 0}
+
+    @staticmethod
+    def fingerprint(body: bytes) -> str:
+        return hashlib.sha256(body).hexdigest()
+
+    async def run(self, scope: str, idempotency_key: str, fingerprint: str, fn):
+        """
+        Runs fn() (a coroutine function) at most once per key. Returns (result, replayed);
+        a stored client error is re-raised as the same HTTPException.
+        """
+        if len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            raise HTTPException(status_code=400, detail=f"Idempotency-Key longer than {IDEMPOTENCY_KEY_MAX_LENGTH} characters")
+        key = f"{scope}:{idempotency_key}"
+
+        while True:
+            stored = self._get(key)
+            if stored is not None:
+                self._check_fingerprint(stored[0], fingerprint)
+                self.counters["replayed"] += 1
+                return self._replay(stored), True
+
+            in_flight = self._in_flight.get(key)
+            if in_flight is None:
+                break
+            self._check_fingerprint(in_flight[0], fingerprint)
+            self.counters["joined_in_flight"] += 1
+            # shield(): a waiter being cancelled must not cancel the shared future
+            if await asyncio.shield(in_flight[1]):
+                continue # stored now, replay it
+            # The first attempt failed without a storable outcome; whoever loops first runs it
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = (fingerprint, future)
+        stored = False
+        try:
+            self.counters["executed"] += 1
+            result = await fn()
+            self._put(key, fingerprint, 200, result)
+            stored = True
+            return result, False
+        except HTTPException as e:
+            if e.status_code < 500:
+                self._put(key, fingerprint, e.status_code, e.detail)
+                stored = True
+            raise
+        finally:
+            del self._in_flight[key]
+            future.set_result(stored)
+
+    @staticmethod
+    def _check_fingerprint(expected, fingerprint):
+        if expected != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request body")
+
+    @staticmethod
+    def _replay(stored):
+        _, status_code, body, _, _ = stored
+        if status_code != 200:
+            raise HTTPException(status_code=status_code, detail=body)
+        return body
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry[4] <= time.monotonic():
+            self._drop(key)
+            return None
+        return entry
+
+    def _put(self, key, fingerprint, status_code, body):
+        size = len(key) + len(json.dumps(body, default=str))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (fingerprint, status_code, body, size, time.monotonic() + self.ttl_seconds)
+        self._bytes += size
+        self._evict()
+
+    def _drop(self, key):
+        self._bytes -= self._entries.pop(key)[3]
+
+    def _evict(self):
+        # Every entry has the same TTL, so insertion order is also expiry order
+        now = time.monotonic()
+        while self._entries:
+            oldest_key, oldest = next(iter(self._entries.items()))
+            if oldest[4] > now and self._bytes <= self.max_bytes:
+                break
+            self._drop(oldest_key)
+            self.counters["evicted"] += 1
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "in_flight": len(self._in_flight),
+            **self.counters,
+        }
+
+idempotency_store = IdempotencyStore()
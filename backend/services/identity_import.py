@@ -0,0 +1,182 @@
+import os
+import json
+import uuid
+from itertools import islice
+
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from database import engine
+from models.database_models import AadhaarProfile, PANProfile
+from models.schemas import IdentityImportRow
+from services.id_allocator import aadhaar_numbers, pan_numbers, verhoeff_is_valid
+from services.credit_cache import credit_cache
+from services.log_sink import log_sink
+from services.bulk_upload import iter_records, validation_message, write_rows
+
+# Rows validated, allocated and written per transaction; also the size of every IN (...) lookup
+IDENTITY_IMPORT_CHUNK_SIZE = int(os.getenv("IDENTITY_IMPORT_CHUNK_SIZE", "5000"))
+
+AADHAAR_COLUMNS = ["id", "name", "aadhaar_number", "phone", "email", "address", "photo_url", "kyc_status", "blacklist_flag"]
+PAN_COLUMNS = ["id", "pan_number", "aadhaar_id", "is_linked", "photo_url"]
+
+class IdentityImporter:
+    """
+    Bulk-creates Aadhaar profiles, and optionally a linked PAN each, from a CSV or
+    NDJSON file, for seeding and registry migrations where the per-person OTP flow
+    does not apply.
+
+    The file is consumed in chunks of chunk_size rows. Each chunk is validated, checked
+    for duplicate phones and numbers (within the chunk, then with one IN query per
+    column against the registry), given its missing numbers from one allocator block,
+    and written in a single transaction: COPY on Postgres, executemany on SQLite, plus
+    one summarizing audit entry per entity type. A row that fails never stops the
+    import; every row gets a line in the report.
+    """
+
+    def __init__(self, bind=engine, chunk_size=IDENTITY_IMPORT_CHUNK_SIZE,
+                 aadhaar_allocator=aadhaar_numbers, pan_allocator=pan_numbers):
+        self.bind = bind
+        self.chunk_size = chunk_size
+        self.aadhaar_allocator = aadhaar_allocator
+        self.pan_allocator = pan_allocator
+
+    def run(self, stream, fmt: str = "ndjson", actor: str = "ADMIN", report=None) -> dict:
+        """
+        Imports the whole stream. report, if given, is a text file that receives one
+        NDJSON outcome per row as each chunk commits. Returns the summary with the
+        failed rows.
+        """
+        summary = {"import_id": str(uuid.uuid4()), "rows": 0, "created": 0, "pans_created": 0, "failed": 0, "errors": []}
+        records = iter_records(stream, fmt)
+        batch = 0
+        while True:
+            chunk = list(islice(records, self.chunk_size))
+            if not chunk:
+                break
+            batch += 1
+            for outcome in self._import_chunk(chunk, summary["import_id"], batch, actor):
+                summary["rows"] += 1
+                if outcome["status"] == "CREATED":
+                    summary["created"] += 1
+                    summary["pans_created"] += outcome["pan_number"] is not None
+                else:
+                    summary["failed"] += 1
+                    summary["errors"].append({"line": outcome["line"], "error": outcome["error"]})
+                if report is not None:
+                    report.write(json.dumps(outcome) + "\n")
+        summary["batches"] = batch
+        return summary
+
+    # --- One chunk ---
+
+    def _validate(self, chunk):
+        """Splits a chunk into (valid rows, outcomes of the rows that failed)"""
+        valid, failed = [], []
+        seen = {"phone": set(), "aadhaar_number": set(), "pan_number": set()}
+        for line, record, error in chunk:
+            row = None
+            if error is None:
+                try:
+                    row = IdentityImportRow(**record)
+                except ValidationError as e:
+                    error = validation_message(e)
+            if row is not None:
+                if row.aadhaar_number and not verhoeff_is_valid(row.aadhaar_number):
+                    error = "aadhaar_number: check digit does not match"
+                else:
+                    for key in seen:
+                        value = getattr(row, key)
+                        if value is not None and value in seen[key]:
+                            error = f"{key}: duplicated earlier in the file"
+                            break
+            if error is not None:
+                failed.append(_outcome(line, "FAILED", error=error))
+                continue
+            for key in seen:
+                if getattr(row, key) is not None:
+                    seen[key].add(getattr(row, key))
+            valid.append((line, row))
+        return valid, failed, seen
+
+    def _import_chunk(self, chunk, import_id, batch, actor):
+        valid, failed, seen = self._validate(chunk)
+
+        with Session(self.bind) as db:
+            # Earlier chunks are committed by now, so this also catches repeats across chunks
+            taken = {
+                "phone": self._existing(db, AadhaarProfile.phone, seen["phone"]),
+                "aadhaar_number": self._existing(db, AadhaarProfile.aadhaar_number, seen["aadhaar_number"]),
+                "pan_number": self._existing(db, PANProfile.pan_number, seen["pan_number"]),
+            }
+            rows = []
+            for line, row in valid:
+                clash = next((key for key in taken if getattr(row, key) in taken[key]), None)
+                if clash:
+                    failed.append(_outcome(line, "FAILED", error=f"{clash}: already registered"))
+                else:
+                    rows.append((line, row))
+
+            new_aadhaar = iter(self.aadhaar_allocator.allocate_many(sum(1 for _, row in rows if not row.aadhaar_number)))
+            new_pan = iter(self.pan_allocator.allocate_many(sum(1 for _, row in rows if row.issue_pan and not row.pan_number)))
+            aadhaar_rows, pan_rows, created = [], [], []
+            for line, row in rows:
+                aadhaar = {
+                    "id": str(uuid.uuid4()),
+                    "name": row.name,
+                    "aadhaar_number": row.aadhaar_number or next(new_aadhaar),
+                    "phone": row.phone,
+                    "email": row.email,
+                    "address": row.address,
+                    "photo_url": row.photo_url,
+                    "kyc_status": "VERIFIED",
+                    "blacklist_flag": False,
+                }
+                aadhaar_rows.append(aadhaar)
+                pan_number = None
+                if row.issue_pan or row.pan_number:
+                    pan_number = row.pan_number or next(new_pan)
+                    pan_rows.append({
+                        "id": str(uuid.uuid4()),
+                        "pan_number": pan_number,
+                        "aadhaar_id": aadhaar["id"],
+                        "is_linked": True,
+                        "photo_url": row.pan_photo_url,
+                    })
+                created.append(_outcome(line, "CREATED", aadhaar_number=aadhaar["aadhaar_number"], pan_number=pan_number))
+
+            if aadhaar_rows:
+                try:
+                    write_rows(db, AadhaarProfile.__table__, AADHAAR_COLUMNS, aadhaar_rows)
+                    write_rows(db, PANProfile.__table__, PAN_COLUMNS, pan_rows)
+                    # One entry stands for the whole batch: entity_id is "<import id>:<batch>:<rows>"
+                    audit = [{"actor": actor, "action": "BULK_CREATE_AADHAAR", "entity": "AadhaarProfile",
+                              "entity_id": f"{import_id}:{batch}:{len(aadhaar_rows)}"}]
+                    if pan_rows:
+                        audit.append({"actor": actor, "action": "BULK_CREATE_PAN", "entity": "PANProfile",
+                                      "entity_id": f"{import_id}:{batch}:{len(pan_rows)}"})
+                    log_sink.audit_many(db, audit, strict=True)
+                    db.commit()
+                except Exception as e:
+                    # e.g. a phone registered through the API while this chunk was in flight
+                    db.rollback()
+                    error = f"Batch {batch} failed: {str(e)[:500]}"
+                    created = [_outcome(outcome["line"], "FAILED", error=error) for outcome in created]
+
+        # Supplied numbers may have "not found" answers cached; allocated ones are new
+        for _, row in rows:
+            if row.aadhaar_number or row.pan_number:
+                credit_cache.invalidate_identity(aadhaar_number=row.aadhaar_number, pan_number=row.pan_number)
+        return sorted(failed + created, key=lambda outcome: outcome["line"])
+
+    @staticmethod
+    def _existing(db, column, values):
+        if not values:
+            return set()
+        return set(db.execute(select(column).where(column.in_(values))).scalars())
+
+def _outcome(line, status, aadhaar_number=None, pan_number=None, error=None):
+    return {"line": line, "status": status, "aadhaar_number": aadhaar_number, "pan_number": pan_number, "error": error}
+
+identity_importer = IdentityImporter()
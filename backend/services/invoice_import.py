@@ -0,0 +1,236 @@
+import os
+import json
+import uuid
+import threading
+from collections import OrderedDict
+from itertools import islice
+
+from pydantic import ValidationError
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session
+
+from database import engine
+from models.database_models import GSTCompany, Invoice
+from models.schemas import InvoiceImportRow
+from services.credit_cache import credit_cache
+from services.credit_stats import record_invoices
+from services.log_sink import log_sink
+from services.bulk_upload import iter_records, validation_message, write_rows
+
+# Invoices validated, de-duplicated and written per transaction
+INVOICE_IMPORT_CHUNK_SIZE = int(os.getenv("INVOICE_IMPORT_CHUNK_SIZE", "10000"))
+INVOICE_IMPORT_SELLER_CACHE_SIZE = int(os.getenv("INVOICE_IMPORT_SELLER_CACHE_SIZE", "100000"))
+
+# Keys per duplicate lookup, two bound parameters each (SQLite allows 32766 per statement)
+DEDUPE_LOOKUP_SIZE = 5000
+
+INVOICE_COLUMNS = ["id", "company_id", "invoice_number", "buyer_gstin", "date", "total_taxable", "total_tax", "grand_total", "status", "delay_days"]
+
+# Outcome statuses in the report
+CREATED = "CREATED"
+DUPLICATE = "DUPLICATE"
+FAILED = "FAILED"
+
+class SellerDirectory:
+    """
+    GSTIN <-> company id for the sellers named in invoice feeds, LRU-bounded. A
+    company's GSTIN never changes, so entries never go stale; only companies that
+    exist are cached, so one registered mid-feed is found on its next chunk.
+    """
+
+    def __init__(self, max_entries=INVOICE_IMPORT_SELLER_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict() # ("gstin", gst_number) -> id, ("id", company_id) -> gst_number
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, db, gst_numbers, company_ids) -> dict:
+        """Returns {("gstin", x): id, ("id", y): gstin} for every seller that exists, with one IN query per kind of miss"""
+        wanted = {("gstin", value) for value in gst_numbers} | {("id", value) for value in company_ids}
+        found = {}
+        with self._lock:
+            for key in wanted:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    found[key] = self._entries[key]
+        missing = wanted - found.keys()
+        self.hits += len(found)
+        self.misses += len(missing)
+
+        missing_gstins = [value for kind, value in missing if kind == "gstin"]
+        missing_ids = [value for kind, value in missing if kind == "id"]
+        rows = []
+        if missing_gstins:
+            rows += db.query(GSTCompany.id, GSTCompany.gst_number).filter(GSTCompany.gst_number.in_(missing_gstins)).all()
+        if missing_ids:
+            rows += db.query(GSTCompany.id, GSTCompany.gst_number).filter(GSTCompany.id.in_(missing_ids)).all()
+
+        with self._lock:
+            for company_id, gst_number in rows:
+                for key, value in ((("gstin", gst_number), company_id), (("id", company_id), gst_number)):
+                    self._entries[key] = value
+                    self._entries.move_to_end(key)
+                    if key in wanted:
+                        found[key] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return found
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+class InvoiceImporter:
+    """
+    Bulk invoice ingestion for monthly outward-supply (GSTR-1 style) feeds, as CSV or
+    NDJSON with one invoice per line.
+
+    The file is consumed in chunks of chunk_size invoices. Each chunk is validated,
+    its sellers resolved through the SellerDirectory (GSTIN or company id), and
+    de-duplicated on (company_id, invoice_number), first within the chunk and then with
+    one lookup against the table. It is written in a single transaction: COPY into the
+    partitioned invoice table on Postgres (rows are routed to their partitions),
+    executemany on SQLite, the credit stats of every seller in the chunk updated with
+    one upsert, and one summarizing audit entry. Re-sending a feed only reports its
+    invoices as duplicates.
+    """
+
+    def __init__(self, bind=engine, chunk_size=INVOICE_IMPORT_CHUNK_SIZE, sellers=None):
+        self.bind = bind
+        self.chunk_size = chunk_size
+        self.sellers = sellers or SellerDirectory()
+
+    def run(self, stream, fmt: str = "ndjson", actor: str = "ADMIN", report=None) -> dict:
+        """
+        Ingests the whole stream. report, if given, is a text file that receives one
+        NDJSON outcome per invoice as each chunk commits. Returns the summary with the
+        failed rows (duplicates are counted, not listed).
+        """
+        summary = {"import_id": str(uuid.uuid4()), "rows": 0, "created": 0, "duplicates": 0, "failed": 0, "errors": []}
+        records = iter_records(stream, fmt)
+        batch = 0
+        while True:
+            chunk = list(islice(records, self.chunk_size))
+            if not chunk:
+                break
+            batch += 1
+            outcomes = self._import_chunk(chunk, summary["import_id"], batch, actor)
+            summary["rows"] += len(outcomes)
+            for outcome in outcomes:
+                if outcome["status"] == CREATED:
+                    summary["created"] += 1
+                elif outcome["status"] == DUPLICATE:
+                    summary["duplicates"] += 1
+                else:
+                    summary["failed"] += 1
+                    summary["errors"].append({"line": outcome["line"], "error": outcome["error"]})
+            if report is not None:
+                report.write("".join(json.dumps(outcome) + "\n" for outcome in outcomes))
+        summary["batches"] = batch
+        return summary
+
+    # --- One chunk ---
+
+    def _validate(self, chunk):
+        valid, outcomes = [], []
+        for line, record, error in chunk:
+            if error is None:
+                try:
+                    row = InvoiceImportRow(**record)
+                except ValidationError as e:
+                    error = validation_message(e)
+                else:
+                    if not (row.seller_gstin or row.company_id):
+                        error = "seller_gstin or company_id is required"
+            if error is not None:
+                outcomes.append(_outcome(line, FAILED, error=error))
+                continue
+            valid.append((line, row))
+        return valid, outcomes
+
+    def _import_chunk(self, chunk, import_id, batch, actor):
+        valid, outcomes = self._validate(chunk)
+
+        with Session(self.bind) as db:
+            sellers = self.sellers.resolve(
+                db,
+                {row.seller_gstin for _, row in valid if row.seller_gstin},
+                {row.company_id for _, row in valid if not row.seller_gstin},
+            )
+
+            resolved = []
+            for line, row in valid:
+                if row.seller_gstin:
+                    company_id, gst_number = sellers.get(("gstin", row.seller_gstin)), row.seller_gstin
+                else:
+                    company_id, gst_number = row.company_id, sellers.get(("id", row.company_id))
+                if company_id is None or gst_number is None:
+                    outcomes.append(_outcome(line, FAILED, error="Issuing company not found"))
+                elif gst_number == row.buyer_gstin:
+                    outcomes.append(_outcome(line, FAILED, error="Seller and Buyer GSTINs cannot be the same"))
+                else:
+                    resolved.append((line, row, company_id, gst_number))
+
+            # Earlier chunks are committed by now, so this also catches repeats across chunks
+            existing = self._existing(db, {(company_id, row.invoice_number) for _, row, company_id, _ in resolved})
+
+            invoice_rows, created, seller_gstins = [], [], set()
+            for line, row, company_id, gst_number in resolved:
+                key = (company_id, row.invoice_number)
+                if key in existing:
+                    outcomes.append(_outcome(line, DUPLICATE, error="Invoice number already recorded for this seller"))
+                    continue
+                existing.add(key)
+                invoice_id = str(uuid.uuid4())
+                invoice_rows.append({
+                    "id": invoice_id,
+                    "company_id": company_id,
+                    "invoice_number": row.invoice_number,
+                    "buyer_gstin": row.buyer_gstin,
+                    "date": row.date,
+                    "total_taxable": row.total_taxable,
+                    "total_tax": row.total_tax,
+                    "grand_total": row.grand_total,
+                    "status": row.status.value,
+                    "delay_days": row.delay_days,
+                })
+                created.append(_outcome(line, CREATED, invoice_id=invoice_id))
+                seller_gstins.add(gst_number)
+
+            if invoice_rows:
+                try:
+                    # Before the insert, as record_invoices() may seed stats from the pre-batch invoices
+                    record_invoices(db, [(r["company_id"], r["status"], r["delay_days"]) for r in invoice_rows])
+                    write_rows(db, Invoice.__table__, INVOICE_COLUMNS, invoice_rows)
+                    # One entry stands for the whole batch: entity_id is "<import id>:<batch>:<rows>"
+                    log_sink.audit(db, strict=True, actor=actor, action="BULK_CREATE_INVOICE", entity="Invoice",
+                                   entity_id=f"{import_id}:{batch}:{len(invoice_rows)}")
+                    db.commit()
+                except Exception as e:
+                    db.rollback()
+                    error = f"Batch {batch} failed: {str(e)[:500]}"
+                    created = [_outcome(outcome["line"], FAILED, error=error) for outcome in created]
+                    seller_gstins = set()
+
+        for gst_number in seller_gstins:
+            credit_cache.invalidate_company(gst_number)
+        return sorted(outcomes + created, key=lambda outcome: outcome["line"])
+
+    @staticmethod
+    def _existing(db, keys):
+        """
+        The (company_id, invoice_number) pairs already recorded. Matching on the pair
+        means one probe of ix_invoice_company_number per key; separate IN lists on the
+        two columns would probe every seller x number combination.
+        """
+        keys, found = list(keys), set()
+        for i in range(0, len(keys), DEDUPE_LOOKUP_SIZE):
+            found.update(db.query(Invoice.company_id, Invoice.invoice_number).filter(
+                tuple_(Invoice.company_id, Invoice.invoice_number).in_(keys[i:i + DEDUPE_LOOKUP_SIZE])
+            ).all())
+        return found
+
+def _outcome(line, status, invoice_id=None, error=None):
+    return {"line": line, "status": status, "invoice_id": invoice_id, "error": error}
+
+invoice_importer = InvoiceImporter()
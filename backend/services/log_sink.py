@@ -0,0 +1,299 @@
+import os
+import re
+import glob
+import json
+import time
+import uuid
+import threading
+from collections import deque
+from datetime import datetime, timezone
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import engine, dialect_insert
+from models.database_models import AuditLog, VerificationLog
+
+LOG_SINK_MODE = os.getenv("LOG_SINK_MODE", "BUFFERED") # BUFFERED, SYNC
+LOG_SINK_BATCH_SIZE = int(os.getenv("LOG_SINK_BATCH_SIZE", "500"))
+LOG_SINK_FLUSH_INTERVAL_SECONDS = float(os.getenv("LOG_SINK_FLUSH_INTERVAL_SECONDS", "1.0"))
+LOG_SINK_MAX_QUEUE = int(os.getenv("LOG_SINK_MAX_QUEUE", "50000"))
+LOG_SINK_PUT_TIMEOUT_SECONDS = float(os.getenv("LOG_SINK_PUT_TIMEOUT_SECONDS", "2.0"))
+LOG_SINK_SPILL_PATH = os.getenv("LOG_SINK_SPILL_PATH", "log_sink_spill.ndjson")
+LOG_SINK_FSYNC = os.getenv("LOG_SINK_FSYNC", "false").lower() == "true"
+
+# kind -> (model, name of its timestamp column)
+MODELS = {
+    "audit": (AuditLog, "timestamp"),
+    "verification": (VerificationLog, "created_at"),
+}
+
+class LogSink:
+    """
+    Write-behind sink for AuditLog / VerificationLog rows.
+
+    Entries are appended to a local spill file and queued in memory, then a background
+    thread bulk-inserts them when the batch size or flush interval is reached. The spill
+    file is rotated on every flush and only removed once its batch is committed, so
+    entries that were queued when the process died are replayed on the next start
+    (inserts skip ids that already made it). Each process spills to its own
+    "<spill_path>.<pid>" files, and start() only replays those of processes that are
+    gone, so a worker starting up never takes a live worker's segments.
+
+    A full queue blocks producers for up to put_timeout; after that the entry is
+    written synchronously in the caller's session. The *_async variants, for request
+    handlers on the event loop, never wait: with the queue full they go straight to
+    the caller's AsyncSession.
+
+    strict=True (or a sink that isn't running, e.g. in scripts) adds the row to the
+    caller's session instead, so it commits atomically with the caller's own changes.
+    """
+
+    def __init__(self, batch_size=LOG_SINK_BATCH_SIZE, flush_interval=LOG_SINK_FLUSH_INTERVAL_SECONDS,
+                 max_queue=LOG_SINK_MAX_QUEUE, put_timeout=LOG_SINK_PUT_TIMEOUT_SECONDS,
+                 spill_path=LOG_SINK_SPILL_PATH, fsync=LOG_SINK_FSYNC, bind=engine):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.put_timeout = put_timeout
+        self.spill_path = spill_path
+        self.fsync = fsync
+        self.bind = bind
+
+        self._buffer = deque()
+        self._cond = threading.Condition()
+        self._spill = None
+        self._spill_file = None # "<spill_path>.<pid>", set by start()
+        self._segment = 0
+        self._pending = [] # (rows_by_kind, inflight_path, row_count) batches not yet committed
+        self._pending_rows = 0
+        self._thread = None
+        self._stopping = False
+        self.running = False
+        self.counters = {"buffered": 0, "flushed": 0, "sync_fallback": 0, "flush_errors": 0}
+
+    # --- Producer API ---
+
+    def audit(self, db: Session, strict: bool = False, **fields):
+        self._submit("audit", [fields], db, strict)
+
+    def verification(self, db: Session, strict: bool = False, **fields):
+        self._submit("verification", [fields], db, strict)
+
+    def audit_many(self, db: Session, rows: list, strict: bool = False):
+        self._submit("audit", rows, db, strict)
+
+    def verification_many(self, db: Session, rows: list, strict: bool = False):
+        self._submit("verification", rows, db, strict)
+
+    async def audit_async(self, db: AsyncSession, strict: bool = False, **fields):
+        await self._submit_async("audit", [fields], db, strict)
+
+    async def verification_async(self, db: AsyncSession, strict: bool = False, **fields):
+        await self._submit_async("verification", [fields], db, strict)
+
+    def _submit(self, kind, rows, db, strict):
+        if not rows:
+            return
+        if strict or not self.running:
+            self._write_in_session(db, kind, rows)
+            return
+        if self._enqueue(kind, rows, self.put_timeout):
+            return
+        self.counters["sync_fallback"] += len(rows)
+        self._write_in_session(db, kind, rows)
+
+    async def _submit_async(self, kind, rows, db, strict):
+        if not rows:
+            return
+        if not strict and self.running:
+            # No backpressure wait here: it would stall the event loop
+            if self._enqueue(kind, rows, 0):
+                return
+            self.counters["sync_fallback"] += len(rows)
+        model, _ = MODELS[kind]
+        if len(rows) == 1:
+            db.add(model(**rows[0]))
+        else:
+            await db.execute(insert(model), rows)
+
+    def _enqueue(self, kind, rows, timeout) -> bool:
+        """Spills and queues the rows, waiting up to timeout for room; False if the queue stayed full"""
+        model, ts_column = MODELS[kind]
+        now = datetime.now(timezone.utc).isoformat()
+        entries = [{"kind": kind, "fields": {"id": str(uuid.uuid4()), ts_column: now, **row}} for row in rows]
+
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            # Backpressure: wait (bounded) for the flusher to make room
+            while self._queued() + len(entries) > self.max_queue and not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            if self._queued() + len(entries) <= self.max_queue and not self._stopping:
+                self._append_spill(entries)
+                self._buffer.extend(entries)
+                self.counters["buffered"] += len(entries)
+                if len(self._buffer) >= self.batch_size:
+                    self._cond.notify_all()
+                return True
+        return False
+
+    def _queued(self):
+        # Batches waiting on a DB retry still count against the queue bound
+        return len(self._buffer) + self._pending_rows
+
+    @staticmethod
+    def _write_in_session(db, kind, rows):
+        model, _ = MODELS[kind]
+        if len(rows) == 1:
+            db.add(model(**rows[0]))
+        else:
+            db.execute(insert(model), rows)
+
+    # --- Spill file ---
+
+    def _append_spill(self, entries):
+        self._spill.write("".join(json.dumps(entry) + "\n" for entry in entries))
+        self._spill.flush()
+        if self.fsync:
+            os.fsync(self._spill.fileno())
+
+    def _rotate_spill(self):
+        """Called with the lock held: moves the current spill file aside for the batch being flushed"""
+        self._spill.close()
+        self._segment += 1
+        inflight_path = f"{self._spill_file}.inflight-{self._segment}"
+        os.replace(self._spill_file, inflight_path)
+        self._spill = open(self._spill_file, "a")
+        return inflight_path
+
+    def _orphaned_spills(self):
+        """Spill files of processes that no longer exist, oldest entries first"""
+        # "<pid>", "<pid>.inflight-<n>" and "<pid>.replay-<id>" (an interrupted replay)
+        pattern = re.compile(r"(\d+)(?:\.(inflight|replay)-(\w+))?")
+        orphaned = []
+        for path in glob.glob(f"{glob.escape(self.spill_path)}.*"):
+            match = pattern.fullmatch(path[len(self.spill_path) + 1:])
+            if match is None:
+                continue
+            pid = int(match.group(1))
+            if pid != os.getpid() and _process_alive(pid):
+                continue
+            if match.group(2) == "replay":
+                order = (0, 0)
+            elif match.group(2) == "inflight":
+                order = (1, int(match.group(3)))
+            else:
+                order = (2, 0) # the live file holds entries queued after its in-flight segments
+            orphaned.append(((pid, *order), path))
+        return [path for _, path in sorted(orphaned)]
+
+    def _replay_spill(self):
+        for path in self._orphaned_spills():
+            # Claimed by rename, so two workers starting together never replay the same file
+            claimed = f"{self._spill_file}.replay-{uuid.uuid4().hex}"
+            try:
+                os.replace(path, claimed)
+            except FileNotFoundError:
+                continue
+            with open(claimed) as f:
+                entries = [json.loads(line) for line in f if line.strip()]
+            self._write_batch(_group_by_kind(entries))
+            os.remove(claimed)
+            print(f"[LOG SINK] Replayed {len(entries)} spilled log entries from {path}")
+
+    # --- Flusher ---
+
+    def _write_batch(self, rows_by_kind):
+        insert_for = dialect_insert(self.bind)
+        with self.bind.begin() as conn:
+            for kind, rows in rows_by_kind.items():
+                model, _ = MODELS[kind]
+                conn.execute(insert_for(model).on_conflict_do_nothing(index_elements=["id"]), rows)
+
+    def _flush_once(self):
+        with self._cond:
+            if not self._stopping and len(self._buffer) < self.batch_size:
+                self._cond.wait(self.flush_interval)
+            entries = list(self._buffer)
+            self._buffer.clear()
+            if entries:
+                self._pending.append((_group_by_kind(entries), self._rotate_spill(), len(entries)))
+                self._pending_rows += len(entries)
+
+        while self._pending:
+            rows_by_kind, inflight_path, row_count = self._pending[0]
+            try:
+                self._write_batch(rows_by_kind)
+            except Exception as e:
+                # Keep the batch (and its spill segment) and retry on the next cycle
+                self.counters["flush_errors"] += 1
+                print(f"[LOG SINK ERROR] {str(e)}")
+                return
+            self._pending.pop(0)
+            os.remove(inflight_path)
+            self.counters["flushed"] += row_count
+            with self._cond:
+                self._pending_rows -= row_count
+                self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            self._flush_once()
+            with self._cond:
+                if self._stopping and not self._buffer:
+                    break
+            if self._pending:
+                time.sleep(self.flush_interval)
+
+    # --- Lifecycle ---
+
+    def start(self):
+        if self.running or LOG_SINK_MODE != "BUFFERED":
+            return
+        self._spill_file = f"{self.spill_path}.{os.getpid()}"
+        self._replay_spill()
+        self._spill = open(self._spill_file, "a")
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="log-sink-flusher", daemon=True)
+        self._thread.start()
+        self.running = True
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join(timeout=30)
+        self._spill.close()
+        if not self._pending and os.path.exists(self._spill_file) and os.path.getsize(self._spill_file) == 0:
+            os.remove(self._spill_file)
+
+    def stats(self) -> dict:
+        return {"mode": LOG_SINK_MODE, "running": self.running, "queued": self._queued(), **self.counters}
+
+def _process_alive(pid) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True # Exists, owned by another user
+    return True
+
+def _group_by_kind(entries):
+    rows_by_kind = {}
+    for entry in entries:
+        model, ts_column = MODELS[entry["kind"]]
+        fields = dict(entry["fields"])
+        fields[ts_column] = datetime.fromisoformat(fields[ts_column])
+        rows_by_kind.setdefault(entry["kind"], []).append(fields)
+    return rows_by_kind
+
+log_sink = LogSink()
@@ -0,0 +1,271 @@
+import os
+import time
+import uuid
+import random
+import threading
+from collections import deque
+from datetime import datetime, timezone
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from database import engine
+from models.database_models import OTPDelivery
+from services.otp_service import OTP_PROVIDERS, OTP_DELIVERY_TIMEOUT_SECONDS, OTPDeliveryError, get_provider
+
+OTP_DELIVERY_WORKERS = int(os.getenv("OTP_DELIVERY_WORKERS", "8"))
+OTP_DELIVERY_MAX_ATTEMPTS = int(os.getenv("OTP_DELIVERY_MAX_ATTEMPTS", "6"))
+OTP_DELIVERY_BACKOFF_BASE_SECONDS = float(os.getenv("OTP_DELIVERY_BACKOFF_BASE_SECONDS", "1"))
+OTP_DELIVERY_BACKOFF_MAX_SECONDS = float(os.getenv("OTP_DELIVERY_BACKOFF_MAX_SECONDS", "30"))
+OTP_DELIVERY_MAX_QUEUE = int(os.getenv("OTP_DELIVERY_MAX_QUEUE", "10000"))
+OTP_DELIVERY_RECORD_INTERVAL_SECONDS = float(os.getenv("OTP_DELIVERY_RECORD_INTERVAL_SECONDS", "1"))
+
+# otp_deliveries.status
+SENT = "SENT"
+FAILED = "FAILED"
+EXPIRED = "EXPIRED"
+
+class _Delivery:
+    def __init__(self, identity_value, otp, ttl):
+        self.id = str(uuid.uuid4())
+        self.identity_value = identity_value
+        self.otp = otp
+        self.expires_at = time.monotonic() + ttl
+        self.queued_at = datetime.now(timezone.utc)
+        self.attempts = 0
+        self.next_provider = 0 # index into the failover chain, counted across rounds
+        self.last_error = None
+
+class OTPDispatcher:
+    """
+    Sends OTP messages off the request thread.
+
+    submit() only appends to a bounded in-memory queue. A fixed pool of worker threads
+    takes messages from it, so at most `workers` provider calls are in flight however
+    large the burst, and every call shares one keep-alive requests.Session with a
+    timeout. A failed call fails over to the next provider in the chain straight away;
+    once every provider has failed, the message waits with exponential backoff and
+    jitter before the next round. It is given up after max_attempts calls in total, or
+    when the code it carries has expired.
+
+    Outcomes are not written by the workers. They are collected and inserted into
+    otp_deliveries in batches every record_interval. The code itself is never stored.
+    """
+
+    def __init__(self, providers=OTP_PROVIDERS, workers=OTP_DELIVERY_WORKERS, timeout=OTP_DELIVERY_TIMEOUT_SECONDS,
+                 max_attempts=OTP_DELIVERY_MAX_ATTEMPTS, backoff_base=OTP_DELIVERY_BACKOFF_BASE_SECONDS,
+                 backoff_max=OTP_DELIVERY_BACKOFF_MAX_SECONDS, max_queue=OTP_DELIVERY_MAX_QUEUE,
+                 record_interval=OTP_DELIVERY_RECORD_INTERVAL_SECONDS, bind=engine):
+        self.providers = [get_provider(name) if isinstance(name, str) else name for name in providers]
+        self.workers = workers
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_queue = max_queue
+        self.record_interval = record_interval
+        self.bind = bind
+
+        self._ready = deque()
+        self._retries = [] # (due_at, _Delivery)
+        self._outcomes = [] # rows for otp_deliveries not yet written
+        self._cond = threading.Condition()
+        self._outcome_lock = threading.Lock()
+        self._threads = []
+        self._recorder = None
+        self._session = None
+        self._stopping = False
+        self._stop_recorder = threading.Event()
+        self.running = False
+        self.counters = {"queued": 0, "sent": 0, "failed": 0, "expired": 0, "rejected": 0, "failovers": 0, "attempts": 0}
+
+    # --- Producer API ---
+
+    def submit(self, identity_value: str, otp: str, ttl: float) -> bool:
+        """
+        Queues a message; False if the queue is full. When the dispatcher is not
+        running (scripts, tests) the message is sent inline instead.
+        """
+        delivery = _Delivery(identity_value, otp, ttl)
+        if not self.running:
+            self._send_inline(delivery)
+            return True
+        with self._cond:
+            if len(self._ready) + len(self._retries) >= self.max_queue:
+                self.counters["rejected"] += 1
+                return False
+            self._ready.append(delivery)
+            self.counters["queued"] += 1
+            self._cond.notify()
+        return True
+
+    # --- Workers ---
+
+    def _next(self):
+        """Blocks until a message is ready or a retry is due; None once stopping with nothing ready"""
+        with self._cond:
+            while True:
+                if self._ready:
+                    return self._ready.popleft()
+                now = time.monotonic()
+                due = next((i for i, (due_at, _) in enumerate(self._retries) if due_at <= now), None)
+                if due is not None:
+                    return self._retries.pop(due)[1]
+                if self._stopping:
+                    return None
+                next_due = min((due_at for due_at, _ in self._retries), default=now + 1.0)
+                self._cond.wait(max(0.01, min(1.0, next_due - now)))
+
+    def _run(self):
+        while True:
+            delivery = self._next()
+            if delivery is None:
+                return
+            try:
+                self._attempt(delivery)
+            except Exception as e:
+                delivery.last_error = f"{type(e).__name__}: {str(e)[:500]}"
+                self._finish(delivery, FAILED)
+
+    def _call(self, delivery, session):
+        """One provider call; returns (provider, message_id) or raises with the failure recorded on the delivery"""
+        provider = self.providers[delivery.next_provider % len(self.providers)]
+        delivery.attempts += 1
+        self.counters["attempts"] += 1
+        try:
+            return provider, provider.send(session, delivery.identity_value, delivery.otp, self.timeout)
+        except (OTPDeliveryError, requests.RequestException) as e:
+            delivery.last_error = f"{provider.name}: {type(e).__name__}: {str(e)[:500]}"
+            delivery.next_provider += 1
+            raise
+
+    def _attempt(self, delivery):
+        if time.monotonic() >= delivery.expires_at:
+            self._finish(delivery, EXPIRED)
+            return
+        try:
+            provider, message_id = self._call(delivery, self._session)
+        except (OTPDeliveryError, requests.RequestException):
+            if delivery.attempts >= self.max_attempts:
+                self._finish(delivery, FAILED)
+                return
+            with self._cond:
+                if delivery.next_provider % len(self.providers):
+                    # Fail over to the next provider now; only a full round of failures backs off
+                    self.counters["failovers"] += 1
+                    self._ready.appendleft(delivery)
+                else:
+                    self._retries.append((time.monotonic() + self._backoff(delivery.next_provider // len(self.providers)), delivery))
+                self._cond.notify()
+            return
+        self._finish(delivery, SENT, provider.name, message_id)
+
+    def _send_inline(self, delivery):
+        # One round through the chain, no backoff: the caller is waiting
+        with requests.Session() as session:
+            for _ in self.providers:
+                try:
+                    provider, message_id = self._call(delivery, session)
+                except (OTPDeliveryError, requests.RequestException):
+                    continue
+                self._finish(delivery, SENT, provider.name, message_id)
+                break
+            else:
+                self._finish(delivery, FAILED)
+        self.flush_outcomes()
+
+    def _backoff(self, rounds):
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (rounds - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    # --- Outcomes ---
+
+    def _finish(self, delivery, status, provider_name=None, message_id=None):
+        if provider_name is None and delivery.attempts:
+            provider_name = self.providers[(delivery.next_provider - 1) % len(self.providers)].name
+        self.counters[status.lower()] += 1
+        with self._outcome_lock:
+            self._outcomes.append({
+                "id": delivery.id,
+                "identity_value": delivery.identity_value,
+                "status": status,
+                "provider": provider_name,
+                "provider_message_id": message_id,
+                "attempts": delivery.attempts,
+                "last_error": delivery.last_error if status != SENT else None,
+                "queued_at": delivery.queued_at,
+                "completed_at": datetime.now(timezone.utc),
+            })
+
+    def flush_outcomes(self):
+        with self._outcome_lock:
+            rows, self._outcomes = self._outcomes, []
+        if not rows:
+            return
+        try:
+            with self.bind.begin() as conn:
+                conn.execute(OTPDelivery.__table__.insert(), rows)
+        except Exception as e:
+            # Status is bookkeeping: put the rows back for the next flush rather than block delivery
+            with self._outcome_lock:
+                self._outcomes[:0] = rows
+            print(f"[OTP DELIVERY ERROR] Could not record {len(rows)} outcomes: {str(e)}")
+
+    def _record(self):
+        while not self._stop_recorder.wait(self.record_interval):
+            self.flush_outcomes()
+
+    # --- Lifecycle ---
+
+    def start(self):
+        if self.running:
+            return
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.workers)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._stopping = False
+        self._stop_recorder.clear()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"otp-delivery-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        self._recorder = threading.Thread(target=self._record, name="otp-delivery-recorder", daemon=True)
+        self._recorder.start()
+        self.running = True
+
+    def stop(self, timeout=10):
+        """Sends what is queued (one attempt each), gives up on retries still in backoff"""
+        if not self.running:
+            return
+        self.running = False
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        with self._cond:
+            leftovers = [delivery for _, delivery in self._retries] + list(self._ready)
+            self._retries, self._ready = [], deque()
+        for delivery in leftovers:
+            delivery.last_error = f"Shutdown before retry: {delivery.last_error}"
+            self._finish(delivery, FAILED)
+        self._stop_recorder.set()
+        self._recorder.join(timeout=timeout)
+        self.flush_outcomes()
+        self._session.close()
+        self._session = None
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "running": self.running,
+                "providers": [provider.name for provider in self.providers],
+                "queue": len(self._ready),
+                "retrying": len(self._retries),
+                **self.counters,
+            }
+
+otp_dispatcher = OTPDispatcher()
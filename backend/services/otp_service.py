@@ -3,44 +3,98 @@ import os
 import requests
 
 OTP_PROVIDER = os.getenv("OTP_PROVIDER", "MOCK")
+# Failover order for delivery, e.g. "AUTOMATEX,TWILIO"; defaults to OTP_PROVIDER alone
+OTP_PROVIDERS = [p.strip() for p in os.getenv("OTP_PROVIDERS", OTP_PROVIDER).split(",") if p.strip()]
+OTP_DELIVERY_TIMEOUT_SECONDS = float(os.getenv("OTP_DELIVERY_TIMEOUT_SECONDS", "5"))
+
+AUTOMATEX_API_URL = os.getenv("AUTOMATEX_API_URL", "https://automatexindia.com/api/v1/whatsapp/send/template")
+TWILIO_API_URL = os.getenv("TWILIO_API_URL", "https://api.twilio.com")
+
+class OTPDeliveryError(Exception):
+    """A provider could not accept the message; the dispatcher fails over to the next one"""
 
 def generate_otp(identity_value: str) -> str:
     """Generates a 6-digit OTP"""
     return str(random.randint(100000, 999999))
 
-def send_otp(identity_value: str, otp: str):
-    """
-    Sends the OTP using the configured provider.
-    Supports MOCK, TWILIO, and AUTOMATEX.
-    """
-    if OTP_PROVIDER == "MOCK":
+class MockProvider:
+    name = "MOCK"
+
+    def send(self, session, identity_value: str, otp: str, timeout: float):
         print(f"[MOCK OTP] Sending OTP {otp} to {identity_value}")
-        return {"status": "success", "provider": "mock"}
-    elif OTP_PROVIDER == "TWILIO":
-        # Placeholder for Twilio integration
-        print(f"[TWILIO] Sending OTP {otp} to {identity_value}")
-        return {"status": "success", "provider": "twilio"}
-    elif OTP_PROVIDER == "AUTOMATEX":
-        api_token = os.getenv("AUTOMATEX_API_TOKEN")
-        phone_id = os.getenv("AUTOMATEX_PHONE_NUMBER_ID")
-        template_id = os.getenv("AUTOMATEX_TEMPLATE_ID")
-        
-        url = "https://automatexindia.com/api/v1/whatsapp/send/template"
+        return None
+
+class TwilioProvider:
+    """SMS through Twilio's Messages API"""
+
+    name = "TWILIO"
+
+    def __init__(self, api_url=TWILIO_API_URL):
+        self.api_url = api_url
+        self.account_sid = os.getenv("TWILIO_ACCOUNT_SID")
+        self.auth_token = os.getenv("TWILIO_AUTH_TOKEN")
+        self.from_number = os.getenv("TWILIO_FROM_NUMBER")
+
+    def send(self, session, identity_value: str, otp: str, timeout: float):
+        if not (self.account_sid and self.auth_token and self.from_number):
+            raise OTPDeliveryError("Twilio credentials are not configured")
+        response = session.post(
+            f"{self.api_url}/2010-04-01/Accounts/{self.account_sid}/Messages.json",
+            auth=(self.account_sid, self.auth_token),
+            data={"To": identity_value, "From": self.from_number, "Body": f"Your verification code is {otp}"},
+            timeout=timeout,
+        )
+        if response.status_code >= 300:
+            raise OTPDeliveryError(f"HTTP {response.status_code}: {response.text[:500]}")
+        return response.json().get("sid")
+
+class AutomateXProvider:
+    """WhatsApp template message through AutomateX"""
+
+    name = "AUTOMATEX"
+
+    def __init__(self, api_url=AUTOMATEX_API_URL):
+        self.api_url = api_url
+        self.api_token = os.getenv("AUTOMATEX_API_TOKEN")
+        self.phone_id = os.getenv("AUTOMATEX_PHONE_NUMBER_ID")
+        self.template_id = os.getenv("AUTOMATEX_TEMPLATE_ID")
+
+    def send(self, session, identity_value: str, otp: str, timeout: float):
         payload = {
-            "apiToken": api_token,
-            "phone_number_id": phone_id,
-            "template_id": template_id,
+            "apiToken": self.api_token,
+            "phone_number_id": self.phone_id,
+            "template_id": self.template_id,
             "templateVariable-calling-1": otp,
             "phone_number": identity_value
         }
-        
-        try:
-            print(f"[AUTOMATEX] Sending OTP {otp} to {identity_value} via WhatsApp...")
-            response = requests.post(url, data=payload)
-            response.raise_for_status()
-            return {"status": "success", "provider": "automatex", "data": response.json()}
-        except Exception as e:
-            print(f"[AUTOMATEX ERROR] {str(e)}")
-            return {"status": "error", "message": str(e)}
-    else:
-        raise ValueError(f"Unknown OTP provider: {OTP_PROVIDER}")
+        print(f"[AUTOMATEX] Sending OTP {otp} to {identity_value} via WhatsApp...")
+        response = session.post(self.api_url, data=payload, timeout=timeout)
+        if response.status_code >= 300:
+            raise OTPDeliveryError(f"HTTP {response.status_code}: {response.text[:500]}")
+        return None
+
+PROVIDERS = {
+    "MOCK": MockProvider,
+    "TWILIO": TwilioProvider,
+    "AUTOMATEX": AutomateXProvider,
+}
+
+def get_provider(name: str):
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown OTP provider: {name}")
+    return PROVIDERS[name]()
+
+def send_otp(identity_value: str, otp: str):
+    """
+    Sends the OTP synchronously using the configured provider (scripts and tests; the
+    API queues it on services/otp_delivery.py instead).
+    Supports MOCK, TWILIO, and AUTOMATEX.
+    """
+    provider = get_provider(OTP_PROVIDER)
+    try:
+        with requests.Session() as session:
+            message_id = provider.send(session, identity_value, otp, OTP_DELIVERY_TIMEOUT_SECONDS)
+        return {"status": "success", "provider": provider.name.lower(), "message_id": message_id}
+    except (OTPDeliveryError, requests.RequestException) as e:
+        print(f"[{provider.name} ERROR] {str(e)}")
+        return {"status": "error", "message": str(e)}
@@ -0,0 +1,378 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update, delete, insert, exists, func, literal
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from database import engine
+from models.database_models import OTPLog, OTPHistory
+from services.credit_cache import LocalKeyValueStore
+
+OTP_STORE_BACKEND = os.getenv("OTP_STORE_BACKEND", "DATABASE") # DATABASE, MEMORY, REDIS, LOCAL
+OTP_TTL_SECONDS = int(os.getenv("OTP_TTL_SECONDS", "300"))
+OTP_VERIFIED_TTL_SECONDS = int(os.getenv("OTP_VERIFIED_TTL_SECONDS", "1800"))
+OTP_SWEEP_INTERVAL_SECONDS = float(os.getenv("OTP_SWEEP_INTERVAL_SECONDS", "60"))
+OTP_SWEEP_BATCH_SIZE = int(os.getenv("OTP_SWEEP_BATCH_SIZE", "1000"))
+
+# otp_history events
+ISSUED = "ISSUED"
+VERIFIED = "VERIFIED"
+FAILED = "FAILED"
+CONSUMED = "CONSUMED"
+
+class DatabaseOTPBackend:
+    """
+    Active codes as otp_logs rows, shared by every worker. Lookups use the
+    (identity_type, identity_value, expiry_time) index; expired rows are deleted
+    by purge_expired() in batches so the table only holds live codes.
+    """
+
+    name = "database"
+
+    def __init__(self, bind=engine):
+        self.bind = bind
+
+    @staticmethod
+    def _latest(conn, identity_type, identity_value, verified):
+        return conn.execute(
+            select(OTPLog.id, OTPLog.otp).where(
+                OTPLog.identity_type == identity_type,
+                OTPLog.identity_value == identity_value,
+                OTPLog.verified == verified,
+                OTPLog.is_used == False,
+                OTPLog.expiry_time > datetime.utcnow()
+            ).order_by(OTPLog.expiry_time.desc()).limit(1)
+        ).first()
+
+    def issue(self, identity_type, identity_value, otp, ttl):
+        with self.bind.begin() as conn:
+            conn.execute(insert(OTPLog).values(
+                identity_type=identity_type, identity_value=identity_value, otp=otp,
+                expiry_time=datetime.utcnow() + timedelta(seconds=ttl)
+            ))
+
+    def verify(self, identity_type, identity_value, otp, verified_ttl):
+        with self.bind.begin() as conn:
+            row = self._latest(conn, identity_type, identity_value, verified=False)
+            if row is None:
+                return None
+            if row.otp != otp:
+                conn.execute(update(OTPLog).where(OTPLog.id == row.id).values(attempt_count=OTPLog.attempt_count + 1))
+                return False
+            conn.execute(update(OTPLog).where(OTPLog.id == row.id).values(
+                verified=True, expiry_time=datetime.utcnow() + timedelta(seconds=verified_ttl)
+            ))
+            return True
+
+    def is_verified(self, identity_type, identity_value):
+        with self.bind.connect() as conn:
+            return self._latest(conn, identity_type, identity_value, verified=True) is not None
+
+    def consume(self, db, identity_type, identity_value):
+        # In the caller's transaction, so a rolled-back registration leaves the code unused
+        row = self._latest(db, identity_type, identity_value, verified=True)
+        if row is None:
+            return None
+        # Guarded on is_used, so of two concurrent consumers only one gets the code
+        result = db.execute(update(OTPLog).where(OTPLog.id == row.id, OTPLog.is_used == False).values(is_used=True))
+        return True if result.rowcount == 1 else None
+
+    def release(self, identity_type, identity_value, claim):
+        pass # The caller's rollback already undid is_used
+
+    def purge_expired(self, batch_size):
+        purged = 0
+        while True:
+            # Small transactions: a large backlog never holds long locks on the table
+            with self.bind.begin() as conn:
+                expired = select(OTPLog.id).where(OTPLog.expiry_time <= datetime.utcnow()).limit(batch_size)
+                deleted = conn.execute(delete(OTPLog).where(OTPLog.id.in_(expired))).rowcount
+            purged += deleted
+            if deleted < batch_size:
+                return purged
+
+    def size(self):
+        with self.bind.connect() as conn:
+            return conn.execute(select(func.count()).select_from(OTPLog)).scalar()
+
+class InMemoryOTPBackend:
+    """Per-process codes; only correct when one process serves every OTP request"""
+
+    name = "memory"
+
+    def __init__(self):
+        self._codes = {} # (identity_type, identity_value) -> {"otp", "attempts", "verified", "used", "expires_at"}
+        self._lock = threading.Lock()
+
+    def _alive(self, key):
+        code = self._codes.get(key)
+        if code is not None and code["expires_at"] <= time.monotonic():
+            del self._codes[key]
+            return None
+        return code
+
+    def issue(self, identity_type, identity_value, otp, ttl):
+        with self._lock:
+            # A new code replaces the previous one, as only the latest was ever checked
+            self._codes[(identity_type, identity_value)] = {
+                "otp": otp, "attempts": 0, "verified": False, "used": False, "expires_at": time.monotonic() + ttl
+            }
+
+    def verify(self, identity_type, identity_value, otp, verified_ttl):
+        with self._lock:
+            code = self._alive((identity_type, identity_value))
+            if code is None or code["verified"]:
+                return None
+            if code["otp"] != otp:
+                code["attempts"] += 1
+                return False
+            code["verified"] = True
+            code["expires_at"] = time.monotonic() + verified_ttl
+            return True
+
+    def is_verified(self, identity_type, identity_value):
+        with self._lock:
+            code = self._alive((identity_type, identity_value))
+            return code is not None and code["verified"] and not code["used"]
+
+    def consume(self, db, identity_type, identity_value):
+        with self._lock:
+            code = self._alive((identity_type, identity_value))
+            if code is None or not code["verified"] or code["used"]:
+                return None
+            code["used"] = True
+            return code
+
+    def release(self, identity_type, identity_value, claim):
+        with self._lock:
+            # Unless a new code has replaced it since
+            if self._codes.get((identity_type, identity_value)) is claim:
+                claim["used"] = False
+
+    def purge_expired(self, batch_size):
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, code in self._codes.items() if code["expires_at"] <= now]
+            for key in expired:
+                del self._codes[key]
+        return len(expired)
+
+    def size(self):
+        return len(self._codes)
+
+class SharedStoreOTPBackend:
+    """
+    Codes in a Redis-compatible store shared by all workers; the store's own TTL
+    (SET ... EX) expires them, so there is nothing to purge. A consumed code is
+    deleted rather than flagged.
+    """
+
+    name = "shared"
+
+    def __init__(self, client, prefix: str = "otp"):
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, identity_type, identity_value):
+        return f"{self.prefix}:{identity_type}:{identity_value}"
+
+    def _get(self, key):
+        raw = self.client.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    def _put(self, key, code):
+        ttl = int(code["expires_at"] - time.time())
+        if ttl > 0:
+            self.client.set(key, json.dumps(code), ex=ttl)
+
+    def issue(self, identity_type, identity_value, otp, ttl):
+        self._put(self._key(identity_type, identity_value), {
+            "otp": otp, "attempts": 0, "verified": False, "expires_at": time.time() + ttl
+        })
+
+    def verify(self, identity_type, identity_value, otp, verified_ttl):
+        key = self._key(identity_type, identity_value)
+        code = self._get(key)
+        if code is None or code["verified"]:
+            return None
+        if code["otp"] != otp:
+            code["attempts"] += 1
+            self._put(key, code)
+            return False
+        code["verified"] = True
+        code["expires_at"] = time.time() + verified_ttl
+        self._put(key, code)
+        return True
+
+    def is_verified(self, identity_type, identity_value):
+        code = self._get(self._key(identity_type, identity_value))
+        return code is not None and code["verified"]
+
+    def consume(self, db, identity_type, identity_value):
+        key = self._key(identity_type, identity_value)
+        code = self._get(key)
+        if code is None or not code["verified"]:
+            return None
+        # DEL is atomic in the store: of two workers consuming the same code, only one deletes it
+        return code if self.client.delete(key) == 1 else None
+
+    def release(self, identity_type, identity_value, claim):
+        # NX: a code issued since the consume is left alone
+        ttl = int(claim["expires_at"] - time.time())
+        if ttl > 0:
+            self.client.set(self._key(identity_type, identity_value), json.dumps(claim), ex=ttl, nx=True)
+
+    def purge_expired(self, batch_size):
+        return 0
+
+    def size(self):
+        return None
+
+class OTPStore:
+    """
+    One-time passwords: live codes in a pluggable backend with TTL expiry, and every
+    issue / verify / consume appended to otp_history in the caller's session, so the
+    event commits with the request's own changes.
+
+    A verified code stays consumable for verified_ttl. The durable "this Aadhaar has
+    been OTP-verified" fact that the credit checks rely on is read from otp_history,
+    not from the codes, so codes can expire and be purged freely. A background sweeper
+    purges expired codes every sweep_interval, sweep_batch_size rows per transaction.
+    """
+
+    def __init__(self, backend, ttl=OTP_TTL_SECONDS, verified_ttl=OTP_VERIFIED_TTL_SECONDS,
+                 sweep_interval=OTP_SWEEP_INTERVAL_SECONDS, sweep_batch_size=OTP_SWEEP_BATCH_SIZE, bind=engine):
+        self.backend = backend
+        self.ttl = ttl
+        self.verified_ttl = verified_ttl
+        self.sweep_interval = sweep_interval
+        self.sweep_batch_size = sweep_batch_size
+        self.bind = bind
+        self._stop = threading.Event()
+        self._thread = None
+        self.counters = {"issued": 0, "verified": 0, "failed": 0, "consumed": 0, "purged": 0}
+
+    @staticmethod
+    def _record(db: Session, identity_type, identity_value, event):
+        db.add(OTPHistory(identity_type=identity_type, identity_value=identity_value, event=event))
+
+    def issue(self, db: Session, identity_type: str, identity_value: str, otp: str):
+        self.backend.issue(identity_type, identity_value, otp, self.ttl)
+        self._record(db, identity_type, identity_value, ISSUED)
+        self.counters["issued"] += 1
+
+    def verify(self, db: Session, identity_type: str, identity_value: str, otp: str):
+        """True on a match, False on a wrong code, None when there is no live unverified code"""
+        outcome = self.backend.verify(identity_type, identity_value, otp, self.verified_ttl)
+        if outcome is not None:
+            self._record(db, identity_type, identity_value, VERIFIED if outcome else FAILED)
+            self.counters["verified" if outcome else "failed"] += 1
+        return outcome
+
+    def is_verified(self, identity_type: str, identity_value: str) -> bool:
+        """Whether a verified, unused code is waiting to be consumed"""
+        return self.backend.is_verified(identity_type, identity_value)
+
+    def consume(self, db: Session, identity_type: str, identity_value: str) -> bool:
+        """
+        Marks the verified code used as part of db's transaction; False if there is none
+        (or another request took it). If that transaction rolls back or is closed
+        without committing, the code is released and can be consumed again.
+        """
+        claim = self.backend.consume(db, identity_type, identity_value)
+        if claim is None:
+            return False
+        db.info.setdefault(_OTP_CLAIMS, []).append((self.backend, identity_type, identity_value, claim))
+        self._record(db, identity_type, identity_value, CONSUMED)
+        self.counters["consumed"] += 1
+        return True
+
+    # --- Sweeper ---
+
+    def backfill_history(self):
+        """
+        Copies verifications that only exist in otp_logs (written before otp_history
+        existed) into the history, keeping the otp_logs id so reruns insert nothing.
+        Runs before the first sweep, which would otherwise purge them.
+        """
+        with self.bind.begin() as conn:
+            conn.execute(insert(OTPHistory).from_select(
+                ["id", "identity_type", "identity_value", "event"],
+                select(OTPLog.id, OTPLog.identity_type, OTPLog.identity_value, literal(VERIFIED)).where(
+                    OTPLog.verified == True,
+                    ~exists().where(OTPHistory.id == OTPLog.id)
+                )
+            ))
+
+    def sweep(self) -> int:
+        purged = self.backend.purge_expired(self.sweep_batch_size)
+        self.counters["purged"] += purged
+        return purged
+
+    def _run(self):
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"[OTP SWEEPER ERROR] {str(e)}")
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self.backfill_history()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="otp-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=5)
+        self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend.name,
+            "ttl_seconds": self.ttl,
+            "verified_ttl_seconds": self.verified_ttl,
+            "live_codes": self.backend.size(),
+            **self.counters,
+        }
+
+# Session.info key of the codes a session consumed and has not committed yet
+_OTP_CLAIMS = "otp_claims"
+
+@event.listens_for(Session, "after_commit")
+def _keep_otp_claims(session):
+    session.info.pop(_OTP_CLAIMS, None)
+
+@event.listens_for(Session, "after_transaction_end")
+def _release_otp_claims(session, transaction):
+    # Still present at the end of the outermost transaction only if it did not commit
+    if transaction.parent is not None:
+        return
+    for backend, identity_type, identity_value, claim in session.info.pop(_OTP_CLAIMS, ()):
+        try:
+            backend.release(identity_type, identity_value, claim)
+        except Exception as e:
+            print(f"[OTP STORE ERROR] Could not release code for {identity_type}: {str(e)}")
+
+def _backend_from_env():
+    if OTP_STORE_BACKEND == "DATABASE":
+        return DatabaseOTPBackend()
+    elif OTP_STORE_BACKEND == "MEMORY":
+        return InMemoryOTPBackend()
+    elif OTP_STORE_BACKEND == "REDIS":
+        import redis # Optional dependency, only needed for the shared backend
+        return SharedStoreOTPBackend(redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0")))
+    elif OTP_STORE_BACKEND == "LOCAL":
+        return SharedStoreOTPBackend(LocalKeyValueStore())
+    else:
+        raise ValueError(f"Unknown OTP store backend: {OTP_STORE_BACKEND}")
+
+otp_store = OTPStore(_backend_from_env())
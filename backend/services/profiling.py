@@ -0,0 +1,163 @@
+import os
+import time
+import bisect
+import threading
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+CREDIT_PROFILING = os.getenv("CREDIT_PROFILING", "HEADER") # OFF, HEADER (only when requested), ALWAYS
+DEBUG_TIMING_HEADER = "X-Debug-Timing"
+
+# Histogram bucket upper bounds; milliseconds for *.ms series, plain counts for *.queries
+BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.total, 3),
+            "avg": round(self.total / self.count, 3) if self.count else 0.0,
+            "buckets": {**{f"le_{b}": c for b, c in zip(BUCKETS, self.counts)}, "le_inf": self.counts[-1]},
+        }
+
+class HistogramRegistry:
+    """In-process registry of named histograms (per worker)"""
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {name: h.snapshot() for name, h in sorted(self._histograms.items())}
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+registry = HistogramRegistry()
+
+class RequestProfile:
+    """Wall time and query count per stage for one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def _stage(self, name):
+        entry = self.stages.get(name)
+        if entry is None:
+            entry = self.stages[name] = {"ms": 0.0, "queries": 0}
+        return entry
+
+    def add_time(self, name: str, ms: float):
+        self._stage(name)["ms"] += ms
+
+    def add_query(self, name: str):
+        self._stage(name)["queries"] += 1
+
+    def finish(self):
+        """Records every stage of this request into the histogram registry"""
+        for name, entry in self.stages.items():
+            registry.observe(f"{name}.ms", entry["ms"])
+            registry.observe(f"{name}.queries", entry["queries"])
+        registry.observe("request.ms", (time.perf_counter() - self.started) * 1000)
+
+    def server_timing(self) -> str:
+        metrics = [
+            f'{name.replace(".", "-")};dur={entry["ms"]:.2f};desc="{entry["queries"]} queries"'
+            for name, entry in self.stages.items()
+        ]
+        metrics.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.2f}")
+        return ", ".join(metrics)
+
+_current_profile = ContextVar("credit_profile", default=None)
+# Kept in its own ContextVar (not on the profile) so concurrent asyncio tasks each see their own stage
+_current_stage = ContextVar("credit_profile_stage", default="unstaged")
+
+def begin_profile():
+    profile = RequestProfile()
+    return profile, _current_profile.set(profile)
+
+def end_profile(token):
+    _current_profile.reset(token)
+
+@contextmanager
+def stage(name: str):
+    """Times a block of the pipeline; a no-op unless the request is being profiled"""
+    profile = _current_profile.get()
+    if profile is None or _current_stage.get() == name:
+        yield
+        return
+    token = _current_stage.set(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_time(name, (time.perf_counter() - start) * 1000)
+        _current_stage.reset(token)
+
+def profiled(name: str):
+    """Decorator form of stage() for the credit_engine functions"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current_profile.get() is None:
+                return fn(*args, **kwargs)
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+async def profile_request(request, call_next):
+    """
+    HTTP middleware: profiles the request when CREDIT_PROFILING is ALWAYS, or HEADER and the
+    client sent X-Debug-Timing. The breakdown goes to the registry either way; it is only
+    returned (as Server-Timing) when the debug header was sent.
+    """
+    requested = DEBUG_TIMING_HEADER in request.headers
+    if CREDIT_PROFILING == "OFF" or (CREDIT_PROFILING != "ALWAYS" and not requested):
+        return await call_next(request)
+
+    profile, token = begin_profile()
+    try:
+        response = await call_next(request)
+    finally:
+        end_profile(token)
+        profile.finish()
+    if requested:
+        response.headers["Server-Timing"] = profile.server_timing()
+    return response
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.add_query(_current_stage.get())
+
+def install_query_counter(bind):
+    """
+    Attributes every statement on this (sync) engine to the current profiling stage.
+    Called by main.py rather than at import, so importing credit_engine (rescoring
+    workers, tests) does not import database and build its engines.
+    """
+    event.listen(bind, "before_cursor_execute", _count_query)
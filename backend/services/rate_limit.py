@@ -0,0 +1,128 @@
+import os
+import math
+import time
+import threading
+from typing import NamedTuple
+
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "MEMORY") # MEMORY (per worker), REDIS (shared), OFF
+RATE_LIMIT_DEFAULT_PER_SECOND = float(os.getenv("RATE_LIMIT_DEFAULT_PER_SECOND", "10"))
+RATE_LIMIT_DEFAULT_BURST = int(os.getenv("RATE_LIMIT_DEFAULT_BURST", "20"))
+
+class RateLimitDecision(NamedTuple):
+    allowed: bool
+    limit: int # bucket capacity (burst)
+    remaining: int # whole tokens left after this request
+    reset_seconds: int # until the bucket is full again
+    retry_after_seconds: int # until the next request can pass (0 when allowed)
+
+    def headers(self) -> dict:
+        headers = {
+            "RateLimit-Limit": str(self.limit),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(self.reset_seconds),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(self.retry_after_seconds)
+        return headers
+
+def _decision(allowed, tokens, rate, burst):
+    return RateLimitDecision(
+        allowed=allowed,
+        limit=burst,
+        remaining=int(tokens),
+        reset_seconds=math.ceil((burst - tokens) / rate),
+        retry_after_seconds=0 if allowed else math.ceil((1 - tokens) / rate),
+    )
+
+class InMemoryTokenBucketLimiter:
+    """Token buckets per key in this worker process; with N workers each one allows the full rate"""
+
+    name = "memory"
+
+    def __init__(self):
+        self._buckets = {} # key -> [tokens, last_refill]
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str, rate: float, burst: int) -> RateLimitDecision:
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(burst), now]
+            tokens = min(float(burst), bucket[0] + (now - bucket[1]) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            bucket[0], bucket[1] = tokens, now
+        return _decision(allowed, tokens, rate, burst)
+
+# Refill + take in one round trip, atomically, on the store's clock
+_TOKEN_BUCKET_SCRIPT = """
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+class SharedTokenBucketLimiter:
+    """Token buckets kept in Redis so the limit holds across all workers"""
+
+    name = "shared"
+
+    def __init__(self, client, prefix: str = "rate-limit"):
+        self.prefix = prefix
+        self._script = client.register_script(_TOKEN_BUCKET_SCRIPT)
+
+    def acquire(self, key: str, rate: float, burst: int) -> RateLimitDecision:
+        allowed, tokens = self._script(keys=[f"{self.prefix}:{key}"], args=[rate, burst])
+        return _decision(bool(allowed), float(tokens), rate, burst)
+
+class ConsumerRateLimiter:
+    """Applies each consumer's own rate/burst (or the defaults) through the configured limiter"""
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.rejected = 0
+
+    def check(self, consumer) -> RateLimitDecision:
+        if self.limiter is None:
+            return None
+        rate = consumer.rate_limit_per_second or RATE_LIMIT_DEFAULT_PER_SECOND
+        burst = consumer.rate_limit_burst or RATE_LIMIT_DEFAULT_BURST
+        decision = self.limiter.acquire(consumer.id, rate, burst)
+        if not decision.allowed:
+            self.rejected += 1
+        return decision
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.limiter.name if self.limiter else "off",
+            "default_per_second": RATE_LIMIT_DEFAULT_PER_SECOND,
+            "default_burst": RATE_LIMIT_DEFAULT_BURST,
+            "rejected": self.rejected,
+        }
+
+def _limiter_from_env():
+    if RATE_LIMIT_BACKEND == "MEMORY":
+        return InMemoryTokenBucketLimiter()
+    elif RATE_LIMIT_BACKEND == "REDIS":
+        import redis # Optional dependency, only needed for the shared backend
+        return SharedTokenBucketLimiter(redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0")))
+    elif RATE_LIMIT_BACKEND == "OFF":
+        return None
+    else:
+        raise ValueError(f"Unknown rate limit backend: {RATE_LIMIT_BACKEND}")
+
+rate_limiter = ConsumerRateLimiter(_limiter_from_env())
@@ -0,0 +1,261 @@
+import os
+import re
+import base64
+from datetime import datetime
+
+import orjson
+from fastapi import HTTPException
+from sqlalchemy import func, select, case, exists, tuple_, literal, table, column, cast, DateTime, Integer
+
+from database import engine
+from models.database_models import AadhaarProfile, PANProfile, GSTCompany
+from services.serialization import FastJSONResponse
+
+SEARCH_CANDIDATE_LIMIT = int(os.getenv("SEARCH_CANDIDATE_LIMIT", "1000"))
+
+# Trigram indexes only help from three characters up; shorter name queries keep the plain ILIKE
+MIN_TRIGRAM_QUERY = 3
+
+# Trigram similarity is ranked in steps of 1/SIMILARITY_SCALE (float4 holds about 7 significant digits)
+SIMILARITY_SCALE = 100000
+
+# Any query containing a digit is an identity number prefix (Aadhaar, PAN or GSTIN), not a name
+_NUMBER_PREFIX = re.compile(r"^(?=.*[0-9])[0-9A-Z]+$")
+
+# (table, name column, FTS5 table on the SQLite fallback); the indexes themselves are created by migrate_db.py
+NAME_INDEXES = [
+    ("aadhaar_profiles", "name", "aadhaar_profiles_name_fts"),
+    ("gst_companies", "company_name", "gst_companies_name_fts"),
+]
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def number_prefix(query: str):
+    """The normalised identity number prefix a query stands for, or None for a name query"""
+    normalised = query.replace(" ", "").upper()
+    return normalised if _NUMBER_PREFIX.match(normalised) else None
+
+def _without_pan(aadhaar_id):
+    return ~exists().where(PANProfile.aadhaar_id == aadhaar_id)
+
+def encode_cursor(values) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps(list(values))).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        values = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        raise ValueError("Malformed cursor")
+    if not isinstance(values, list):
+        raise ValueError("Malformed cursor")
+    return values
+
+def _cursor_value(key, value):
+    # orjson writes datetimes as ISO strings; bind them back as datetimes so the comparison is typed
+    if isinstance(value, str) and isinstance(key.type, DateTime):
+        return datetime.fromisoformat(value)
+    return value
+
+class RankedQuery:
+    """
+    A search as a filtered query plus its sort keys: all in one direction (ascending
+    unless descending), the last one unique. Pages continue strictly after the keys of
+    the previous page's last row, so deep pages cost the same as the first and rows
+    inserted meanwhile are not returned twice.
+
+    capped is (candidates, cap) when the query only ranks the first cap rows of the
+    candidates select; truncated() then tells whether matches were left out.
+    """
+
+    def __init__(self, query, keys, descending=False, capped=None):
+        self.query = query
+        self.keys = keys
+        self.descending = descending
+        self.capped = capped
+
+    def _order(self):
+        return [key.desc() for key in self.keys] if self.descending else self.keys
+
+    def all(self) -> list:
+        return self.query.order_by(*self._order()).all()
+
+    def page(self, after: str = None, limit: int = 20):
+        """Up to limit rows as dicts, and the cursor for the next page (None on the last one)"""
+        query = self.query.add_columns(*(key.label(f"_key{i}") for i, key in enumerate(self.keys)))
+        if after is not None:
+            values = decode_cursor(after)
+            if len(values) != len(self.keys):
+                # e.g. a cursor from a name search replayed against a number search
+                raise ValueError("Cursor does not belong to this search")
+            try:
+                values = [_cursor_value(key, value) for key, value in zip(self.keys, values)]
+            except ValueError:
+                raise ValueError("Malformed cursor")
+            row, bound = tuple_(*self.keys), tuple_(*(literal(value) for value in values))
+            leading = self.keys[0]
+            if self.descending:
+                # The leading-key range is implied by the row comparison, but only a plain
+                # range lets Postgres prune partitions and bound the index scan
+                query = query.filter(row < bound, leading <= values[0])
+            else:
+                query = query.filter(row > bound, leading >= values[0])
+        rows = query.order_by(*self._order()).limit(limit + 1).all()
+
+        items = []
+        for row in rows[:limit]:
+            item = row._asdict()
+            key_values = [item.pop(f"_key{i}") for i in range(len(self.keys))]
+            items.append(item)
+        return items, encode_cursor(key_values) if len(rows) > limit else None
+
+    def truncated(self) -> bool:
+        """Whether the search matched more rows than the candidate cap let through"""
+        if self.capped is None:
+            return False
+        candidates, cap = self.capped
+        counted = select(func.count()).select_from(candidates.limit(cap + 1).subquery())
+        return self.query.session.execute(counted).scalar() > cap
+
+def paged_response(ranked: RankedQuery, after: str = None, limit: int = 20) -> FastJSONResponse:
+    """
+    One page of a search as a JSON list; the next page's cursor travels in
+    X-Next-Cursor. The last page of a capped name search carries
+    X-Results-Truncated: true when more rows matched than were ranked.
+    """
+    try:
+        items, next_cursor = ranked.page(after, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    headers = {}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    elif ranked.truncated():
+        headers["X-Results-Truncated"] = "true"
+    return FastJSONResponse(items, headers=headers or None)
+
+class RegistrySearch:
+    """
+    Ranked typeahead over Aadhaar holder names and company names, and prefix lookups
+    on aadhaar_number, pan_number and gst_number, for the admin search endpoints.
+
+    migrate_db.py builds the index for the database in use: pg_trgm GIN indexes on
+    Postgres, FTS5 trigram tables on the SQLite fallback (kept current by triggers, so
+    every insert path is covered). detect() finds which one is there at startup. Up
+    to candidate_limit name matches are taken from the index and ranked: names
+    starting with the query, then names with a word starting with it, then by trigram
+    similarity (Postgres) or length (SQLite). Paging ends after those candidates, and
+    the last page says so (X-Results-Truncated) when more names matched; a longer
+    query narrows the match set. Where neither index is in place (migrations not run,
+    no pg_trgm privilege, SQLite without FTS5) search falls back to the ILIKE scan.
+    """
+
+    def __init__(self, bind=engine, candidate_limit=SEARCH_CANDIDATE_LIMIT):
+        self.bind = bind
+        self.candidate_limit = candidate_limit
+        self.backend = "scan" # pg_trgm, fts5 or scan; decided by detect()
+        self.counters = {"name_indexed": 0, "name_scan": 0, "number_prefix": 0}
+
+    # --- Setup ---
+
+    def detect(self):
+        """Picks the backend from the indexes migrate_db.py left in place; creates nothing"""
+        dialect = self.bind.dialect.name
+        try:
+            with self.bind.connect() as conn:
+                if dialect == "postgresql":
+                    # Ranking needs similarity(); the GIN indexes only make the ILIKE filter fast
+                    found = conn.exec_driver_sql("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'").first() is not None
+                    self.backend = "pg_trgm" if found else "scan"
+                elif dialect == "sqlite":
+                    names = ", ".join(f"'{fts}'" for _, _, fts in NAME_INDEXES)
+                    found = conn.exec_driver_sql(f"SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name IN ({names})").scalar()
+                    self.backend = "fts5" if found == len(NAME_INDEXES) else "scan"
+        except Exception as e:
+            print(f"[SEARCH INDEX ERROR] {str(e)}")
+            self.backend = "scan"
+
+    # --- Queries ---
+
+    def _prefix(self, number_column, prefix: str):
+        if self.bind.dialect.name == "sqlite":
+            # GLOB is case-sensitive, so unlike LIKE it can use the existing unique index
+            return number_column.op("GLOB")(f"{prefix}*")
+        return number_column.like(f"{prefix}%")
+
+    def _match_name(self, query, model, name_column, text: str, fts_name: str, criteria=()):
+        """
+        criteria are extra conditions on the row id; they go into the candidate
+        selection, so the ranked slice is taken from rows that satisfy them.
+        """
+        escaped = _escape_like(text)
+        contains = name_column.ilike(f"%{escaped}%", escape="\\")
+        if len(text) < MIN_TRIGRAM_QUERY or self.backend == "scan":
+            # Primary key order: a page stops scanning as soon as it has enough rows
+            self.counters["name_scan"] += 1
+            return RankedQuery(query.filter(contains, *(c(model.id) for c in criteria)), [model.id])
+
+        self.counters["name_indexed"] += 1
+        if self.backend == "pg_trgm":
+            candidates = select(model.id).where(contains, *(c(model.id) for c in criteria))
+            # similarity() is a float4, which comes back through the JSON cursor as a float8 that no
+            # longer equals it; a whole-number rank survives the round trip, so ties split pages exactly
+            closeness = -cast(func.round(func.similarity(name_column, text) * SIMILARITY_SCALE), Integer)
+        else:
+            fts = table(fts_name, column("id"), column(name_column.key))
+            phrase = '"' + text.replace('"', '""') + '"'
+            candidates = select(fts.c.id).where(
+                fts.c[name_column.key].op("MATCH")(phrase), *(c(fts.c.id) for c in criteria)
+            )
+            closeness = func.length(name_column)
+        capped = None
+        if self.candidate_limit:
+            # A common fragment ("kumar") matches a large share of the registry; rank a bounded slice of it
+            capped = (candidates, self.candidate_limit)
+            candidates = candidates.limit(self.candidate_limit)
+
+        return RankedQuery(query.filter(model.id.in_(candidates)), [
+            case((name_column.ilike(f"{escaped}%", escape="\\"), 0), else_=1),
+            case((name_column.ilike(f"% {escaped}%", escape="\\"), 0), else_=1),
+            closeness,
+            name_column,
+            model.id,
+        ], capped=capped)
+
+    def aadhaar(self, db, text: str, columns, unlinked_pan: bool = False):
+        """
+        Aadhaar profiles (as the given columns) by holder name, Aadhaar number prefix
+        or PAN prefix. unlinked_pan keeps only holders without a PAN, as an anti-join
+        on the unique pan_profiles.aadhaar_id index.
+        """
+        text = text.strip()
+        query = db.query(*columns)
+        criteria = [_without_pan] if unlinked_pan else []
+        prefix = number_prefix(text)
+        if prefix is None:
+            return self._match_name(query, AadhaarProfile, AadhaarProfile.name, text, NAME_INDEXES[0][2], criteria)
+
+        self.counters["number_prefix"] += 1
+        query = query.filter(*(c(AadhaarProfile.id) for c in criteria))
+        if prefix.isdigit():
+            return RankedQuery(query.filter(self._prefix(AadhaarProfile.aadhaar_number, prefix)), [AadhaarProfile.aadhaar_number])
+        return RankedQuery(
+            query.join(PANProfile, PANProfile.aadhaar_id == AadhaarProfile.id).filter(self._prefix(PANProfile.pan_number, prefix)),
+            [PANProfile.pan_number]
+        )
+
+    def companies(self, db, text: str, columns):
+        """GST companies (as the given columns) by company name or GSTIN prefix"""
+        text = text.strip()
+        query = db.query(*columns)
+        prefix = number_prefix(text)
+        if prefix is None:
+            return self._match_name(query, GSTCompany, GSTCompany.company_name, text, NAME_INDEXES[1][2])
+
+        self.counters["number_prefix"] += 1
+        return RankedQuery(query.filter(self._prefix(GSTCompany.gst_number, prefix)), [GSTCompany.gst_number])
+
+    def stats(self) -> dict:
+        return {"backend": self.backend, **self.counters}
+
+registry_search = RegistrySearch()
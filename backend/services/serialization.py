@@ -0,0 +1,39 @@
+from decimal import Decimal
+from enum import Enum
+
+import orjson
+from fastapi.responses import ORJSONResponse
+
+# OPT_UTC_Z renders UTC datetimes as "...Z", the same as pydantic does
+ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+def _default(value):
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+
+class FastJSONResponse(ORJSONResponse):
+    """App-wide default response class: orjson instead of json.dumps"""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+def projection(model, schema) -> list:
+    """The model columns backing every field of a response schema, labelled with the field names"""
+    return [getattr(model, name).label(name) for name in schema.model_fields]
+
+def projected_response(query) -> FastJSONResponse:
+    """
+    Serializes a column query built from projection() straight to JSON. Returning a
+    Response skips FastAPI's response_model validation, which otherwise re-validates
+    every ORM row we just read; the schema still documents the endpoint. Only use this
+    for rows whose columns already satisfy the schema.
+    """
+    return FastJSONResponse([row._asdict() for row in query])
@@ -0,0 +1,97 @@
+import os
+import threading
+from datetime import datetime, timezone
+
+from database import engine, dialect_insert
+from models.database_models import ExternalConsumerUsage
+
+USAGE_FLUSH_INTERVAL_SECONDS = float(os.getenv("USAGE_FLUSH_INTERVAL_SECONDS", "10"))
+
+class UsageMeter:
+    """
+    Counts gateway requests per (consumer, endpoint, hour) in memory and adds them to
+    external_consumer_usage every flush_interval with one upsert, instead of writing
+    on every request. A failed flush keeps its counts and retries on the next cycle;
+    counts not yet flushed when the process dies are lost (this is metering, not billing).
+    """
+
+    def __init__(self, flush_interval=USAGE_FLUSH_INTERVAL_SECONDS, bind=engine):
+        self.flush_interval = flush_interval
+        self.bind = bind
+        self._counts = {} # (consumer_id, endpoint, window_start) -> [requests, rejected]
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record(self, consumer_id: str, endpoint: str, rejected: bool = False):
+        window_start = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        key = (consumer_id, endpoint, window_start)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0, 0]
+            counts[0] += 1
+            if rejected:
+                counts[1] += 1
+
+    def flush(self):
+        with self._lock:
+            counts, self._counts = self._counts, {}
+        if not counts:
+            return
+
+        rows = [
+            {"consumer_id": consumer_id, "endpoint": endpoint, "window_start": window_start,
+             "request_count": requests, "rejected_count": rejected}
+            for (consumer_id, endpoint, window_start), (requests, rejected) in counts.items()
+        ]
+        stmt = dialect_insert(self.bind)(ExternalConsumerUsage)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["consumer_id", "endpoint", "window_start"],
+            set_={
+                "request_count": ExternalConsumerUsage.request_count + stmt.excluded.request_count,
+                "rejected_count": ExternalConsumerUsage.rejected_count + stmt.excluded.rejected_count,
+            }
+        )
+        try:
+            with self.bind.begin() as conn:
+                conn.execute(stmt, rows)
+        except Exception:
+            # Put the counts back so the next flush includes them
+            with self._lock:
+                for key, (requests, rejected) in counts.items():
+                    merged = self._counts.setdefault(key, [0, 0])
+                    merged[0] += requests
+                    merged[1] += rejected
+            raise
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[USAGE METER ERROR] {str(e)}")
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="usage-meter-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=5)
+        self._thread = None
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"[USAGE METER ERROR] {str(e)}")
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(requests for requests, _ in self._counts.values())
+
+usage_meter = UsageMeter()
@@ -0,0 +1,303 @@
+import os
+import json
+import time
+import uuid
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from database import engine
+from models.database_models import WebhookDeadLetter
+from services.consumer_cache import consumer_cache
+from services.hmac_signing import sign
+
+WEBHOOKS_ENABLED = os.getenv("WEBHOOKS_ENABLED", "true").lower() == "true"
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv("WEBHOOK_MAX_CONCURRENCY", "8"))
+WEBHOOK_BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", "100"))
+WEBHOOK_BATCH_WINDOW_SECONDS = float(os.getenv("WEBHOOK_BATCH_WINDOW_SECONDS", "0.5"))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "6"))
+WEBHOOK_BACKOFF_BASE_SECONDS = float(os.getenv("WEBHOOK_BACKOFF_BASE_SECONDS", "1"))
+WEBHOOK_BACKOFF_MAX_SECONDS = float(os.getenv("WEBHOOK_BACKOFF_MAX_SECONDS", "300"))
+WEBHOOK_TIMEOUT_SECONDS = float(os.getenv("WEBHOOK_TIMEOUT_SECONDS", "10"))
+WEBHOOK_MAX_QUEUE = int(os.getenv("WEBHOOK_MAX_QUEUE", "100000"))
+
+# Event types consumers can subscribe to (ExternalConsumer.webhook_events)
+EVALUATION_COMPLETED = "evaluation.completed"
+INVOICE_STATUS_CHANGED = "invoice.status_changed"
+COMPANY_SUSPENDED = "company.suspended"
+JOB_COMPLETED = "job.completed"
+EVENT_TYPES = (EVALUATION_COMPLETED, INVOICE_STATUS_CHANGED, COMPANY_SUSPENDED, JOB_COMPLETED)
+
+# Responses worth retrying; any other non-2xx goes straight to the dead-letter table
+RETRYABLE_STATUS = {408, 409, 425, 429}
+
+class _Delivery:
+    """One consumer's pending events, delivered as a single signed POST"""
+
+    def __init__(self, consumer, events):
+        self.consumer = consumer
+        self.events = events
+        self.attempts = 0
+        self.last_error = None
+        self.body = json.dumps({"events": events}, default=str).encode()
+
+class WebhookDispatcher:
+    """
+    Delivers webhook events off the request thread.
+
+    publish() only appends to an in-memory queue. A dispatcher thread groups queued
+    events per consumer into batches of up to batch_size (waiting at most batch_window
+    for a batch to fill) and hands them to a worker pool. Every worker shares one
+    keep-alive requests.Session, and each consumer has at most one batch in flight or
+    waiting to be retried, which keeps its events in order. Each POST body is {"events": [...]}, signed like
+    inbound gateway calls: X-TIMESTAMP plus X-SIGNATURE = HMAC-SHA256(webhook_secret,
+    "<timestamp>.<body>").
+
+    Failed batches are retried with exponential backoff and jitter, up to max_attempts.
+    After that, and for non-retryable 4xx responses, they are written to
+    webhook_dead_letters. So are batches still pending when stop() gives up.
+    """
+
+    def __init__(self, max_concurrency=WEBHOOK_MAX_CONCURRENCY, batch_size=WEBHOOK_BATCH_SIZE,
+                 batch_window=WEBHOOK_BATCH_WINDOW_SECONDS, max_attempts=WEBHOOK_MAX_ATTEMPTS,
+                 backoff_base=WEBHOOK_BACKOFF_BASE_SECONDS, backoff_max=WEBHOOK_BACKOFF_MAX_SECONDS,
+                 timeout=WEBHOOK_TIMEOUT_SECONDS, max_queue=WEBHOOK_MAX_QUEUE, bind=engine):
+        self.max_concurrency = max_concurrency
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.max_queue = max_queue
+        self.bind = bind
+
+        self._queue = deque() # (consumer, event)
+        self._retries = [] # (due_at, _Delivery)
+        self._busy = set() # consumer ids with a batch in flight or in backoff
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pool = None
+        self._session = None
+        self._stopping = False
+        self.running = False
+        self.counters = {"queued": 0, "delivered": 0, "failed_attempts": 0, "dead_lettered": 0, "dropped": 0}
+
+    # --- Producer API ---
+
+    def publish(self, event_type: str, data: dict, consumers=None):
+        """
+        Queues an event for every subscribed consumer, or only for `consumers`
+        (e.g. the consumer whose evaluation completed). Never blocks or raises.
+        """
+        if not self.running:
+            return
+        if consumers is None:
+            consumers = consumer_cache.subscribers(event_type)
+        else:
+            consumers = [c for c in consumers if c.subscribes_to(event_type)]
+        if not consumers:
+            return
+
+        event = {
+            "id": str(uuid.uuid4()),
+            "type": event_type,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "data": data,
+        }
+        with self._cond:
+            for consumer in consumers:
+                if len(self._queue) >= self.max_queue:
+                    self.counters["dropped"] += 1
+                    continue
+                self._queue.append((consumer, event))
+                self.counters["queued"] += 1
+            self._cond.notify_all()
+
+    def requeue(self, consumer, events: list):
+        """Queues already-built events again (dead-letter replay), keeping their ids"""
+        if not self.running:
+            raise RuntimeError("Webhook dispatcher is not running")
+        with self._cond:
+            self._queue.extend((consumer, event) for event in events)
+            self.counters["queued"] += len(events)
+            self._cond.notify_all()
+
+    # --- Dispatch loop ---
+
+    def _take_batches(self):
+        """Called with the lock held: groups queued events of idle consumers into deliveries"""
+        grouped = {}
+        held = deque()
+        while self._queue:
+            consumer, event = self._queue.popleft()
+            batch = grouped.get(consumer.id)
+            if consumer.id in self._busy or (batch is not None and len(batch[1]) >= self.batch_size):
+                held.append((consumer, event)) # waits for the in-flight batch, or the next batch
+                continue
+            if batch is None:
+                batch = grouped[consumer.id] = (consumer, [])
+            batch[1].append(event)
+        self._queue = held
+        return [_Delivery(consumer, events) for consumer, events in grouped.values()]
+
+    def _due_retries(self, now):
+        # Their consumers stayed busy through the backoff, so nothing newer went out first
+        due = [delivery for due_at, delivery in self._retries if due_at <= now]
+        if due:
+            due_ids = {id(d) for d in due}
+            self._retries = [(t, d) for t, d in self._retries if id(d) not in due_ids]
+        return due
+
+    def _in_flight(self):
+        """Called with the lock held: consumers with a POST under way, as opposed to waiting in backoff"""
+        return self._busy - {delivery.consumer.id for _, delivery in self._retries}
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._queue and not self._retries:
+                    if self._stopping:
+                        break
+                    self._cond.wait(1.0)
+                # Give a batch a moment to fill up unless it is already full
+                deadline = time.monotonic() + self.batch_window
+                while self._queue and len(self._queue) < self.batch_size and not self._stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                # Consumers with a retry pending are still busy, so their queued events keep waiting
+                deliveries = self._due_retries(time.monotonic())
+                batches = self._take_batches()
+                self._busy.update(delivery.consumer.id for delivery in batches)
+                deliveries += batches
+                if not deliveries and (self._queue or self._retries):
+                    # Everything left is waiting on a busy consumer or a backoff timer
+                    next_due = min((t for t, _ in self._retries), default=time.monotonic() + 0.1)
+                    self._cond.wait(max(0.01, min(0.1, next_due - time.monotonic())))
+                if self._stopping and not deliveries and not self._in_flight() and self._retries:
+                    # Retries still in backoff at shutdown: give up on them now
+                    remaining, self._retries = self._retries, []
+                    for _, delivery in remaining:
+                        delivery.last_error = f"Shutdown before retry: {delivery.last_error}"
+                        self._busy.discard(delivery.consumer.id)
+                        self._dead_letter(delivery)
+            for delivery in deliveries:
+                self._pool.submit(self._deliver, delivery)
+
+    def _deliver(self, delivery: _Delivery):
+        delivery.attempts += 1
+        error = None
+        retry = False
+        try:
+            timestamp = str(int(time.time()))
+            response = self._session.post(
+                delivery.consumer.webhook_url,
+                data=delivery.body,
+                headers={
+                    "Content-Type": "application/json",
+                    "X-TIMESTAMP": timestamp,
+                    "X-SIGNATURE": sign(delivery.consumer.webhook_secret, timestamp, delivery.body),
+                },
+                timeout=self.timeout,
+            )
+            if response.status_code < 300:
+                self.counters["delivered"] += len(delivery.events)
+            else:
+                error = f"HTTP {response.status_code}: {response.text[:500]}"
+                retry = response.status_code >= 500 or response.status_code in RETRYABLE_STATUS
+        except requests.RequestException as e:
+            error = f"{type(e).__name__}: {str(e)[:500]}"
+            retry = True
+        except Exception as e:
+            error = f"{type(e).__name__}: {str(e)[:500]}"
+        finally:
+            self._finish(delivery, error, retry)
+
+    def _finish(self, delivery, error, retry):
+        retry = error is not None and retry and delivery.attempts < self.max_attempts
+        if error is not None:
+            delivery.last_error = error
+            self.counters["failed_attempts"] += 1
+            if not retry:
+                self._dead_letter(delivery)
+        with self._cond:
+            if retry:
+                # The consumer stays busy until the retry succeeds or is dead-lettered
+                self._retries.append((time.monotonic() + self._backoff(delivery.attempts), delivery))
+            else:
+                self._busy.discard(delivery.consumer.id)
+            self._cond.notify_all()
+
+    def _backoff(self, attempts):
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _dead_letter(self, delivery):
+        try:
+            with self.bind.begin() as conn:
+                conn.execute(WebhookDeadLetter.__table__.insert(), {
+                    "id": str(uuid.uuid4()),
+                    "consumer_id": delivery.consumer.id,
+                    "webhook_url": delivery.consumer.webhook_url,
+                    "payload": delivery.body.decode(),
+                    "event_count": len(delivery.events),
+                    "attempts": delivery.attempts,
+                    "last_error": delivery.last_error,
+                })
+            self.counters["dead_lettered"] += len(delivery.events)
+        except Exception as e:
+            print(f"[WEBHOOK ERROR] Could not dead-letter {len(delivery.events)} events: {str(e)}")
+
+    # --- Lifecycle ---
+
+    def start(self):
+        if self.running or not WEBHOOKS_ENABLED:
+            return
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.max_concurrency, pool_maxsize=self.max_concurrency)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="webhook-delivery")
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="webhook-dispatcher", daemon=True)
+        self._thread.start()
+        self.running = True
+
+    def stop(self, timeout=30):
+        """Delivers what is queued (first attempts only), dead-letters anything still pending"""
+        if not self.running:
+            return
+        self.running = False
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join(timeout=timeout)
+        self._pool.shutdown(wait=True)
+        with self._cond:
+            leftovers = [delivery for _, delivery in self._retries]
+            self._retries = []
+            self._busy.clear()
+            leftovers = self._take_batches() + leftovers
+        for delivery in leftovers:
+            delivery.last_error = delivery.last_error or "Shutdown before delivery"
+            self._dead_letter(delivery)
+        self._session.close()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "running": self.running,
+                "queue": len(self._queue),
+                "retrying": len(self._retries),
+                "in_flight": len(self._in_flight()),
+                **self.counters,
+            }
+
+webhook_dispatcher = WebhookDispatcher()
@@ -0,0 +1,116 @@
+import os
+import sys
+import tempfile
+
+from fastapi import HTTPException
+from sqlalchemy import create_engine, select, func
+from sqlalchemy.orm import Session
+
+# Add current dir to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import Base
+from models.database_models import AadhaarProfile, PANProfile, GSTCompany, CompanyOwner, CompanyCreditStats, AuditLog
+from models.schemas import CompanyCreate, CompanyBatchCreate
+from services.id_allocator import gstin_check_char, allocate_gstin
+import routers.business as business
+from routers.business import register_company, register_companies_batch
+
+def _registry():
+    bind = create_engine(f"sqlite:///{tempfile.mkdtemp()}/business.db")
+    Base.metadata.create_all(bind=bind)
+    with Session(bind) as db:
+        for n in range(4):
+            db.add(AadhaarProfile(id=f"a{n}", name=f"Owner {n}", aadhaar_number=f"20000000000{n}", phone=f"900000000{n}"))
+            # The last holder has no PAN
+            if n < 3:
+                db.add(PANProfile(id=f"p{n}", pan_number=f"AAAPA000{n}A", aadhaar_id=f"a{n}"))
+        db.commit()
+    return bind
+
+def _company(name, owners, company_type="PARTNERSHIP"):
+    return CompanyCreate(company_name=name, type=company_type, state_code="27", aadhaar_numbers=owners)
+
+def _count(db, model):
+    return db.execute(select(func.count()).select_from(model)).scalar()
+
+def test_register_resolves_all_owners():
+    bind = _registry()
+    with Session(bind) as db:
+        company = register_company(_company("Acme Traders", ["200000000000", "200000000001", "200000000002"]), db, None)
+        assert company.gst_number == "27AAAPA0000A1Z" + gstin_check_char("27AAAPA0000A1Z")
+        assert _count(db, CompanyOwner) == 3 and _count(db, CompanyCreditStats) == 1
+
+        for owners, status_code in ((["200000000009"], 404), (["200000000003"], 400), ([], 400)):
+            try:
+                register_company(_company("Broken", owners), db, None)
+                assert False, owners
+            except HTTPException as e:
+                assert e.status_code == status_code
+
+def test_batch_registers_valid_items_in_one_transaction():
+    bind = _registry()
+    with Session(bind) as db:
+        batch = CompanyBatchCreate(items=[
+            _company("One", ["200000000000"], "SOLE_PROP"),
+            _company("Two", ["200000000000", "200000000001"]),
+            _company("No PAN", ["200000000003"]),
+            _company("Too Many", ["200000000001", "200000000002"], "SOLE_PROP"),
+            _company("Three", ["200000000002"]),
+        ])
+        response = register_companies_batch(batch, db, None)
+
+        assert (response["succeeded"], response["failed"]) == (3, 2)
+        assert [entry["error"]["status_code"] for entry in response["results"] if entry["error"]] == [400, 400]
+        # Two registrations under the same PAN and state get successive entity codes
+        assert response["results"][0]["company"]["gst_number"][12] == "1"
+        assert response["results"][1]["company"]["gst_number"][12] == "2"
+        assert _count(db, GSTCompany) == 3 and _count(db, CompanyOwner) == 4 and _count(db, CompanyCreditStats) == 3
+        assert _count(db, AuditLog) == 3
+
+def _racing_allocation(bind, races):
+    """allocate_gstin() as seen by a request that loses races times: each GSTIN is committed by a concurrent registration first"""
+    lost = []
+
+    def allocate(db, state_code, pan_number):
+        gstin = allocate_gstin(db, state_code, pan_number)
+        if len(lost) < races:
+            with Session(bind) as other:
+                other.add(GSTCompany(gst_number=gstin, company_name="Concurrent", type="PARTNERSHIP", state_code=state_code))
+                other.commit()
+            lost.append(gstin)
+        return gstin
+    return allocate
+
+def _register_racing(bind, races):
+    allocate = business.allocate_gstin
+    business.allocate_gstin = _racing_allocation(bind, races)
+    try:
+        with Session(bind) as db:
+            return register_company(_company("Acme Traders", ["200000000000"]), db, None).gst_number
+    finally:
+        business.allocate_gstin = allocate
+
+def test_register_retries_a_gstin_taken_concurrently():
+    bind = _registry()
+    # The concurrent registrations took entity codes 1 and 2
+    assert _register_racing(bind, races=2)[12] == "3"
+    with Session(bind) as db:
+        assert _count(db, GSTCompany) == 3 and _count(db, CompanyOwner) == 1 and _count(db, AuditLog) == 1
+
+def test_register_gives_up_after_repeated_conflicts():
+    bind = _registry()
+    try:
+        _register_racing(bind, races=business.GSTIN_ALLOCATION_ATTEMPTS)
+        assert False
+    except HTTPException as e:
+        assert e.status_code == 409
+    with Session(bind) as db:
+        assert _count(db, CompanyOwner) == 0 and _count(db, AuditLog) == 0
+
+if __name__ == "__main__":
+    test_register_resolves_all_owners()
+    test_batch_registers_valid_items_in_one_transaction()
+    test_register_retries_a_gstin_taken_concurrently()
+    test_register_gives_up_after_repeated_conflicts()
+    print("Company registration tests passed")
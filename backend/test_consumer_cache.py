@@ -0,0 +1,65 @@
+import os
+import sys
+import time
+import tempfile
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+# Add current dir to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import Base
+from models.database_models import ExternalConsumer
+import services.consumer_cache as consumer_cache_module
+from services.consumer_cache import ConsumerKeyCache, MISSING
+
+API_KEY = "api_" + "0" * 32
+
+def _session_local():
+    bind = create_engine(f"sqlite:///{tempfile.mkdtemp()}/consumers.db")
+    Base.metadata.create_all(bind=bind)
+    with bind.begin() as conn:
+        conn.execute(insert(ExternalConsumer), [{"id": "c1", "api_key": API_KEY, "webhook_secret": "sec", "name": "Lender"}])
+    return sessionmaker(bind=bind)
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def _with_session_local(session_local, test):
+    original = consumer_cache_module.SessionLocal
+    consumer_cache_module.SessionLocal = session_local
+    try:
+        test()
+    finally:
+        consumer_cache_module.SessionLocal = original
+
+def test_unstarted_cache_loads_in_the_background():
+    def test():
+        cache = ConsumerKeyCache()
+        # Answered without a query: the caller looks the key up itself
+        assert cache.get(API_KEY) is MISSING
+        assert _wait_for(lambda: cache.counters["reloads"] == 1)
+        assert cache.get(API_KEY).id == "c1"
+    _with_session_local(_session_local(), test)
+
+def test_database_outage_does_not_fail_lookups():
+    def broken_session_local():
+        raise RuntimeError("database is down")
+
+    def test():
+        cache = ConsumerKeyCache(refresh_interval=60)
+        for _ in range(3):
+            assert cache.get(API_KEY) is MISSING
+        assert cache.get("not-a-key") is None
+        # One background attempt per refresh interval, not one per request
+        assert cache._reload_attempted_at is not None and cache.counters["reloads"] == 0
+    _with_session_local(broken_session_local, test)
+
+if __name__ == "__main__":
+    test_unstarted_cache_loads_in_the_background()
+    test_database_outage_does_not_fail_lookups()
+    print("Consumer cache tests passed")
@@ -0,0 +1,70 @@
+import os
+import sys
+import random
+import subprocess
+
+import numpy as np
+
+# Add current dir to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.credit_engine import (
+    calculate_owner_score, calculate_company_score, calculate_transaction_score, calculate_final_credit_score,
+    calculate_owner_score_batch, calculate_company_score_batch, calculate_transaction_score_batch, calculate_final_credit_score_batch,
+)
+
+N = 20000
+
+def _random_ratio(rng):
+    # Mix uniform values with the exact threshold boundaries
+    return rng.choice([0.0, 0.2, 0.4, 0.6, 0.8, 1.0, rng.random()])
+
+def test_owner_score_batch_matches_scalar():
+    rng = random.Random(1)
+    rows = [
+        (rng.random() < 0.5, rng.random() < 0.5, rng.random() < 0.2, rng.randint(0, 12), rng.random() < 0.3)
+        for _ in range(N)
+    ]
+    expected = [calculate_owner_score(*row) for row in rows]
+    actual = calculate_owner_score_batch(*map(np.array, zip(*rows)))
+    assert actual.tolist() == expected
+
+def test_company_score_batch_matches_scalar():
+    rng = random.Random(2)
+    rows = [
+        (True, rng.choice([0, 49, 50, 100, rng.uniform(0, 100)]), rng.randint(0, 40), rng.random() < 0.2)
+        for _ in range(N)
+    ]
+    expected = [calculate_company_score(*row) for row in rows]
+    actual = calculate_company_score_batch(*map(np.array, zip(*rows)))
+    assert actual.tolist() == expected
+
+def test_transaction_score_batch_matches_scalar():
+    rng = random.Random(3)
+    rows = [
+        (rng.choice([0, rng.randint(1, 10000)]), _random_ratio(rng), _random_ratio(rng), rng.choice([30, 60, rng.uniform(0, 120)]))
+        for _ in range(N)
+    ]
+    expected = [calculate_transaction_score(*row) for row in rows]
+    actual = calculate_transaction_score_batch(*map(np.array, zip(*rows)))
+    assert actual.tolist() == expected
+
+def test_final_score_batch_matches_scalar():
+    rng = random.Random(4)
+    rows = [(rng.randint(0, 1000), rng.randint(0, 1000), rng.randint(0, 1000)) for _ in range(N)]
+    expected = [calculate_final_credit_score(*row) for row in rows]
+    actual = calculate_final_credit_score_batch(*map(np.array, zip(*rows)))
+    assert actual.tolist() == expected
+
+def test_import_does_not_touch_the_database():
+    # Rescoring workers import credit_engine; it must not build the app's engines
+    check = "import sys; import services.credit_engine; sys.exit('database' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", check], cwd=os.path.dirname(os.path.abspath(__file__))).returncode == 0
+
+if __name__ == "__main__":
+    test_owner_score_batch_matches_scalar()
+    test_company_score_batch_matches_scalar()
+    test_transaction_score_batch_matches_scalar()
+    test_final_score_batch_matches_scalar()
+    test_import_does_not_touch_the_database()
+    print("Batch scoring matches scalar scoring.")
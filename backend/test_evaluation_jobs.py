@@ -0,0 +1,180 @@
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+from datetime import datetime, timezone, timedelta
+
+from sqlalchemy import create_engine, select, update
+from sqlalchemy.orm import sessionmaker
+
+# Add current dir to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import Base
+from models.database_models import EvaluationJob, EvaluationJobItem
+import services.evaluation_jobs as evaluation_jobs
+from services.evaluation_jobs import EvaluationJobRunner, parse_job_items, create_job
+
+def _lines(count):
+    return "".join(
+        json.dumps({"gst_number": f"27AAAPA{n:04d}A1Z0", "aadhaar_number": f"{200000000000 + n}", "pan_number": f"AAAPA{n:04d}A"}) + "\n"
+        for n in range(count)
+    ).encode()
+
+def _with_database(test):
+    bind = create_engine(f"sqlite:///{tempfile.mkdtemp()}/jobs.db")
+    Base.metadata.create_all(bind=bind)
+    session_local = evaluation_jobs.SessionLocal
+    evaluation_jobs.SessionLocal = sessionmaker(bind=bind)
+    try:
+        test(bind)
+    finally:
+        evaluation_jobs.SessionLocal = session_local
+
+def _job(bind, job_id):
+    with bind.connect() as conn:
+        return conn.execute(select(EvaluationJob).where(EvaluationJob.id == job_id)).first()
+
+def _wait_for_status(bind, job_id, statuses, timeout=10):
+    deadline = time.monotonic() + timeout
+    while _job(bind, job_id).status not in statuses and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return _job(bind, job_id)
+
+def _wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+def _runner(**kwargs):
+    runner = EvaluationJobRunner(workers=1, **kwargs)
+    completed = []
+    runner.on_complete = completed.append
+    return runner, completed
+
+def test_parse_keeps_bad_lines_as_failed_items():
+    items = parse_job_items(_lines(2) + b"not json\n{\"gst_number\": \"X\"}\n", "application/x-ndjson")
+    assert [item["status"] for item in items] == ["PENDING", "PENDING", "DONE", "DONE"]
+    assert json.loads(items[2]["error"])["detail"] == "Line is not valid JSON"
+
+    csv_items = parse_job_items(b"gst_number,aadhaar_number,pan_number\n27AAAPA0000A1Z0,200000000000,AAAPA0000A\n", "text/csv")
+    assert csv_items[0]["gst_number"] == "27AAAPA0000A1Z0" and csv_items[0]["status"] == "PENDING"
+
+def test_create_and_run_to_completion():
+    def test(bind):
+        job = create_job("c1", parse_job_items(_lines(7) + b"not json\n", "application/x-ndjson"))
+        assert (job.status, job.total_items, job.processed_items) == ("QUEUED", 8, 1)
+
+        runner, completed = _runner(chunk_size=3)
+        runner.start()
+        try:
+            runner.submit(job.id)
+            row = _wait_for_status(bind, job.id, ("COMPLETED", "FAILED"))
+            # on_complete runs right after the status change commits
+            assert _wait_for(lambda: completed)
+        finally:
+            runner.stop()
+        assert (row.status, row.processed_items) == ("COMPLETED", 8)
+        assert [finished.id for finished in completed] == [job.id]
+        with bind.connect() as conn:
+            assert set(conn.execute(select(EvaluationJobItem.status)).scalars()) == {"DONE"}
+    _with_database(test)
+
+def test_cancel_during_the_last_chunk_is_kept():
+    def test(bind):
+        job = create_job("c1", parse_job_items(_lines(4), "application/x-ndjson"))
+
+        class CancelledMidChunk(EvaluationJobRunner):
+            def _run_chunk(self, db, job_id, items):
+                recorded = super()._run_chunk(db, job_id, items)
+                # What DELETE /v1/jobs/{id} does from another session while the chunk runs
+                with bind.begin() as conn:
+                    conn.execute(update(EvaluationJob).where(EvaluationJob.id == job_id).values(status="CANCELLED"))
+                return recorded
+
+        runner = CancelledMidChunk(workers=1, chunk_size=10)
+        completed = []
+        runner.on_complete = completed.append
+        runner.start()
+        try:
+            runner.submit(job.id)
+            deadline = time.monotonic() + 10
+            while _job(bind, job.id).processed_items < 4 and time.monotonic() < deadline:
+                time.sleep(0.02)
+            time.sleep(0.2)
+        finally:
+            runner.stop()
+        assert _job(bind, job.id).status == "CANCELLED"
+        assert completed == []
+    _with_database(test)
+
+def test_start_resumes_jobs_without_a_live_lease():
+    def test(bind):
+        running = create_job("c1", parse_job_items(_lines(5), "application/x-ndjson"))
+        leased = create_job("c1", parse_job_items(_lines(3), "application/x-ndjson"))
+        cancelled = create_job("c1", parse_job_items(_lines(2), "application/x-ndjson"))
+        now = datetime.now(timezone.utc)
+        with bind.begin() as conn:
+            # As left by a process that died mid-job: the first chunk is done, the lease has run out
+            conn.execute(update(EvaluationJob).where(EvaluationJob.id == running.id).values(
+                status="RUNNING", processed_items=2, owner="dead-host:1:0", lease_expires_at=now - timedelta(seconds=1)))
+            conn.execute(update(EvaluationJobItem).where(EvaluationJobItem.job_id == running.id, EvaluationJobItem.seq < 2).values(status="DONE"))
+            # Still being evaluated by another process
+            conn.execute(update(EvaluationJob).where(EvaluationJob.id == leased.id).values(
+                status="RUNNING", owner="live-host:1:0", lease_expires_at=now + timedelta(minutes=5)))
+            conn.execute(update(EvaluationJob).where(EvaluationJob.id == cancelled.id).values(status="CANCELLED"))
+
+        runner, completed = _runner(chunk_size=2)
+        runner.start() # resume() schedules the job whose lease expired only
+        try:
+            row = _wait_for_status(bind, running.id, ("COMPLETED", "FAILED"))
+            assert _wait_for(lambda: completed)
+            runner.submit(leased.id) # e.g. a duplicate submit; the claim still fails
+            time.sleep(0.2)
+        finally:
+            runner.stop()
+        assert (row.status, row.processed_items, row.owner) == ("COMPLETED", 5, runner.owner)
+        assert (_job(bind, leased.id).status, _job(bind, leased.id).processed_items) == ("RUNNING", 0)
+        assert _job(bind, cancelled.id).status == "CANCELLED"
+        assert [finished.id for finished in completed] == [running.id]
+    _with_database(test)
+
+def test_two_runners_evaluate_each_item_once():
+    def test(bind):
+        job = create_job("c1", parse_job_items(_lines(40), "application/x-ndjson"))
+        evaluated = []
+        lock = threading.Lock()
+
+        class CountingRunner(EvaluationJobRunner):
+            def _run_chunk(self, db, job_id, items):
+                with lock:
+                    evaluated.extend(item.seq for item in items)
+                time.sleep(0.02)
+                return super()._run_chunk(db, job_id, items)
+
+        # Two processes (e.g. gunicorn workers) that both pick up the same job
+        runners = [CountingRunner(workers=2, chunk_size=5) for _ in range(2)]
+        for runner in runners:
+            runner.start()
+        try:
+            for _ in range(3):
+                for runner in runners:
+                    runner.submit(job.id)
+            row = _wait_for_status(bind, job.id, ("COMPLETED", "FAILED"))
+        finally:
+            for runner in runners:
+                runner.stop()
+        assert (row.status, row.processed_items, row.succeeded_items + row.failed_items) == ("COMPLETED", 40, 40)
+        assert sorted(evaluated) == list(range(40))
+    _with_database(test)
+
+if __name__ == "__main__":
+    test_parse_keeps_bad_lines_as_failed_items()
+    test_create_and_run_to_completion()
+    test_cancel_during_the_last_chunk_is_kept()
+    test_start_resumes_jobs_without_a_live_lease()
+    test_two_runners_evaluate_each_item_once()
+    print("Evaluation job tests passed")
@@ -0,0 +1,62 @@
+import os
+import sys
+import tempfile
+
+from sqlalchemy import create_engine, insert
+
+# Add current dir to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import Base
+from models.database_models import AadhaarProfile
+from services.id_allocator import (
+    BlockAllocator, verhoeff_check_digit, verhoeff_is_valid, gstin_check_char, render_aadhaar, AADHAAR_SPACE,
+)
+
+# Published GSTINs of registered businesses
+KNOWN_GSTINS = ["27AAPFU0939F1ZV", "29AAGCB7383J1Z4", "33AAACH7409R1Z8", "24AAACC1206D1ZM", "27AAACR5055K1Z7", "19AAACI1681G1ZM"]
+
+def test_verhoeff_matches_known_numbers():
+    # The worked example from Verhoeff's scheme, and UIDAI's sample Aadhaar number
+    assert verhoeff_check_digit("236") == "3"
+    assert verhoeff_check_digit("23412341234") == "6" and verhoeff_is_valid("234123412346")
+    assert not verhoeff_is_valid("234123412345") and not verhoeff_is_valid("234123412364")
+
+def test_gstin_check_char_matches_known_gstins():
+    for gstin in KNOWN_GSTINS:
+        assert gstin_check_char(gstin[:14]) == gstin[14], gstin
+
+def _allocators(block_size):
+    bind = create_engine(f"sqlite:///{tempfile.mkdtemp()}/ids.db")
+    Base.metadata.create_all(bind=bind)
+    # Two processes sharing one id_sequences table
+    return [BlockAllocator("aadhaar", AADHAAR_SPACE, render_aadhaar, AadhaarProfile.aadhaar_number, block_size=block_size, bind=bind)
+            for _ in range(2)], bind
+
+def test_two_allocators_never_issue_the_same_number():
+    (first, second), bind = _allocators(block_size=7)
+    issued = []
+    for n in range(60):
+        issued.append(first.allocate())
+        issued.extend(second.allocate_many(3) if n % 10 == 0 else [second.allocate()])
+    assert len(issued) == len(set(issued))
+    assert all(len(number) == 12 and number[0] not in "01" and verhoeff_is_valid(number) for number in issued)
+    assert first.blocks_reserved + second.blocks_reserved >= 120 // 7
+
+def test_block_skips_numbers_already_issued():
+    (first, second), bind = _allocators(block_size=10)
+    # Reserves ordinals 0-9; the next block (the second allocator's) is 10-19
+    first.allocate()
+    taken = render_aadhaar(first._permute(12))
+    with bind.begin() as conn:
+        conn.execute(insert(AadhaarProfile), [{"id": "old", "name": "Old", "aadhaar_number": taken, "phone": "9000000000"}])
+    issued = [second.allocate() for _ in range(9)]
+    assert taken not in issued and second.skipped == 1
+    assert set(issued).isdisjoint(list(first._pending))
+
+if __name__ == "__main__":
+    test_verhoeff_matches_known_numbers()
+    test_gstin_check_char_matches_known_gstins()
+    test_two_allocators_never_issue_the_same_number()
+    test_block_skips_numbers_already_issued()
+    print("ID allocator tests passed")
@@ -0,0 +1,151 @@
+import os
+import sys
+import time
+import asyncio
+
+from fastapi import HTTPException
+
+# Add current dir to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.idempotency import IdempotencyStore
+
+BODY = IdempotencyStore.fingerprint(b'{"gst_number": "27AAAPA0000A1Z0"}')
+OTHER_BODY = IdempotencyStore.fingerprint(b'{"gst_number": "27AAAPA0001A1Z1"}')
+
+def _counting(outcome):
+    """A coroutine function returning (or raising) outcome, and the list of its calls"""
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    return fn, calls
+
+async def _raises(coroutine):
+    try:
+        await coroutine
+    except HTTPException as e:
+        return e.status_code
+    assert False, "expected an HTTPException"
+
+def test_in_flight_duplicates_join_the_first_execution():
+    async def scenario():
+        store = IdempotencyStore()
+        release = asyncio.Event()
+        calls = []
+
+        async def evaluate():
+            calls.append(1)
+            await release.wait()
+            return {"score": 720}
+
+        first = asyncio.create_task(store.run("c1:credit-evaluate", "key-1", BODY, evaluate))
+        await asyncio.sleep(0)
+        duplicates = [asyncio.create_task(store.run("c1:credit-evaluate", "key-1", BODY, evaluate)) for _ in range(3)]
+        await asyncio.sleep(0)
+        # A different body under the same key is refused while the first is still running
+        assert await _raises(store.run("c1:credit-evaluate", "key-1", OTHER_BODY, evaluate)) == 422
+        release.set()
+
+        assert await first == ({"score": 720}, False)
+        assert [await task for task in duplicates] == [({"score": 720}, True)] * 3
+        assert len(calls) == 1
+        assert (store.counters["executed"], store.counters["joined_in_flight"]) == (1, 3)
+    asyncio.run(scenario())
+
+def test_reused_key_with_a_different_body_is_rejected():
+    async def scenario():
+        store = IdempotencyStore()
+        fn, calls = _counting({"score": 720})
+        await store.run("c1:credit-evaluate", "key-1", BODY, fn)
+        assert await _raises(store.run("c1:credit-evaluate", "key-1", OTHER_BODY, fn)) == 422
+        # Keys are scoped: another consumer (or endpoint) may use the same key
+        assert await store.run("c2:credit-evaluate", "key-1", OTHER_BODY, fn) == ({"score": 720}, False)
+        assert len(calls) == 2
+    asyncio.run(scenario())
+
+def test_client_errors_are_replayed_and_server_errors_rerun():
+    async def scenario():
+        store = IdempotencyStore()
+        not_found, not_found_calls = _counting(HTTPException(status_code=404, detail="Company not found"))
+        for _ in range(2):
+            assert await _raises(store.run("c1:credit-evaluate", "key-404", BODY, not_found)) == 404
+        assert len(not_found_calls) == 1 and store.counters["replayed"] == 1
+
+        unavailable, unavailable_calls = _counting(HTTPException(status_code=503, detail="Database unavailable"))
+        for _ in range(2):
+            assert await _raises(store.run("c1:credit-evaluate", "key-503", BODY, unavailable)) == 503
+        assert len(unavailable_calls) == 2
+
+        crashed, crashed_calls = _counting(RuntimeError("connection reset"))
+        for _ in range(2):
+            try:
+                await store.run("c1:credit-evaluate", "key-crash", BODY, crashed)
+                assert False
+            except RuntimeError:
+                pass
+        assert len(crashed_calls) == 2 and store.stats()["entries"] == 1
+    asyncio.run(scenario())
+
+def test_entries_expire_and_stay_within_max_bytes():
+    async def scenario():
+        store = IdempotencyStore(ttl_seconds=0.05)
+        fn, calls = _counting({"score": 720})
+        await store.run("c1:credit-evaluate", "key-1", BODY, fn)
+        assert (await store.run("c1:credit-evaluate", "key-1", BODY, fn))[1] is True
+        time.sleep(0.06)
+        assert (await store.run("c1:credit-evaluate", "key-1", BODY, fn))[1] is False
+        assert len(calls) == 2
+
+        result = {"score": 720, "padding": "x" * 100}
+        fn, calls = _counting(result)
+        store = IdempotencyStore(max_bytes=1000)
+        for n in range(20):
+            await store.run("c1:credit-evaluate", f"key-{n}", BODY, fn)
+        assert store.stats()["bytes"] <= 1000 and store.counters["evicted"] == 20 - store.stats()["entries"]
+        # Oldest first: the newest key replays, the first one runs again
+        assert (await store.run("c1:credit-evaluate", "key-19", BODY, fn))[1] is True
+        assert (await store.run("c1:credit-evaluate", "key-0", BODY, fn))[1] is False
+
+        # A response larger than the whole budget is not stored at all
+        huge, calls = _counting({"padding": "x" * 2000})
+        for _ in range(2):
+            await store.run("c1:credit-evaluate", "key-huge", BODY, huge)
+        assert len(calls) == 2 and store.stats()["bytes"] <= 1000
+    asyncio.run(scenario())
+
+def test_cancelled_waiter_does_not_cancel_the_execution():
+    async def scenario():
+        store = IdempotencyStore()
+        release = asyncio.Event()
+
+        async def evaluate():
+            await release.wait()
+            return {"score": 720}
+
+        first = asyncio.create_task(store.run("c1:credit-evaluate", "key-1", BODY, evaluate))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(store.run("c1:credit-evaluate", "key-1", BODY, evaluate))
+        other_waiter = asyncio.create_task(store.run("c1:credit-evaluate", "key-1", BODY, evaluate))
+        await asyncio.sleep(0)
+        # e.g. the client behind the duplicate disconnected
+        waiter.cancel()
+        await asyncio.sleep(0)
+        assert waiter.cancelled()
+        release.set()
+
+        assert await first == ({"score": 720}, False)
+        assert await other_waiter == ({"score": 720}, True)
+        assert store.stats()["in_flight"] == 0
+    asyncio.run(scenario())
+
+if __name__ == "__main__":
+    test_in_flight_duplicates_join_the_first_execution()
+    test_reused_key_with_a_different_body_is_rejected()
+    test_client_errors_are_replayed_and_server_errors_rerun()
+    test_entries_expire_and_stay_within_max_bytes()
+    test_cancelled_waiter_does_not_cancel_the_execution()
+    print("Idempotency store tests passed")
@@ -0,0 +1,78 @@
+import io
+import os
+import sys
+import json
+import tempfile
+
+from sqlalchemy import create_engine, select, func
+
+# Add current dir to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import Base
+from models.database_models import AadhaarProfile, PANProfile, AuditLog
+from services.id_allocator import BlockAllocator, AADHAAR_SPACE, PAN_SPACE, render_aadhaar, render_pan, verhoeff_check_digit
+from services.identity_import import IdentityImporter
+
+def _importer(chunk_size=3):
+    bind = create_engine(f"sqlite:///{tempfile.mkdtemp()}/import.db")
+    Base.metadata.create_all(bind=bind)
+    return IdentityImporter(
+        bind=bind, chunk_size=chunk_size,
+        aadhaar_allocator=BlockAllocator("aadhaar", AADHAAR_SPACE, render_aadhaar, AadhaarProfile.aadhaar_number, bind=bind),
+        pan_allocator=BlockAllocator("pan", PAN_SPACE, render_pan, PANProfile.pan_number, bind=bind),
+    ), bind
+
+def _count(bind, model):
+    with bind.connect() as conn:
+        return conn.execute(select(func.count()).select_from(model)).scalar()
+
+def test_ndjson_import_reports_every_row():
+    importer, bind = _importer()
+    migrated = "23456789012"
+    migrated += verhoeff_check_digit(migrated)
+    lines = [
+        {"name": "Asha Rao", "phone": "9000000001"},
+        {"name": "Ravi Kumar", "phone": "9000000002", "issue_pan": True},
+        {"name": "", "phone": "9000000003"},
+        {"name": "Meena Shah", "phone": "9000000001"}, # same phone as line 1
+        {"name": "Old Registry", "phone": "9000000005", "aadhaar_number": migrated, "pan_number": "ABCPE1234F"},
+        {"name": "Bad Check", "phone": "9000000006", "aadhaar_number": migrated[:-1] + str((int(migrated[-1]) + 1) % 10)},
+    ]
+    body = "\n".join(json.dumps(line) for line in lines) + "\nnot json\n"
+    report = io.StringIO()
+    summary = importer.run(io.BytesIO(body.encode()), "ndjson", report=report)
+
+    assert (summary["rows"], summary["created"], summary["pans_created"], summary["failed"]) == (7, 3, 2, 4)
+    assert [error["line"] for error in summary["errors"]] == [3, 4, 6, 7]
+    assert "already registered" in summary["errors"][1]["error"] # line 4 hit the committed first chunk
+
+    outcomes = [json.loads(line) for line in report.getvalue().splitlines()]
+    assert [outcome["line"] for outcome in outcomes] == list(range(1, 8))
+    assert outcomes[4]["aadhaar_number"] == migrated and outcomes[4]["pan_number"] == "ABCPE1234F"
+    assert outcomes[1]["pan_number"] is not None and outcomes[0]["pan_number"] is None
+
+    assert _count(bind, AadhaarProfile) == 3 and _count(bind, PANProfile) == 2
+    with bind.connect() as conn:
+        actions = sorted(conn.execute(select(AuditLog.action)).scalars())
+    # One summary entry per entity type per batch, not per row
+    assert actions == ["BULK_CREATE_AADHAAR", "BULK_CREATE_AADHAAR", "BULK_CREATE_PAN", "BULK_CREATE_PAN"]
+
+def test_csv_import_in_chunks():
+    importer, bind = _importer(chunk_size=100)
+    rows = ["name,phone,email,issue_pan"] + [f"Person {n},8{n:09d},,{'yes' if n % 2 else ''}" for n in range(250)]
+    summary = importer.run(io.BytesIO(("\n".join(rows) + "\n").encode()), "csv")
+    assert (summary["rows"], summary["created"], summary["pans_created"], summary["batches"]) == (250, 250, 125, 3)
+    with bind.connect() as conn:
+        numbers = list(conn.execute(select(AadhaarProfile.aadhaar_number)).scalars())
+    assert len(set(numbers)) == 250
+
+    # Re-importing the same file creates nothing
+    again = importer.run(io.BytesIO(("\n".join(rows) + "\n").encode()), "csv")
+    assert again["created"] == 0 and again["failed"] == 250
+    assert _count(bind, AadhaarProfile) == 250
+
+if __name__ == "__main__":
+    test_ndjson_import_reports_every_row()
+    test_csv_import_in_chunks()
+    print("Identity import tests passed")
@@ -0,0 +1,122 @@
+import io
+import os
+import sys
+import json
+import sqlite3
+import tempfile
+from datetime import datetime
+
+from sqlalchemy import create_engine, select, func, insert, event
+from sqlalchemy.orm import Session
+
+# Add current dir to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import Base
+from models.database_models import GSTCompany, Invoice, CompanyCreditStats, AuditLog
+from services.credit_stats import _aggregate_companies, record_invoices
+from services.invoice_import import InvoiceImporter
+
+SELLERS = ["27AAAPA0000A1Z0", "27AAAPA0001A1Z1"]
+
+def _importer(chunk_size=3):
+    bind = create_engine(f"sqlite:///{tempfile.mkdtemp()}/invoices.db")
+    Base.metadata.create_all(bind=bind)
+    with bind.begin() as conn:
+        conn.execute(insert(GSTCompany), [
+            {"id": f"c{n}", "gst_number": gst_number, "type": "LTD", "company_name": f"Seller {n}", "state_code": "27"}
+            for n, gst_number in enumerate(SELLERS)
+        ])
+        # c0 already has an invoice but no stats row, as before the stats backfill
+        conn.execute(insert(Invoice), [{
+            "id": "old", "company_id": "c0", "invoice_number": "INV-0", "buyer_gstin": "BUYER", "date": datetime(2024, 12, 1),
+            "total_taxable": 100.0, "total_tax": 18.0, "grand_total": 118.0, "status": "DEFAULTED", "delay_days": 90,
+        }])
+    return InvoiceImporter(bind=bind, chunk_size=chunk_size), bind
+
+def _invoice(number, seller=SELLERS[0], **fields):
+    return {"seller_gstin": seller, "invoice_number": number, "buyer_gstin": "BUYER", "date": "2025-01-15T00:00:00",
+            "total_taxable": 100.0, "total_tax": 18.0, "grand_total": 118.0, **fields}
+
+def _count(bind, model):
+    with bind.connect() as conn:
+        return conn.execute(select(func.count()).select_from(model)).scalar()
+
+def test_ndjson_ingest_dedupes_and_reports_every_row():
+    importer, bind = _importer()
+    lines = [
+        _invoice("INV-1"),
+        _invoice("INV-0"), # recorded before the import
+        _invoice("INV-1", seller=SELLERS[1], status="PAID"), # same number, different seller
+        _invoice("INV-1"), # repeats line 1, from the committed first chunk
+        _invoice("INV-2", seller="29ZZZZZ9999Z1Z9"),
+        _invoice("INV-3", buyer_gstin=SELLERS[0]),
+        {"company_id": "c1", "invoice_number": "INV-2", "buyer_gstin": "BUYER", "date": "2025-01-16T00:00:00",
+         "total_taxable": 10.0, "total_tax": 1.8, "grand_total": 11.8, "delay_days": 12},
+        {"invoice_number": "INV-4", "buyer_gstin": "BUYER", "date": "2025-01-16T00:00:00",
+         "total_taxable": 10.0, "total_tax": 1.8, "grand_total": 11.8},
+    ]
+    body = "\n".join(json.dumps(line) for line in lines) + "\nnot json\n"
+    report = io.StringIO()
+    summary = importer.run(io.BytesIO(body.encode()), "ndjson", report=report)
+
+    assert (summary["rows"], summary["created"], summary["duplicates"], summary["failed"], summary["batches"]) == (9, 3, 2, 4, 3)
+    assert [error["line"] for error in summary["errors"]] == [5, 6, 8, 9]
+    assert summary["errors"][0]["error"] == "Issuing company not found"
+
+    outcomes = [json.loads(line) for line in report.getvalue().splitlines()]
+    assert [outcome["status"] for outcome in outcomes] == ["CREATED", "DUPLICATE", "CREATED", "DUPLICATE", "FAILED", "FAILED", "CREATED", "FAILED", "FAILED"]
+
+    assert _count(bind, Invoice) == 4
+    with bind.connect() as conn:
+        # One summary entry per batch that wrote invoices
+        assert conn.execute(select(AuditLog.action)).scalars().all() == ["BULK_CREATE_INVOICE"] * 2
+    assert importer.sellers.stats()["hits"] > 0
+
+def test_stats_match_the_ledger_after_csv_chunks():
+    importer, bind = _importer(chunk_size=4)
+    header = "seller_gstin,invoice_number,buyer_gstin,date,total_taxable,total_tax,grand_total,status,delay_days\n"
+    rows = "".join(
+        f"{SELLERS[n % 2]},B-{n},BUYER,2025-02-{n % 28 + 1:02d}T00:00:00,100,18,118,{['PAID', 'UNPAID', 'DEFAULTED'][n % 3]},{n % 7}\n"
+        for n in range(25)
+    )
+    summary = importer.run(io.BytesIO((header + rows).encode()), "csv")
+    assert (summary["created"], summary["failed"], summary["batches"]) == (25, 0, 7)
+
+    with Session(bind) as db:
+        expected = _aggregate_companies(db, ["c0", "c1"])
+        for company_id, aggregate in expected.items():
+            stats = db.get(CompanyCreditStats, company_id)
+            assert {name: getattr(stats, name) for name in aggregate} == aggregate
+    # The pre-existing invoice was folded in when c0's stats row was seeded
+    assert expected["c0"]["invoice_count"] == 14 and expected["c0"]["defaulted_count"] >= 1
+
+def test_seeding_many_companies_in_one_batch():
+    # 5000 unseeded companies x 8 columns would not fit one SQLite statement
+    bind = create_engine(f"sqlite:///{tempfile.mkdtemp()}/invoices.db")
+    # Some distributions raise the limit; hold this test to SQLite's default
+    event.listen(bind, "connect", lambda conn, record: conn.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 32766))
+    Base.metadata.create_all(bind=bind)
+    with bind.begin() as conn:
+        conn.execute(insert(GSTCompany), [
+            {"id": f"c{n}", "gst_number": f"27AAAPA{n:04d}A1Z0", "type": "LTD", "company_name": f"Seller {n}", "state_code": "27"}
+            for n in range(5000)
+        ])
+        conn.execute(insert(Invoice), [{
+            "id": f"old-{n}", "company_id": f"c{n}", "invoice_number": "INV-0", "buyer_gstin": "BUYER", "date": datetime(2024, 12, 1),
+            "total_taxable": 100.0, "total_tax": 18.0, "grand_total": 118.0, "status": "PAID", "delay_days": 0,
+        } for n in range(5000)])
+
+    with Session(bind) as db:
+        record_invoices(db, [(f"c{n}", "UNPAID", 3) for n in range(5000)])
+        db.commit()
+    assert _count(bind, CompanyCreditStats) == 5000
+    with Session(bind) as db:
+        stats = db.get(CompanyCreditStats, "c4999")
+        assert (stats.invoice_count, stats.paid_count, stats.unpaid_count, stats.delay_days_sum) == (2, 1, 1, 3)
+
+if __name__ == "__main__":
+    test_ndjson_ingest_dedupes_and_reports_every_row()
+    test_stats_match_the_ledger_after_csv_chunks()
+    test_seeding_many_companies_in_one_batch()
+    print("Invoice import tests passed")
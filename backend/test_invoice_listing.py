@@ -0,0 +1,85 @@
+import os
+import sys
+import json
+import tempfile
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session, sessionmaker
+
+# Add current dir to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import Base
+from models.database_models import GSTCompany, Invoice
+from models.schemas import InvoiceStatus
+import routers.business as business
+
+def _ledger():
+    bind = create_engine(f"sqlite:///{tempfile.mkdtemp()}/invoices.db")
+    Base.metadata.create_all(bind=bind)
+    base = datetime(2025, 1, 1)
+    with bind.begin() as conn:
+        conn.execute(insert(GSTCompany), [
+            {"id": f"c{n}", "gst_number": f"27AAAPA000{n}A1Z{n}", "type": "LTD", "company_name": f"Seller {n}", "state_code": "27"}
+            for n in range(2)
+        ])
+        conn.execute(insert(Invoice), [
+            {
+                "id": f"inv{n:03d}", "company_id": f"c{n % 2}", "invoice_number": f"INV-{n}",
+                "buyer_gstin": f"BUYER{n % 3}", "date": base + timedelta(days=n // 4), # four invoices share each date
+                "total_taxable": 100.0, "total_tax": 18.0, "grand_total": 118.0,
+                "status": "PAID" if n % 5 == 0 else "UNPAID", "delay_days": 0,
+            }
+            for n in range(103)
+        ])
+    return bind
+
+def _pages(bind, limit, **filters):
+    seen, after = [], None
+    while True:
+        with Session(bind) as db:
+            items, after = business._invoice_listing(db, **filters).page(after, limit)
+        seen.extend(item["id"] for item in items)
+        if after is None:
+            return seen
+
+def test_keyset_pages_cover_every_invoice_once():
+    bind = _ledger()
+    with Session(bind) as db:
+        expected = [row.id for row in db.query(Invoice.id).order_by(Invoice.date.desc(), Invoice.id.desc())]
+    for limit in (1, 7, 50, 500):
+        assert _pages(bind, limit) == expected
+
+def test_filters():
+    bind = _ledger()
+    with Session(bind) as db:
+        def ids(**filters):
+            return {row.id for row in db.query(Invoice.id).filter_by(**filters)}
+        assert set(_pages(bind, 10, company_id="c1")) == ids(company_id="c1")
+        assert set(_pages(bind, 10, gst_number="27AAAPA0000A1Z0")) == ids(company_id="c0")
+        assert set(_pages(bind, 10, buyer_gstin="BUYER2", status=InvoiceStatus.PAID)) == ids(buyer_gstin="BUYER2", status="PAID")
+    in_range = _pages(bind, 3, start=datetime(2025, 1, 3), end=datetime(2025, 1, 5))
+    assert sorted(in_range) == [f"inv{n:03d}" for n in range(8, 16)]
+
+def test_stream_resumes_from_a_page_cursor():
+    bind = _ledger()
+    session_local, page_size = business.SessionLocal, business.INVOICE_STREAM_PAGE_SIZE
+    business.SessionLocal = sessionmaker(bind=bind)
+    business.INVOICE_STREAM_PAGE_SIZE = 20
+    try:
+        lines = [json.loads(line) for chunk in business._stream_invoices({}, None) for line in chunk.splitlines()]
+        assert [line["id"] for line in lines] == _pages(bind, 50)
+
+        with Session(bind) as db:
+            first_page, cursor = business._invoice_listing(db).page(None, 30)
+        resumed = [json.loads(line)["id"] for chunk in business._stream_invoices({}, cursor) for line in chunk.splitlines()]
+        assert [item["id"] for item in first_page] + resumed == _pages(bind, 50)
+    finally:
+        business.SessionLocal, business.INVOICE_STREAM_PAGE_SIZE = session_local, page_size
+
+if __name__ == "__main__":
+    test_keyset_pages_cover_every_invoice_once()
+    test_filters()
+    test_stream_resumes_from_a_page_cursor()
+    print("Invoice listing tests passed")
@@ -0,0 +1,75 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import tempfile
+import subprocess
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+
+# Add current dir to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import Base
+from models.database_models import AuditLog
+from services.log_sink import LogSink
+
+def _sink(**kwargs):
+    directory = tempfile.mkdtemp()
+    bind = create_engine(f"sqlite:///{directory}/logs.db")
+    Base.metadata.create_all(bind=bind)
+    return LogSink(spill_path=f"{directory}/spill.ndjson", bind=bind, **kwargs), bind, directory
+
+def _audit_ids(bind):
+    with bind.connect() as conn:
+        return sorted(conn.execute(select(AuditLog.id)).scalars())
+
+def _spilled(path, entry_id):
+    entry = {"kind": "audit", "fields": {"id": entry_id, "timestamp": "2026-01-01T00:00:00+00:00",
+                                         "actor": "ADMIN", "action": "TEST", "entity": "Test", "entity_id": entry_id}}
+    with open(path, "w") as f:
+        f.write(json.dumps(entry) + "\n")
+
+def test_replay_skips_live_processes():
+    sink, bind, directory = _sink()
+    live = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    try:
+        _spilled(f"{sink.spill_path}.{live.pid}.inflight-1", "live-1")
+        _spilled(f"{sink.spill_path}.{live.pid}", "live-2")
+        _spilled(f"{sink.spill_path}.{dead.pid}.inflight-1", "dead-1")
+        _spilled(f"{sink.spill_path}.{dead.pid}", "dead-2")
+        sink.start()
+        sink.stop()
+        assert _audit_ids(bind) == ["dead-1", "dead-2"]
+        assert sorted(os.listdir(directory)) == ["logs.db", f"spill.ndjson.{live.pid}", f"spill.ndjson.{live.pid}.inflight-1"]
+    finally:
+        live.kill()
+
+def test_async_submit_does_not_wait_for_room():
+    # The flusher never runs within the test, so the one-entry queue stays full
+    sink, bind, directory = _sink(max_queue=1, put_timeout=2, flush_interval=60, batch_size=100)
+    sink.start()
+
+    async def log_three():
+        async_bind = create_async_engine(f"sqlite+aiosqlite:///{directory}/logs.db")
+        async with AsyncSession(async_bind) as db:
+            for n in range(3):
+                await sink.audit_async(db, actor="ADMIN", action="TEST", entity="Test", entity_id=str(n))
+            await db.commit()
+        await async_bind.dispose()
+
+    started = time.monotonic()
+    asyncio.run(log_three())
+    assert time.monotonic() - started < 1
+    assert (sink.counters["buffered"], sink.counters["sync_fallback"]) == (1, 2)
+    sink.stop()
+    assert len(_audit_ids(bind)) == 3
+
+if __name__ == "__main__":
+    test_replay_skips_live_processes()
+    test_async_submit_does_not_wait_for_room()
+    print("Log sink tests passed")
@@ -0,0 +1,146 @@
+import os
+import sys
+import time
+import tempfile
+import threading
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from sqlalchemy import create_engine, select
+
+# Add current dir to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import Base
+from models.database_models import OTPDelivery
+from services.otp_service import AutomateXProvider
+from services.otp_delivery import OTPDispatcher
+
+class StubProvider:
+    """Local SMS/WhatsApp API; responds with the queued status codes (then 200), or stalls for `delay`"""
+
+    def __init__(self, statuses=(), delay=0):
+        self.statuses = list(statuses)
+        self.delay = delay
+        self.requests = []
+        provider = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                provider.requests.append(parse_qs(body.decode()))
+                time.sleep(provider.delay)
+                status = provider.statuses.pop(0) if provider.statuses else 200
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/send"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class _Named(AutomateXProvider):
+    def __init__(self, name, api_url):
+        super().__init__(api_url=api_url)
+        self.name = name
+
+def _dispatcher(providers, **kwargs):
+    bind = create_engine(f"sqlite:///{tempfile.mkdtemp()}/otp_delivery.db")
+    Base.metadata.create_all(bind=bind)
+    options = {"workers": 2, "backoff_base": 0.01, "backoff_max": 0.05, "timeout": 2, "record_interval": 0.05, "bind": bind}
+    options.update(kwargs)
+    return OTPDispatcher(providers, **options), bind
+
+def _outcomes(bind):
+    with bind.connect() as conn:
+        return conn.execute(select(OTPDelivery).order_by(OTPDelivery.identity_value)).fetchall()
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def test_fails_over_to_the_next_provider():
+    primary, secondary = StubProvider(statuses=[500] * 3), StubProvider()
+    dispatcher, bind = _dispatcher([_Named("PRIMARY", primary.url), _Named("SECONDARY", secondary.url)])
+    dispatcher.start()
+    try:
+        for n in range(3):
+            assert dispatcher.submit(f"98765000{n:02d}", "123456", ttl=60)
+        assert _wait_for(lambda: len(_outcomes(bind)) == 3)
+        rows = _outcomes(bind)
+        assert {(row.status, row.provider, row.attempts) for row in rows} == {("SENT", "SECONDARY", 2)}
+        assert all(request["templateVariable-calling-1"] == ["123456"] for request in secondary.requests)
+        assert dispatcher.counters["failovers"] == 3
+    finally:
+        dispatcher.stop()
+        primary.close()
+        secondary.close()
+
+def test_retries_with_backoff_then_gives_up():
+    flaky = StubProvider(statuses=[503, 503])
+    dispatcher, bind = _dispatcher([_Named("ONLY", flaky.url)], max_attempts=3)
+    dispatcher.start()
+    try:
+        dispatcher.submit("9876500100", "111111", ttl=60)
+        assert _wait_for(lambda: len(_outcomes(bind)) == 1)
+        assert [(row.status, row.attempts) for row in _outcomes(bind)] == [("SENT", 3)]
+
+        flaky.statuses = [500] * 3
+        dispatcher.submit("9876500101", "222222", ttl=60)
+        assert _wait_for(lambda: len(_outcomes(bind)) == 2)
+        failed = _outcomes(bind)[1]
+        assert (failed.status, failed.attempts) == ("FAILED", 3)
+        assert "HTTP 500" in failed.last_error
+    finally:
+        dispatcher.stop()
+        flaky.close()
+
+def test_slow_provider_times_out_and_code_expires():
+    slow = StubProvider(delay=0.5)
+    dispatcher, bind = _dispatcher([_Named("SLOW", slow.url)], timeout=0.1)
+    dispatcher.start()
+    try:
+        # The first call times out; by the retry the code is no longer worth sending
+        dispatcher.submit("9876500200", "333333", ttl=0.05)
+        assert _wait_for(lambda: len(_outcomes(bind)) == 1)
+        row = _outcomes(bind)[0]
+        assert (row.status, row.attempts) == ("EXPIRED", 1)
+        assert "Timeout" in row.last_error
+    finally:
+        dispatcher.stop()
+        slow.close()
+
+def test_full_queue_rejects_and_inline_send_when_stopped():
+    stub = StubProvider(delay=0.2)
+    dispatcher, bind = _dispatcher([_Named("STUB", stub.url)], workers=1, max_queue=2)
+    dispatcher.start()
+    try:
+        accepted = [dispatcher.submit(f"98765003{n:02d}", "444444", ttl=60) for n in range(5)]
+        # One in flight, two queued
+        assert accepted.count(False) >= 2
+        assert dispatcher.counters["rejected"] == accepted.count(False)
+    finally:
+        dispatcher.stop()
+    sent = len(_outcomes(bind))
+    stub.delay = 0
+    assert dispatcher.submit("9876500399", "555555", ttl=60)
+    assert len(_outcomes(bind)) == sent + 1
+    stub.close()
+
+if __name__ == "__main__":
+    test_fails_over_to_the_next_provider()
+    test_retries_with_backoff_then_gives_up()
+    test_slow_provider_times_out_and_code_expires()
+    test_full_queue_rejects_and_inline_send_when_stopped()
+    print("OTP delivery tests passed")
@@ -0,0 +1,122 @@
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert, select, func
+from sqlalchemy.orm import Session
+
+# Add current dir to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import Base
+from models.database_models import OTPLog, OTPHistory
+from services.credit_cache import LocalKeyValueStore
+from services.otp_store import OTPStore, DatabaseOTPBackend, InMemoryOTPBackend, SharedStoreOTPBackend
+
+def _bind():
+    bind = create_engine(f"sqlite:///{tempfile.mkdtemp()}/otp.db")
+    Base.metadata.create_all(bind=bind)
+    return bind
+
+def _stores():
+    bind = _bind()
+    return bind, [
+        OTPStore(DatabaseOTPBackend(bind=bind), bind=bind),
+        OTPStore(InMemoryOTPBackend(), bind=bind),
+        OTPStore(SharedStoreOTPBackend(LocalKeyValueStore()), bind=bind),
+    ]
+
+def _events(bind, identity_value):
+    with bind.connect() as conn:
+        return [event for (event,) in conn.execute(
+            select(OTPHistory.event).where(OTPHistory.identity_value == identity_value).order_by(OTPHistory.created_at)
+        )]
+
+def test_code_lifecycle():
+    bind, stores = _stores()
+    for n, store in enumerate(stores):
+        phone = f"98765000{n:02d}"
+        with Session(bind) as db:
+            assert store.verify(db, "PHONE", phone, "123456") is None
+            store.issue(db, "PHONE", phone, "123456")
+            assert not store.is_verified("PHONE", phone)
+            assert store.verify(db, "PHONE", phone, "000000") is False
+            assert store.verify(db, "PHONE", phone, "123456") is True
+            # A verified code cannot be verified again, only consumed, and only once
+            assert store.verify(db, "PHONE", phone, "123456") is None
+            assert store.is_verified("PHONE", phone)
+            assert store.consume(db, "PHONE", phone)
+            assert not store.consume(db, "PHONE", phone)
+            db.commit()
+        assert not store.is_verified("PHONE", phone)
+        assert sorted(_events(bind, phone)) == ["CONSUMED", "FAILED", "ISSUED", "VERIFIED"], store.backend.name
+
+def test_rolled_back_consume_releases_the_code():
+    bind, stores = _stores()
+    for n, store in enumerate(stores):
+        phone = f"98765200{n:02d}"
+        with Session(bind) as db:
+            store.issue(db, "PHONE", phone, "123456")
+            store.verify(db, "PHONE", phone, "123456")
+            db.commit()
+            # As when the profile insert after the consume fails
+            assert store.consume(db, "PHONE", phone)
+            db.rollback()
+        assert store.is_verified("PHONE", phone), store.backend.name
+        with Session(bind) as db:
+            assert store.consume(db, "PHONE", phone)
+            # Closed without committing
+        assert store.is_verified("PHONE", phone), store.backend.name
+        with Session(bind) as db:
+            assert store.consume(db, "PHONE", phone)
+            db.commit()
+            db.rollback()
+        assert not store.is_verified("PHONE", phone), store.backend.name
+
+def test_expired_codes_are_rejected():
+    bind, stores = _stores()
+    for n, store in enumerate(stores):
+        phone = f"98765100{n:02d}"
+        store.ttl = -1
+        with Session(bind) as db:
+            store.issue(db, "PHONE", phone, "123456")
+            assert store.verify(db, "PHONE", phone, "123456") is None
+
+def test_sweeper_purges_in_batches():
+    bind = _bind()
+    store = OTPStore(DatabaseOTPBackend(bind=bind), sweep_batch_size=7, bind=bind)
+    now = datetime.utcnow()
+    with bind.begin() as conn:
+        conn.execute(insert(OTPLog), [
+            {"identity_type": "PHONE", "identity_value": f"9{i:09d}", "otp": "111111",
+             "expiry_time": now + timedelta(minutes=-10 if i < 50 else 10)}
+            for i in range(60)
+        ])
+    assert store.sweep() == 50
+    with bind.connect() as conn:
+        assert conn.execute(select(func.count()).select_from(OTPLog)).scalar() == 10
+
+def test_backfill_keeps_old_verifications():
+    bind = _bind()
+    store = OTPStore(DatabaseOTPBackend(bind=bind), bind=bind)
+    with bind.begin() as conn:
+        conn.execute(insert(OTPLog), [
+            {"id": "old-1", "identity_type": "AADHAAR", "identity_value": "234567890123", "otp": "1",
+             "expiry_time": datetime.utcnow() - timedelta(days=30), "verified": True},
+            {"id": "old-2", "identity_type": "AADHAAR", "identity_value": "334567890123", "otp": "2",
+             "expiry_time": datetime.utcnow() - timedelta(days=30), "verified": False},
+        ])
+    store.backfill_history()
+    store.backfill_history()
+    store.sweep()
+    assert _events(bind, "234567890123") == ["VERIFIED"]
+    assert _events(bind, "334567890123") == []
+
+if __name__ == "__main__":
+    test_code_lifecycle()
+    test_rolled_back_consume_releases_the_code()
+    test_expired_codes_are_rejected()
+    test_sweeper_purges_in_batches()
+    test_backfill_keeps_old_verifications()
+    print("OTP store tests passed")
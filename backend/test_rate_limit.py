@@ -0,0 +1,120 @@
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+from datetime import datetime, timezone
+
+from sqlalchemy import create_engine, insert, select
+
+# Add current dir to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import Base
+from models.database_models import ExternalConsumer, ExternalConsumerUsage
+import services.rate_limit as rate_limit
+from services.rate_limit import InMemoryTokenBucketLimiter, ConsumerRateLimiter, RATE_LIMIT_DEFAULT_BURST
+from services.usage_meter import UsageMeter
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+def _with_clock(test):
+    clock = Clock()
+    original = rate_limit.time
+    rate_limit.time = clock
+    try:
+        test(clock)
+    finally:
+        rate_limit.time = original
+
+def test_bucket_allows_a_burst_then_refills():
+    def test(clock):
+        limiter = InMemoryTokenBucketLimiter()
+        decisions = [limiter.acquire("c1", rate=2, burst=5) for _ in range(6)]
+        assert [d.allowed for d in decisions] == [True] * 5 + [False]
+        assert [d.remaining for d in decisions[:5]] == [4, 3, 2, 1, 0]
+
+        rejected = decisions[-1]
+        # One token takes half a second at 2/s; the empty bucket refills in 2.5s
+        assert rejected.headers() == {"RateLimit-Limit": "5", "RateLimit-Remaining": "0", "RateLimit-Reset": "3", "Retry-After": "1"}
+        assert "Retry-After" not in decisions[0].headers()
+
+        clock.now += 0.5
+        assert limiter.acquire("c1", rate=2, burst=5).allowed
+        assert not limiter.acquire("c1", rate=2, burst=5).allowed
+        # Idle time refills up to the burst, not beyond it
+        clock.now += 60
+        assert limiter.acquire("c1", rate=2, burst=5).remaining == 4
+        # Buckets are per key
+        assert limiter.acquire("c2", rate=2, burst=5).remaining == 4
+    _with_clock(test)
+
+def test_consumer_overrides_replace_the_defaults():
+    def test(clock):
+        limiter = ConsumerRateLimiter(InMemoryTokenBucketLimiter())
+        default = SimpleNamespace(id="c1", rate_limit_per_second=None, rate_limit_burst=None)
+        custom = SimpleNamespace(id="c2", rate_limit_per_second=1.0, rate_limit_burst=3)
+
+        decisions = [limiter.check(default) for _ in range(RATE_LIMIT_DEFAULT_BURST + 1)]
+        assert decisions[0].limit == RATE_LIMIT_DEFAULT_BURST and not decisions[-1].allowed
+        decisions = [limiter.check(custom) for _ in range(4)]
+        assert decisions[0].limit == 3 and [d.allowed for d in decisions] == [True, True, True, False]
+        assert decisions[-1].retry_after_seconds == 1
+        assert limiter.rejected == 2
+
+        assert ConsumerRateLimiter(None).check(default) is None
+    _with_clock(test)
+
+def _usage(bind):
+    with bind.connect() as conn:
+        return [tuple(row) for row in conn.execute(select(
+            ExternalConsumerUsage.endpoint, ExternalConsumerUsage.request_count, ExternalConsumerUsage.rejected_count
+        ).order_by(ExternalConsumerUsage.endpoint))]
+
+def test_flush_adds_to_the_hour_row():
+    bind = create_engine(f"sqlite:///{tempfile.mkdtemp()}/usage.db")
+    Base.metadata.create_all(bind=bind)
+    window_start = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    with bind.begin() as conn:
+        conn.execute(insert(ExternalConsumer), [{"id": "c1", "api_key": "api_1", "webhook_secret": "sec", "name": "Lender"}])
+        # Flushed earlier this hour, e.g. by another worker
+        conn.execute(insert(ExternalConsumerUsage), [
+            {"consumer_id": "c1", "endpoint": "credit-evaluate", "window_start": window_start, "request_count": 5, "rejected_count": 1}
+        ])
+
+    meter = UsageMeter(bind=bind)
+    for rejected in (False, False, True):
+        meter.record("c1", "credit-evaluate", rejected=rejected)
+    meter.record("c1", "jobs")
+    meter.flush()
+    assert _usage(bind) == [("credit-evaluate", 8, 2), ("jobs", 1, 0)]
+    assert meter.pending() == 0
+
+def test_failed_flush_keeps_the_counts():
+    bind = create_engine(f"sqlite:///{tempfile.mkdtemp()}/usage.db")
+    meter = UsageMeter(bind=bind)
+    meter.record("c1", "credit-evaluate")
+    meter.record("c1", "credit-evaluate", rejected=True)
+    try:
+        meter.flush() # no tables yet
+        assert False
+    except Exception:
+        pass
+    assert meter.pending() == 2
+
+    # Requests recorded meanwhile are merged with the re-queued counts
+    meter.record("c1", "credit-evaluate")
+    Base.metadata.create_all(bind=bind)
+    meter.flush()
+    assert _usage(bind) == [("credit-evaluate", 3, 1)]
+
+if __name__ == "__main__":
+    test_bucket_allows_a_burst_then_refills()
+    test_consumer_overrides_replace_the_defaults()
+    test_flush_adds_to_the_hour_row()
+    test_failed_flush_keeps_the_counts()
+    print("Rate limit and usage meter tests passed")
@@ -0,0 +1,113 @@
+import os
+import sys
+import json
+import struct
+import tempfile
+
+from sqlalchemy import create_engine, insert, event
+from sqlalchemy.orm import Session
+
+# Add current dir to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import Base
+from models.database_models import AadhaarProfile
+from models.schemas import AadhaarResponse
+from services.serialization import projection
+from services.search_index import RegistrySearch, paged_response, decode_cursor
+from migrate_db import run_migrations
+
+def _search(candidate_limit):
+    bind = create_engine(f"sqlite:///{tempfile.mkdtemp()}/search.db")
+    Base.metadata.create_all(bind=bind)
+    with bind.begin() as conn:
+        conn.execute(insert(AadhaarProfile), [
+            {"id": f"a{n:02d}", "name": f"Ravi Kumar {n}", "aadhaar_number": f"{200000000000 + n}", "phone": f"{9000000000 + n}"}
+            for n in range(50)
+        ])
+    search = RegistrySearch(bind=bind, candidate_limit=candidate_limit)
+    search.detect()
+    assert search.backend == "scan"
+    # Built after the rows exist, so this also covers the backfill
+    run_migrations(bind)
+    search.detect()
+    return search, bind
+
+def _trigram_similarity(a, b):
+    # Stand-in for pg_trgm's similarity() on SQLite, returned as a float4 like the real one
+    def trigrams(value):
+        return {f"  {word} "[i:i + 3] for word in value.lower().split() for i in range(len(word) + 1)}
+    x, y = trigrams(a), trigrams(b)
+    return struct.unpack("f", struct.pack("f", len(x & y) / len(x | y)))[0]
+
+def _tied_profiles(bind):
+    # Every "Ravi Kumar NN" is equally similar to "kumar": one tie spanning every page
+    AadhaarProfile.__table__.create(bind=bind, checkfirst=True)
+    with bind.begin() as conn:
+        conn.execute(insert(AadhaarProfile), [
+            {"id": f"t{n:02d}", "name": f"Ravi Kumar {n}", "aadhaar_number": f"{300000000000 + n}", "phone": f"{8000000000 + n}"}
+            for n in range(10, 40)
+        ])
+
+def _page_all(search, bind, limit):
+    seen, pages, after = [], [], None
+    while True:
+        with Session(bind) as db:
+            response = paged_response(search.aadhaar(db, "kumar", projection(AadhaarProfile, AadhaarResponse)), after, limit)
+        pages.append(response.headers)
+        seen.extend(item["id"] for item in json.loads(response.body))
+        after = response.headers.get("X-Next-Cursor")
+        if after is None:
+            return seen, pages
+
+def test_capped_name_search_flags_its_last_page():
+    search, bind = _search(candidate_limit=10)
+    assert search.backend == "fts5"
+    seen, pages = _page_all(search, bind, limit=4)
+    assert len(seen) == len(set(seen)) == 10 and len(pages) == 3
+    assert [headers.get("X-Results-Truncated") for headers in pages] == [None, None, "true"]
+
+def test_uncapped_search_is_complete():
+    search, bind = _search(candidate_limit=100)
+    seen, pages = _page_all(search, bind, limit=20)
+    assert len(set(seen)) == 50 and len(pages) == 3 and "X-Results-Truncated" not in pages[-1]
+
+def _check_pages_split_a_tie(search, bind):
+    seen, pages = _page_all(search, bind, limit=4)
+    assert sorted(seen) == [f"t{n:02d}" for n in range(10, 40)]
+    # Whole numbers, so the next page compares against exactly the value the row was ranked by
+    assert all(isinstance(value, int) for headers in pages[:-1] for value in decode_cursor(headers["X-Next-Cursor"])[:3])
+
+def test_trigram_ranked_pages_split_a_tie():
+    bind = create_engine(f"sqlite:///{tempfile.mkdtemp()}/search.db")
+    event.listen(bind, "connect", lambda conn, record: conn.create_function("similarity", 2, _trigram_similarity, deterministic=True))
+    _tied_profiles(bind)
+    search = RegistrySearch(bind=bind, candidate_limit=100)
+    search.backend = "pg_trgm" # the ranking Postgres uses, on the stand-in similarity()
+    _check_pages_split_a_tie(search, bind)
+
+def test_postgres_pages_split_a_tie():
+    # Runs against a scratch Postgres database when one is given, e.g. postgresql://localhost/search_test
+    url = os.getenv("TEST_POSTGRES_URL")
+    if not url:
+        print("TEST_POSTGRES_URL not set, skipping the Postgres search test")
+        return
+    bind = create_engine(url)
+    with bind.begin() as conn:
+        conn.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    _tied_profiles(bind)
+    try:
+        search = RegistrySearch(bind=bind, candidate_limit=100)
+        search.detect()
+        assert search.backend == "pg_trgm"
+        _check_pages_split_a_tie(search, bind)
+    finally:
+        AadhaarProfile.__table__.drop(bind=bind)
+        bind.dispose()
+
+if __name__ == "__main__":
+    test_capped_name_search_flags_its_last_page()
+    test_uncapped_search_is_complete()
+    test_trigram_ranked_pages_split_a_tie()
+    test_postgres_pages_split_a_tie()
+    print("Registry search tests passed")
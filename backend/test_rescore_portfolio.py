@@ -0,0 +1,85 @@
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+import numpy as np
+
+from sqlalchemy import create_engine, insert, select, func
+from sqlalchemy.orm import sessionmaker
+
+# Add current dir to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import Base
+from models.database_models import AadhaarProfile, GSTCompany, CompanyOwner, CreditScoreSnapshot
+import rescore_portfolio as rescore
+
+def _registry(companies):
+    directory = tempfile.mkdtemp()
+    bind = create_engine(f"sqlite:///{directory}/rescore.db")
+    Base.metadata.create_all(bind=bind)
+    with bind.begin() as conn:
+        conn.execute(insert(AadhaarProfile), [
+            {"id": f"a{n}", "name": f"Owner {n}", "aadhaar_number": f"{200000000000 + n}", "phone": f"{9000000000 + n}", "kyc_status": "VERIFIED"}
+            for n in range(companies)
+        ])
+        conn.execute(insert(GSTCompany), [
+            {"id": f"c{n:03d}", "gst_number": f"27AAAPA{n:04d}A1Z0", "type": "PARTNERSHIP", "company_name": f"Firm {n}", "state_code": "27"}
+            for n in range(companies)
+        ])
+        # Two owners per company, so chunk boundaries fall inside a company
+        conn.execute(insert(CompanyOwner), [
+            {"id": f"o{n}-{k}", "company_id": f"c{n:03d}", "aadhaar_id": f"a{(n + k) % companies}"}
+            for n in range(companies) for k in range(2)
+        ])
+    return bind, os.path.join(directory, "checkpoint.json")
+
+def _rescore(bind, checkpoint, **kwargs):
+    engine, session_local = rescore.engine, rescore.SessionLocal
+    rescore.engine, rescore.SessionLocal = bind, sessionmaker(bind=bind)
+    try:
+        rescore.rescore_portfolio(checkpoint_path=checkpoint, restart=True, **kwargs)
+    finally:
+        rescore.engine, rescore.SessionLocal = engine, session_local
+
+def _snapshot_count(bind):
+    with bind.connect() as conn:
+        return conn.execute(select(func.count()).select_from(CreditScoreSnapshot)).scalar()
+
+def test_sqlite_rescore_spans_many_chunks():
+    bind, checkpoint = _registry(50)
+    # 100 rows over chunks of 7 with 2 workers: far more than chunk_size * (2 * workers + 1)
+    _rescore(bind, checkpoint, chunk_size=7, workers=2)
+
+    assert _snapshot_count(bind) == 100
+    with bind.connect() as conn:
+        assert conn.execute(select(func.count(func.distinct(CreditScoreSnapshot.run_id)))).scalar() == 1
+    assert not os.path.exists(checkpoint)
+
+def test_duplicate_and_missing_owners_write_one_snapshot_per_pair():
+    bind, checkpoint = _registry(10)
+    with bind.begin() as conn:
+        conn.execute(insert(CompanyOwner), [
+            {"id": "dup", "company_id": "c003", "aadhaar_id": "a3"}, # already an owner of c003
+            {"id": "none", "company_id": "c004", "aadhaar_id": None},
+        ])
+    for _ in range(2):
+        _rescore(bind, checkpoint, chunk_size=4, workers=1)
+        assert _snapshot_count(bind) == 20
+
+def test_upsert_sends_each_pair_once():
+    # Postgres rejects a multi-row ON CONFLICT DO UPDATE that touches a row twice
+    sent = []
+    db = SimpleNamespace(dialect=SimpleNamespace(name="postgresql"), execute=lambda stmt, records: sent.extend(records), commit=lambda: None)
+    rows = [("c1", None, False, "a1", None, None, "p1"), ("c1", None, False, "a1", None, None, "p2"), ("c1", None, False, None, None, None, None)]
+    scores = {name: np.array([700, 710, 720]) for name in ("owner_score", "company_score", "transaction_score", "credit_score")}
+    scores.update(risk_category=np.array(["LOW"] * 3), recommendation=np.array(["APPROVE"] * 3))
+    rescore.upsert_snapshots(db, rows, scores, "run")
+    assert [(record["company_id"], record["aadhaar_id"], record["pan_id"]) for record in sent] == [("c1", "a1", "p2")]
+
+if __name__ == "__main__":
+    test_sqlite_rescore_spans_many_chunks()
+    test_duplicate_and_missing_owners_write_one_snapshot_per_pair()
+    test_upsert_sends_each_pair_once()
+    print("Rescore portfolio tests passed")
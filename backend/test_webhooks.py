@@ -0,0 +1,169 @@
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from sqlalchemy import create_engine
+
+# Add current dir to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import Base
+from models.database_models import WebhookDeadLetter
+from services.consumer_cache import ConsumerCredentials
+from services.hmac_signing import signature_matches
+from services.webhooks import WebhookDispatcher
+
+SECRET = "sec_test"
+
+class StubReceiver:
+    """Local webhook receiver; responds with the queued status codes (then 200) and records every request"""
+
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.requests = []
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # keep-alive, like a real receiver
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                receiver.requests.append((dict(self.headers), body))
+                status = receiver.statuses.pop(0) if receiver.statuses else 200
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/hooks"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def events(self):
+        return [event for _, body in self.requests for event in json.loads(body)["events"]]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def _dispatcher(**kwargs):
+    bind = create_engine(f"sqlite:///{tempfile.mkdtemp()}/webhooks.db")
+    Base.metadata.create_all(bind=bind)
+    options = {"batch_window": 0.05, "backoff_base": 0.01, "backoff_max": 0.05, "timeout": 2, "bind": bind}
+    options.update(kwargs)
+    dispatcher = WebhookDispatcher(**options)
+    dispatcher.start()
+    return dispatcher, bind
+
+def _consumer(url, events=None):
+    return ConsumerCredentials("c1", "Test Lender", "api_x", SECRET, None, None, url, events)
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def _dead_letters(bind):
+    with bind.connect() as conn:
+        return conn.execute(WebhookDeadLetter.__table__.select()).fetchall()
+
+def test_events_are_batched_and_signed():
+    receiver = StubReceiver()
+    dispatcher, _ = _dispatcher(batch_size=50)
+    consumer = _consumer(receiver.url)
+    try:
+        for i in range(120):
+            dispatcher.publish("invoice.status_changed", {"n": i}, consumers=[consumer])
+        assert _wait_for(lambda: len(receiver.events()) == 120)
+        assert [event["data"]["n"] for event in receiver.events()] == list(range(120))
+        assert len(receiver.requests) < 120
+        for headers, body in receiver.requests:
+            assert signature_matches(SECRET, headers["X-TIMESTAMP"], body, headers["X-SIGNATURE"])
+    finally:
+        dispatcher.stop()
+        receiver.close()
+
+def test_unsubscribed_events_are_not_sent():
+    receiver = StubReceiver()
+    dispatcher, _ = _dispatcher()
+    try:
+        dispatcher.publish("company.suspended", {}, consumers=[_consumer(receiver.url, events="evaluation.completed")])
+        dispatcher.publish("evaluation.completed", {}, consumers=[_consumer(receiver.url, events="evaluation.completed")])
+        assert _wait_for(lambda: len(receiver.events()) == 1)
+        assert receiver.events()[0]["type"] == "evaluation.completed"
+    finally:
+        dispatcher.stop()
+        receiver.close()
+
+def test_server_errors_are_retried_with_backoff():
+    receiver = StubReceiver(statuses=[500, 503])
+    dispatcher, bind = _dispatcher()
+    try:
+        dispatcher.publish("evaluation.completed", {"n": 1}, consumers=[_consumer(receiver.url)])
+        assert _wait_for(lambda: dispatcher.stats()["delivered"] == 1)
+        assert len(receiver.requests) == 3
+        assert len({event["id"] for event in receiver.events()}) == 1
+        assert _dead_letters(bind) == []
+    finally:
+        dispatcher.stop()
+        receiver.close()
+
+def test_events_stay_in_order_while_a_batch_is_retried():
+    receiver = StubReceiver(statuses=[500])
+    dispatcher, _ = _dispatcher(backoff_base=0.3, backoff_max=0.3)
+    consumer = _consumer(receiver.url)
+    try:
+        dispatcher.publish("evaluation.completed", {"n": 1}, consumers=[consumer])
+        assert _wait_for(lambda: len(receiver.requests) == 1)
+        # Published while the first batch waits in backoff
+        dispatcher.publish("evaluation.completed", {"n": 2}, consumers=[consumer])
+        assert _wait_for(lambda: dispatcher.stats()["delivered"] == 2)
+        assert [event["data"]["n"] for event in receiver.events()] == [1, 1, 2]
+    finally:
+        dispatcher.stop()
+        receiver.close()
+
+def test_exhausted_and_rejected_batches_are_dead_lettered():
+    receiver = StubReceiver(statuses=[500, 500, 400])
+    dispatcher, bind = _dispatcher(max_attempts=2)
+    try:
+        consumer = _consumer(receiver.url)
+        dispatcher.publish("evaluation.completed", {"n": 1}, consumers=[consumer])
+        assert _wait_for(lambda: dispatcher.stats()["dead_lettered"] == 1)
+        dispatcher.publish("evaluation.completed", {"n": 2}, consumers=[consumer]) # 400: not retried
+        assert _wait_for(lambda: dispatcher.stats()["dead_lettered"] == 2)
+        assert len(receiver.requests) == 3
+        rows = _dead_letters(bind)
+        assert sorted(row.attempts for row in rows) == [1, 2]
+        assert all(json.loads(row.payload)["events"] for row in rows)
+    finally:
+        dispatcher.stop()
+        receiver.close()
+
+def test_unreachable_receiver_is_dead_lettered():
+    receiver = StubReceiver()
+    url = receiver.url
+    receiver.close()
+    dispatcher, bind = _dispatcher(max_attempts=2)
+    try:
+        dispatcher.publish("evaluation.completed", {"n": 1}, consumers=[_consumer(url)])
+        assert _wait_for(lambda: dispatcher.stats()["dead_lettered"] == 1)
+        assert "ConnectionError" in _dead_letters(bind)[0].last_error
+    finally:
+        dispatcher.stop()
+
+if __name__ == "__main__":
+    test_events_are_batched_and_signed()
+    test_unsubscribed_events_are_not_sent()
+    test_server_errors_are_retried_with_backoff()
+    test_events_stay_in_order_while_a_batch_is_retried()
+    test_exhausted_and_rejected_batches_are_dead_lettered()
+    test_unreachable_receiver_is_dead_lettered()
+    print("Webhook dispatcher tests passed")
@@ -40,6 +40,7 @@ export default function InvoicesRegistry() {
     ]);
 
     const [allInvoices, setAllInvoices] = useState<any[]>([]);
+    const [nextCursor, setNextCursor] = useState<string | null>(null);
     const [loading, setLoading] = useState(true);
 
     const getHeaders = () => {
@@ -91,10 +92,13 @@ export default function InvoicesRegistry() {
         setBuyerSearchResults([]);
     };
 
-    const fetchInvoices = async () => {
+    // Newest first, one page at a time; the next page's cursor comes back in X-Next-Cursor
+    const fetchInvoices = async (after?: string) => {
         try {
-            const res = await axios.get(`${API_URL}/business/invoices`, getHeaders());
-            setAllInvoices(res.data);
+            const query = after ? `?after=${encodeURIComponent(after)}` : "";
+            const res = await axios.get(`${API_URL}/business/invoices${query}`, getHeaders());
+            setAllInvoices(prev => after ? [...prev, ...res.data] : res.data);
+            setNextCursor(res.headers["x-next-cursor"] || null);
         } catch (err) {
             console.error("Failed to fetch invoices", err);
         } finally {
@@ -460,6 +464,14 @@ export default function InvoicesRegistry() {
                                 </div>
                             ))
                         )}
+                        {!loading && nextCursor && (
+                            <button
+                                onClick={() => fetchInvoices(nextCursor)}
+                                className="w-full py-3 text-[10px] font-black uppercase tracking-[0.2em] text-slate-400 hover:text-slate-900 transition-colors"
+                            >
+                                Load Older Entries
+                            </button>
+                        )}
                     </div>
 
                     <div className="p-8 border-t border-slate-50 bg-slate-50/50">